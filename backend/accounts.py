@@ -0,0 +1,38 @@
+"""Per-account bearer tokens for the account-scoped APIs (search, sync, snapshots).
+
+A token is `<account>.<hmac>`: the server signs a random account id with
+`ACCOUNT_TOKEN_SECRET` when the account is created, so a token can be
+verified without a lookup and nobody can claim an account id they were
+not issued. The client keeps the token next to its encryption keys.
+"""
+import hashlib
+import hmac
+import re
+import secrets
+from typing import Optional
+
+ACCOUNT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _signature(secret: str, account: str) -> str:
+    return hmac.new(secret.encode("utf-8"), account.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def new_account_id() -> str:
+    return secrets.token_hex(16)
+
+
+def issue_token(secret: str, account: str) -> str:
+    if not ACCOUNT_ID_RE.match(account):
+        raise ValueError(f"invalid account id {account!r}")
+    return f"{account}.{_signature(secret, account)}"
+
+
+def verify_token(secret: str, token: str) -> Optional[str]:
+    """The account a token was issued for, or None if it is not genuine."""
+    account, sep, signature = token.rpartition(".")
+    if not sep or not ACCOUNT_ID_RE.match(account):
+        return None
+    if not hmac.compare_digest(signature, _signature(secret, account)):
+        return None
+    return account
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# bump when the annotation prompt or response shape changes so old entries stop matching
+ANNOTATION_CACHE_VERSION = 1
+
+
+def normalize_text(text: str) -> str:
+    # whitespace-only edits do not change the annotation
+    return " ".join(text.split())
+
+
+def annotation_cache_key(
+    text: str,
+    model: str,
+    custom_categories: Optional[List[str]],
+    include_confidence: bool,
+) -> str:
+    raw = json.dumps(
+        [
+            ANNOTATION_CACHE_VERSION,
+            normalize_text(text),
+            model,
+            [c.strip() for c in custom_categories or []],
+            bool(include_confidence),
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        stored_at, value = item
+        if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class AnnotationCache:
+    """Two-tier cache for LLM annotation results.
+
+    Memory tier: bounded in-process LRU. Mongo tier: one document per key
+    with a TTL index on `created_at`. Mongo is best effort: reads are capped
+    by `mongo_timeout` and writes run in the background, so a slow or
+    unreachable database never adds latency to annotate.
+    """
+
+    def __init__(
+        self,
+        collection=None,
+        *,
+        max_entries: int = 2048,
+        ttl_seconds: int = 7 * 24 * 3600,
+        mongo_timeout: float = 0.1,
+    ):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.mongo_timeout = mongo_timeout
+        self.memory = LRUCache(max_entries, ttl_seconds)
+        self._pending: Set[asyncio.Task] = set()
+
+    async def ensure_indexes(self) -> None:
+        if self.collection is None:
+            return
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+
+    async def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value, "memory"
+        if self.collection is None:
+            return None, None
+        try:
+            doc = await asyncio.wait_for(
+                self.collection.find_one({"_id": key}, {"response": 1}), timeout=self.mongo_timeout
+            )
+        except Exception as e:
+            logger.debug("annotation cache read failed: %s", e)
+            return None, None
+        if not doc or not doc.get("response"):
+            return None, None
+        self.memory.set(key, doc["response"])
+        return doc["response"], "mongo"
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, value)
+        if self.collection is None:
+            return
+        task = asyncio.create_task(self._write(key, value))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _write(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {"_id": key, "response": value, "created_at": datetime.utcnow()},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.debug("annotation cache write failed: %s", e)
@@ -0,0 +1,99 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from fallback import split_sentences
+
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+def _hard_split(text: str, max_chars: int) -> List[str]:
+    parts: List[str] = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        parts.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+def split_into_chunks(text: str, max_chars: int) -> List[str]:
+    """Greedily pack paragraphs, then sentences, into chunks <= max_chars.
+
+    Only a single sentence longer than max_chars is cut mid-sentence (at
+    the last space before the limit).
+    """
+    units: List[str] = []
+    for para in _PARAGRAPH_SPLIT_RE.split(text.strip()):
+        para = para.strip()
+        if not para:
+            continue
+        if len(para) <= max_chars:
+            units.append(para)
+            continue
+        for sentence in split_sentences(para):
+            units.extend(_hard_split(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for unit in units:
+        extra = len(unit) + (2 if current else 0)
+        if current and size + extra > max_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+            extra = len(unit)
+        current.append(unit)
+        size += extra
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _vote_weight(length: int, confidence: Optional[float]) -> float:
+    # chunk length carries the vote; low-confidence chunks count for less
+    return length * (1.0 if confidence is None else 0.5 + 0.5 * confidence)
+
+
+def merge_annotations(
+    parts: List[Dict[str, Any]],
+    lengths: List[int],
+    include_confidence: bool = True,
+    max_categories: int = 3,
+    max_tags: int = 8,
+) -> Dict[str, Any]:
+    """Reduce per-chunk annotations into one (summary is handled by the caller)."""
+    categories: Dict[str, float] = {}
+    category_names: Dict[str, str] = {}
+    tags: Dict[str, float] = {}
+    conf_sum = conf_weight = 0.0
+    for part, length in zip(parts, lengths):
+        confidence = part.get("confidence")
+        w = _vote_weight(length, confidence)
+        for c in part.get("categories") or []:
+            key = str(c).strip().lower()
+            if key:
+                categories[key] = categories.get(key, 0.0) + w
+                category_names.setdefault(key, str(c).strip())
+        for t in part.get("tags") or []:
+            key = str(t).strip().lower()
+            if key:
+                tags[key] = tags.get(key, 0.0) + w
+        if confidence is not None:
+            conf_sum += confidence * length
+            conf_weight += length
+    # dicts keep first-seen order, so ties go to earlier chunks
+    cat_order = {k: i for i, k in enumerate(categories)}
+    tag_order = {k: i for i, k in enumerate(tags)}
+    top_categories = sorted(categories, key=lambda k: (-categories[k], cat_order[k]))[:max_categories]
+    top_tags = sorted(tags, key=lambda k: (-tags[k], tag_order[k]))[:max_tags]
+    confidence = None
+    if include_confidence:
+        confidence = conf_sum / conf_weight if conf_weight else 0.0
+    return {
+        "categories": [category_names[k] for k in top_categories],
+        "tags": top_tags,
+        "confidence": confidence,
+    }
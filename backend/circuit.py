@@ -0,0 +1,129 @@
+import asyncio
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, Optional
+
+from upstream import UpstreamRateLimited
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_in: float):
+        super().__init__("AI upstream circuit open")
+        self.retry_in = retry_in
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    # only availability problems trip the breaker; a 4xx or unparsable
+    # content still means the gateway is up
+    if isinstance(exc, (UpstreamRateLimited, asyncio.TimeoutError)):
+        return True
+    # httpx is imported with the first upstream client; before that none of its errors exist
+    httpx = sys.modules.get("httpx")
+    if httpx is None:
+        return False
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> Optional[float]:
+    """Full-jitter exponential backoff; honors Retry-After up to `cap`.
+
+    Returns None when the server asks us to wait longer than `cap`, i.e.
+    retrying inside this request is pointless.
+    """
+    if retry_after is not None:
+        return retry_after if retry_after <= cap else None
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures.
+
+    Open fails fast for `recovery_timeout` seconds (or the upstream's
+    Retry-After, if longer), then half-open lets `half_open_max_calls`
+    probes through: one success closes the circuit, a failure reopens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.clock = clock
+        self.reset()
+
+    def reset(self) -> None:
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_for = 0.0
+        self._probes = 0
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self.clock() - self._opened_at >= self._open_for:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self._open_for - self.clock())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == OPEN:
+            return False
+        now = self.clock()
+        # a probe that never reported back must not wedge the breaker
+        if self._probes >= self.half_open_max_calls and now - self._probe_started < self.recovery_timeout:
+            return False
+        if self._probes >= self.half_open_max_calls:
+            self._probes = 0
+        self._probes += 1
+        self._probe_started = now
+        return True
+
+    def release(self) -> None:
+        """Give back a half-open probe whose call was never sent (e.g. shed while queued)."""
+        if self._probes:
+            self._probes -= 1
+
+    def record_success(self) -> None:
+        self._state = CLOSED
+        self._failures = 0
+        self._probes = 0
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._trip(retry_after)
+
+    def _trip(self, retry_after: Optional[float]) -> None:
+        self._state = OPEN
+        self._opened_at = self.clock()
+        self._open_for = max(self.recovery_timeout, retry_after or 0.0)
+        self._probes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "retry_in": round(self.retry_in(), 3),
+        }
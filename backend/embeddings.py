@@ -0,0 +1,163 @@
+"""Batch text embeddings, byte-compatible with the app's on-device vectors.
+
+`HashEmbedder` reproduces `textToDeterministicVector` from
+frontend/src/search/embeddings.ts bit for bit: a 31-multiplier string
+hash over UTF-16 code units seeds a 32-bit LCG, the 384 draws are mapped
+to [-1, 1], stored as float32 and L2-normalized in double precision.
+Both the hash and the LCG are evaluated for a whole batch at once with
+precomputed power tables instead of per-character loops.
+
+Vectors travel as base64 of little-endian float32, the layout
+`float32ToBlob` writes into the `embeddings` table.
+"""
+import base64
+import importlib.util
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+EMBEDDING_DIM = 384
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+_LCG_A = 1664525
+_LCG_C = 1013904223
+
+
+def _lcg_tables(dim: int):
+    # seed_i = A_i * seed_0 + C_i (mod 2^32) for i = 1..dim
+    a = np.empty(dim, dtype=np.uint64)
+    c = np.empty(dim, dtype=np.uint64)
+    ai, ci = 1, 0
+    for i in range(dim):
+        ai = (ai * _LCG_A) & 0xFFFFFFFF
+        ci = (ci * _LCG_A + _LCG_C) & 0xFFFFFFFF
+        a[i], c[i] = ai, ci
+    return a, c
+
+
+_LCG_MUL, _LCG_ADD = _lcg_tables(EMBEDDING_DIM)
+
+
+class _PowerTable:
+    """31**k mod 2^32, grown on demand."""
+
+    def __init__(self):
+        self.table = np.ones(1, dtype=np.uint64)
+
+    def get(self, n: int) -> np.ndarray:
+        if n > len(self.table):
+            size = max(n, 2 * len(self.table))
+            table = np.empty(size, dtype=np.uint64)
+            table[0] = 1
+            for k in range(1, size):
+                table[k] = (int(table[k - 1]) * 31) & 0xFFFFFFFF
+            self.table = table
+        return self.table[:n]
+
+
+_POW31 = _PowerTable()
+
+
+def text_seed(text: str) -> int:
+    # seed = sum(code_i * 31^(n-1-i)) mod 2^32 over UTF-16 code units (JS charCodeAt);
+    # uint64 products stay below 2^48 and wrapping sums stay correct mod 2^32
+    codes = np.frombuffer(text.encode("utf-16-le"), dtype="<u2").astype(np.uint64)
+    if not len(codes):
+        return 0
+    powers = _POW31.get(len(codes))[::-1]
+    return int(np.sum(codes * powers, dtype=np.uint64) & _MASK32)
+
+
+def hash_embeddings(texts: Sequence[str], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    if dim != EMBEDDING_DIM:
+        mul, add = _lcg_tables(dim)
+    else:
+        mul, add = _LCG_MUL, _LCG_ADD
+    seeds = np.fromiter((text_seed(t) for t in texts), dtype=np.uint64, count=len(texts))
+    with np.errstate(over="ignore"):
+        states = (seeds[:, None] * mul[None, :] + add[None, :]) & _MASK32
+    # JS computes in double and stores into a Float32Array
+    v = ((states & np.uint64(0xFFFF)).astype(np.float64) / 0xFFFF * 2 - 1).astype(np.float32)
+    v64 = v.astype(np.float64)
+    # sequential sum like the JS loop, so the norm matches to the last bit
+    norm = np.sqrt(np.cumsum(v64 * v64, axis=1)[:, -1])
+    norm[norm == 0] = 1.0
+    return (v64 / norm[:, None]).astype(np.float32)
+
+
+def vector_to_base64(vec: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vec, dtype="<f4").tobytes()).decode("ascii")
+
+
+def base64_to_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+class HashEmbedder:
+    name = "hash-v1"
+    dim = EMBEDDING_DIM
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return hash_embeddings(texts, self.dim)
+
+
+def onnx_available() -> bool:
+    return all(importlib.util.find_spec(m) is not None for m in ("onnxruntime", "tokenizers"))
+
+
+class OnnxEmbedder:
+    """Sentence-transformer style ONNX model on CPU (mean pooling + L2).
+
+    Expects `model.onnx` and `tokenizer.json` in `model_dir`; needs the
+    optional `onnxruntime` and `tokenizers` packages.
+    """
+
+    def __init__(self, model_dir: Path, threads: int = 1, max_tokens: int = 256):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        opts = onnxruntime.SessionOptions()
+        opts.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            str(model_dir / "model.onnx"), opts, providers=["CPUExecutionProvider"])
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_tokens)
+        self.tokenizer.enable_padding()
+        self.inputs = {i.name for i in self.session.get_inputs()}
+        self.name = f"onnx:{model_dir.name}"
+        self.dim = self.session.get_outputs()[0].shape[-1]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(list(texts))
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.inputs:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run(None, feeds)[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        norm = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.maximum(norm, 1e-12)).astype(np.float32)
+
+
+def load_embedder(backend: str = "hash", model_dir: Optional[str] = None, threads: int = 1):
+    if backend == "onnx":
+        if not model_dir or not onnx_available():
+            raise RuntimeError("onnx embedder needs EMBED_MODEL_DIR and the onnxruntime/tokenizers packages")
+        return OnnxEmbedder(Path(model_dir), threads=threads)
+    if backend != "hash":
+        raise ValueError(f"unknown embedding backend {backend!r}")
+    return HashEmbedder()
+
+
+def split_batches(texts: List[str], size: int) -> List[List[str]]:
+    size = max(1, size)
+    return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+
+def encode_vectors(matrix: np.ndarray) -> List[str]:
+    return [vector_to_base64(row) for row in matrix]
+
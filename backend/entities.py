@@ -0,0 +1,221 @@
+"""Gazetteer and pattern based entity extraction.
+
+People, places, organisations and products come from gazetteer files
+(`data/gazetteers/<type>.txt`, one entity per line as
+`Canonical|alias|alias`), compiled once into an Aho-Corasick automaton
+that finds every entry in a single pass over the text regardless of
+how many entries there are. Matching ignores case except for short or
+all-caps aliases ("DB", "ING"), which must match exactly. Dates,
+amounts, emails and phone numbers come from one combined regex pass.
+Overlaps resolve leftmost-longest.
+"""
+import re
+from collections import deque
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+DATA_DIR = Path(__file__).parent / "data" / "gazetteers"
+GAZETTEER_TYPES = ("person", "place", "organization", "product")
+
+_MONTHS = {
+    "jan": 1, "januar": 1, "january": 1, "feb": 2, "februar": 2, "february": 2,
+    "mär": 3, "märz": 3, "mar": 3, "march": 3, "apr": 4, "april": 4, "mai": 5, "may": 5,
+    "jun": 6, "juni": 6, "june": 6, "jul": 7, "juli": 7, "july": 7, "aug": 8, "august": 8,
+    "sep": 9, "sept": 9, "september": 9, "okt": 10, "oktober": 10, "oct": 10, "october": 10,
+    "nov": 11, "november": 11, "dez": 12, "dezember": 12, "dec": 12, "december": 12,
+}
+_MONTH_RE = "|".join(sorted(_MONTHS, key=len, reverse=True))
+_CURRENCIES = {"€": "EUR", "eur": "EUR", "euro": "EUR", "$": "USD", "usd": "USD", "dollar": "USD",
+               "£": "GBP", "gbp": "GBP", "chf": "CHF"}
+_CUR_RE = r"€|\$|£|EUR|USD|GBP|CHF|Euro|Dollar"
+_NUM_RE = r"\d{1,3}(?:[.,' ]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?"
+
+# alternation order matters where patterns could overlap: emails before phones, amounts before phones
+_PATTERN_RE = re.compile(
+    rf"(?P<email>\b[\w.%+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{{2,}}\b)"
+    rf"|(?P<date_iso>\b(?P<iy>\d{{4}})-(?P<im>\d{{2}})-(?P<id>\d{{2}})\b)"
+    rf"|(?P<date_num>\b(?P<nd>\d{{1,2}})\.(?P<nm>\d{{1,2}})\.(?P<ny>\d{{4}}|\d{{2}})\b)"
+    rf"|(?P<date_text>\b(?P<td>\d{{1,2}})\.?\s+(?P<tm>{_MONTH_RE})\.?(?:\s+(?P<ty>\d{{4}}))?\b)"
+    rf"|(?P<amount_pre>(?P<pc>{_CUR_RE})\s?(?P<pn>{_NUM_RE})(?![\d,.]\d))"
+    rf"|(?P<amount_post>(?<![\w.,])(?P<an>{_NUM_RE})\s?(?P<ac>{_CUR_RE})(?!\w))"
+    rf"|(?P<phone>(?<![\w+])(?:\+\d{{1,3}}[\s/-]?(?:\(0\))?\s?\d{{2,5}}|\(0\d{{1,5}}\)|0\d{{2,5}})[\s/-]?\d{{2,}}(?:[\s-]\d{{2,}}){{0,3}}(?!\w))",
+    re.IGNORECASE,
+)
+
+
+def parse_gazetteer(lines: Iterable[str]) -> Dict[str, str]:
+    """`Canonical|alias|...` lines -> {surface form: canonical}."""
+    entries: Dict[str, str] = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        names = [n.strip() for n in line.split("|") if n.strip()]
+        for name in names:
+            entries.setdefault(name, names[0])
+    return entries
+
+
+def _exact_case(surface: str) -> bool:
+    return len(surface) <= 3 or (surface.isupper() and len(surface) <= 5)
+
+
+class AhoCorasick:
+    """Multi-pattern matcher; `build()` once, then `iter_matches` is linear in the text."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # per state: (pattern length, payload) for every pattern ending here, suffixes included
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+
+    def __len__(self) -> int:
+        return sum(1 for out in self._out if out)
+
+    def add(self, pattern: str, payload: Any) -> None:
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        if not self._out[state]:
+            self._out[state].append((len(pattern), payload))
+
+    def build(self) -> "AhoCorasick":
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, payload in out[state]:
+                yield i + 1 - length, i + 1, payload
+
+
+def _lower_same_length(text: str) -> str:
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # a few characters (e.g. "İ") grow when lowercased; keep offsets aligned
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _amount(number: str, currency: str) -> Optional[str]:
+    digits = number.replace(" ", "").replace("'", "")
+    # the last separator is decimal only when 1-2 digits follow it
+    m = re.search(r"[.,](\d{1,2})$", digits)
+    if m:
+        whole, cents = digits[:m.start()], m.group(1).ljust(2, "0")
+    else:
+        whole, cents = digits, "00"
+    whole = re.sub(r"[.,]", "", whole) or "0"
+    return f"{int(whole)}.{cents} {_CURRENCIES[currency.lower()]}"
+
+
+def _date(year: Optional[str], month: int, day: str) -> Optional[str]:
+    try:
+        y = int(year) if year else None
+        if y is not None and y < 100:
+            y += 2000
+        d = date(y or 2000, month, int(day))
+    except ValueError:
+        return None
+    return d.isoformat() if y else d.strftime("--%m-%d")
+
+
+def _normalize(kind: str, m: "re.Match[str]") -> Optional[Tuple[str, Optional[str]]]:
+    if kind == "email":
+        return "email", m.group(0).lower()
+    if kind == "date_iso":
+        return "date", _date(m.group("iy"), int(m.group("im")), m.group("id"))
+    if kind == "date_num":
+        return "date", _date(m.group("ny"), int(m.group("nm")), m.group("nd"))
+    if kind == "date_text":
+        return "date", _date(m.group("ty"), _MONTHS[m.group("tm").lower()], m.group("td"))
+    if kind == "amount_pre":
+        return "amount", _amount(m.group("pn"), m.group("pc"))
+    if kind == "amount_post":
+        return "amount", _amount(m.group("an"), m.group("ac"))
+    digits = re.sub(r"\D", "", m.group(0))
+    if not 6 <= len(digits) <= 15:
+        return None
+    return "phone", ("+" if m.group(0).startswith("+") else "") + digits
+
+
+class EntityExtractor:
+    def __init__(self, gazetteers: Dict[str, Dict[str, str]]):
+        self.automaton = AhoCorasick()
+        for kind, entries in gazetteers.items():
+            for surface, canonical in entries.items():
+                exact = surface if _exact_case(surface) else None
+                self.automaton.add(surface.lower(), (kind, canonical, exact))
+        self.automaton.build()
+
+    @classmethod
+    def from_dir(cls, path: Path = DATA_DIR) -> "EntityExtractor":
+        gazetteers = {}
+        for kind in GAZETTEER_TYPES:
+            file = Path(path) / f"{kind}.txt"
+            if file.exists():
+                gazetteers[kind] = parse_gazetteer(file.read_text(encoding="utf-8").splitlines())
+        return cls(gazetteers)
+
+    def _candidates(self, text: str) -> Iterator[Tuple[int, int, str, Optional[str]]]:
+        lowered = _lower_same_length(text)
+        n = len(text)
+        for start, end, (kind, canonical, exact) in self.automaton.iter_matches(lowered):
+            # whole words only: "Ulm" must not match inside "Ulmenweg"
+            if (start and text[start - 1].isalnum()) or (end < n and text[end].isalnum()):
+                continue
+            if exact is not None and text[start:end] != exact:
+                continue
+            yield start, end, kind, canonical
+        for m in _PATTERN_RE.finditer(text):
+            found = _normalize(m.lastgroup, m)
+            if found and found[1] is not None:
+                yield m.start(), m.end(), found[0], found[1]
+
+    def extract(self, text: str, limit: int = 30) -> List[Dict[str, Any]]:
+        """Distinct entities in order of first appearance."""
+        # leftmost-longest, non-overlapping
+        matches = sorted(self._candidates(text), key=lambda c: (c[0], c[0] - c[1]))
+        entities: List[Dict[str, Any]] = []
+        seen = set()
+        pos = 0
+        for start, end, kind, normalized in matches:
+            if start < pos:
+                continue
+            pos = end
+            if (kind, normalized) in seen:
+                continue
+            seen.add((kind, normalized))
+            entities.append({"text": text[start:end], "type": kind, "normalized": normalized,
+                             "start": start, "end": end})
+            if len(entities) >= limit:
+                break
+        return entities
+
+
+def entity_tags(entities: List[Dict[str, Any]]) -> List[str]:
+    """Named entities as tags (lowercase canonical names)."""
+    return [e["normalized"].lower() for e in entities if e["type"] in GAZETTEER_TYPES]
@@ -0,0 +1,207 @@
+"""Deterministic offline annotator used when the LLM is unavailable.
+
+Everything here is linear in the input: one regex pass splits sentences,
+one pass tokenizes them, keywords are ranked by TF-IDF against corpus
+statistics loaded from disk, and the summary is the best-scoring one or
+two sentences. Cheap enough to run inline on the event loop for 50k chars.
+
+Corpus statistics are a JSON file `{"documents": N, "df": {term: count}}`,
+built with `python fallback.py build-stats notes.txt -o stats.json`. None
+ships with the repo (there is no representative note corpus to build one
+from), so until `data/fallback_stats.json` exists every IDF is 1.0 and
+keywords are ranked by term frequency alone.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+DATA_DIR = Path(__file__).parent / "data"
+STOPWORD_FILES = ("stopwords_de.txt", "stopwords_en.txt")
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+MIN_KEYWORD_LEN = 4
+SHORT_TEXT_CHARS = 200
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text) if s and s.strip()]
+
+
+def load_stopwords(paths: Iterable[Path]) -> Set[str]:
+    words: Set[str] = set()
+    for path in paths:
+        if not path.exists():
+            continue
+        for line in path.read_text(encoding="utf-8").splitlines():
+            line = line.strip().lower()
+            if line and not line.startswith("#"):
+                words.add(line)
+    return words
+
+
+def build_corpus_stats(documents: Iterable[str]) -> Dict[str, Any]:
+    df: Counter = Counter()
+    n = 0
+    for doc in documents:
+        n += 1
+        df.update(set(tokenize(doc)))
+    return {"documents": n, "df": dict(df)}
+
+
+class FallbackAnnotator:
+    def __init__(
+        self,
+        data_dir: Path = DATA_DIR,
+        stats_path: Optional[Path] = None,
+        reload_interval: float = 30.0,
+    ):
+        self.data_dir = Path(data_dir)
+        self.stats_path = Path(stats_path) if stats_path else self.data_dir / "fallback_stats.json"
+        self.reload_interval = reload_interval
+        self.stopwords: Set[str] = set()
+        self.documents = 0
+        self.df: Dict[str, int] = {}
+        self._mtimes: Dict[Path, float] = {}
+        self._next_check = 0.0
+        self.reload()
+
+    def _watched(self) -> List[Path]:
+        return [self.data_dir / name for name in STOPWORD_FILES] + [self.stats_path]
+
+    def reload(self) -> None:
+        self.stopwords = load_stopwords(self.data_dir / name for name in STOPWORD_FILES)
+        documents, df = 0, {}
+        if self.stats_path.exists():
+            stats = json.loads(self.stats_path.read_text(encoding="utf-8"))
+            documents, df = int(stats.get("documents") or 0), stats.get("df") or {}
+        self.documents, self.df = documents, df
+        self._mtimes = {p: p.stat().st_mtime for p in self._watched() if p.exists()}
+        self._next_check = time.monotonic() + self.reload_interval
+
+    def maybe_reload(self) -> bool:
+        # cheap mtime poll so updated stopwords/stats apply without a restart
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.reload_interval
+        current = {p: p.stat().st_mtime for p in self._watched() if p.exists()}
+        if current == self._mtimes:
+            return False
+        self.reload()
+        return True
+
+    def idf(self, term: str) -> float:
+        if not self.documents:
+            return 1.0
+        return math.log((self.documents + 1) / (self.df.get(term, 0) + 1)) + 1.0
+
+    def keyword_weights(self, counts: Counter) -> Dict[str, float]:
+        weights: Dict[str, float] = {}
+        for term, tf in counts.items():
+            if len(term) < MIN_KEYWORD_LEN or term in self.stopwords or term.isdigit():
+                continue
+            weights[term] = (1.0 + math.log(tf)) * self.idf(term)
+        return weights
+
+    def summarize(
+        self,
+        sentences: List[str],
+        sentence_tokens: List[List[str]],
+        weights: Dict[str, float],
+        max_chars: int,
+        max_sentences: int = 2,
+    ) -> str:
+        scored = []
+        seen: Set[tuple] = set()
+        for i, toks in enumerate(sentence_tokens):
+            # a repeated sentence (pasted twice, same line in a list) only competes once
+            key = tuple(toks)
+            if not toks or key in seen:
+                continue
+            seen.add(key)
+            score = sum(weights.get(t, 0.0) for t in set(toks)) / math.sqrt(len(toks))
+            # mild lead bias: notes usually open with what they are about
+            scored.append((score * (1.2 if i == 0 else 1.0), -i, i))
+        scored.sort(reverse=True)
+        chosen: List[int] = []
+        used = 0
+        for _, _, i in scored:
+            length = len(sentences[i]) + (1 if chosen else 0)
+            if chosen and used + length > max_chars:
+                continue
+            chosen.append(i)
+            used += length
+            if len(chosen) >= max_sentences:
+                break
+        summary = " ".join(sentences[i] for i in sorted(chosen))
+        if len(summary) > max_chars:
+            cut = summary.rfind(" ", 0, max_chars)
+            summary = summary[:cut if cut > 0 else max_chars].rstrip() + "..."
+        return summary
+
+    def annotate(
+        self,
+        text: str,
+        custom_categories: Optional[List[str]] = None,
+        max_tags: int = 5,
+        max_summary_chars: int = 300,
+    ) -> Dict[str, Any]:
+        self.maybe_reload()
+        text = text.strip()
+        sentences = split_sentences(text)
+        sentence_tokens = [tokenize(s) for s in sentences]
+        counts: Counter = Counter()
+        for toks in sentence_tokens:
+            counts.update(toks)
+        weights = self.keyword_weights(counts)
+        # Counter keeps first-seen order, so ties go to the earlier word
+        order = {t: i for i, t in enumerate(weights)}
+        tags = sorted(weights, key=lambda t: (-weights[t], order[t]))[:max_tags]
+        if len(text) <= SHORT_TEXT_CHARS:
+            summary = text
+        else:
+            summary = self.summarize(sentences, sentence_tokens, weights, max_summary_chars)
+        return {
+            "categories": custom_categories[:2] if custom_categories else [],
+            "tags": tags,
+            "summary": summary,
+        }
+
+
+def _main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fallback annotator corpus tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    build = sub.add_parser("build-stats", help="build document frequencies, one document per line")
+    build.add_argument("inputs", nargs="+")
+    build.add_argument("-o", "--output", default=str(DATA_DIR / "fallback_stats.json"))
+    args = parser.parse_args(argv)
+
+    def docs():
+        for name in args.inputs:
+            with open(name, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield line
+
+    stats = build_corpus_stats(docs())
+    tmp = args.output + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False)
+    os.replace(tmp, args.output)
+    print(f"{stats['documents']} documents, {len(stats['df'])} terms -> {args.output}")
+
+
+if __name__ == "__main__":
+    _main()
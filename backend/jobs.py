@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+
+class RetryJob(Exception):
+    """Raised by a handler to ask for another attempt with the given result as last resort."""
+
+    def __init__(self, message: str, result: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.result = result
+
+
+class JobConflict(Exception):
+    """An idempotent resubmission whose payload differs from the job it names."""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"job {job_id} exists with a different payload")
+        self.job_id = job_id
+
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """Mongo-backed job queue with leases, retries and dead-lettering.
+
+    A worker claims a job by atomically flipping it to `running` with a
+    lease; a job whose lease ran out (worker crashed or restarted) becomes
+    claimable again, unless that was its last attempt: a job that keeps
+    taking its worker down is dead-lettered like one that fails. Failed
+    attempts go back to `queued` with backoff until `max_attempts`, then
+    the job is parked as `dead`. Finished jobs expire through a TTL index
+    on `expires_at`.
+    """
+
+    def __init__(
+        self,
+        collection,
+        *,
+        lease_seconds: float = 60.0,
+        max_attempts: int = 3,
+        retry_base_seconds: float = 5.0,
+        result_ttl_seconds: int = 24 * 3600,
+    ):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self._wakeup = asyncio.Event()
+        self._finished: Dict[str, asyncio.Event] = {}
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("status", 1), ("available_at", 1)])
+        await self.collection.create_index([("status", 1), ("lease_until", 1)])
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def enqueue(
+        self,
+        payload: Dict[str, Any],
+        job_id: Optional[str] = None,
+        client: Optional[str] = None,
+        owner: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        doc = {
+            "_id": job_id or str(uuid.uuid4()),
+            "status": QUEUED,
+            "payload": payload,
+            "payload_hash": payload_hash(payload),
+            # who submitted it, so the worker's upstream calls queue fairly per client
+            "client": client,
+            # who may read it back
+            "owner": owner,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "available_at": now,
+            "lease_until": None,
+            "worker": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        try:
+            await self.collection.insert_one(doc)
+        except DuplicateKeyError:
+            # idempotent resubmission: hand back the job that already exists, if it is the same job
+            existing = await self.get(doc["_id"])
+            if existing is not None and existing.get("payload_hash") != doc["payload_hash"]:
+                raise JobConflict(doc["_id"])
+            return existing
+        self._wakeup.set()
+        return doc
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": job_id})
+
+    async def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        await self.collection.update_many(
+            {"status": RUNNING, "lease_until": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {
+                "status": DEAD,
+                "error": "lease expired on the last attempt",
+                "lease_until": None,
+                "updated_at": now,
+                "expires_at": now + timedelta(seconds=self.result_ttl_seconds),
+            }},
+        )
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED, "available_at": {"$lte": now}},
+                {"status": RUNNING, "lease_until": {"$lt": now}, "attempts": {"$lt": self.max_attempts}},
+            ]},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker": worker,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def extend_lease(self, job_id: str, worker: str) -> bool:
+        now = datetime.utcnow()
+        res = await self.collection.update_one(
+            {"_id": job_id, "status": RUNNING, "worker": worker},
+            {"$set": {"lease_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now}},
+        )
+        return res.modified_count == 1
+
+    async def complete(self, job_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        now = datetime.utcnow()
+        res = await self.collection.update_one(
+            {"_id": job_id, "status": RUNNING, "worker": worker},
+            {"$set": {
+                "status": DONE,
+                "result": result,
+                "error": None,
+                "lease_until": None,
+                "updated_at": now,
+                "expires_at": now + timedelta(seconds=self.result_ttl_seconds),
+            }},
+        )
+        self._notify(job_id)
+        return res.modified_count == 1
+
+    async def fail(self, job: Dict[str, Any], worker: str, error: str) -> str:
+        now = datetime.utcnow()
+        if job["attempts"] >= job.get("max_attempts", self.max_attempts):
+            update = {
+                "status": DEAD,
+                "error": error[:500],
+                "lease_until": None,
+                "updated_at": now,
+                "expires_at": now + timedelta(seconds=self.result_ttl_seconds),
+            }
+        else:
+            delay = self.retry_base_seconds * (2 ** (job["attempts"] - 1))
+            update = {
+                "status": QUEUED,
+                "error": error[:500],
+                "lease_until": None,
+                "available_at": now + timedelta(seconds=delay),
+                "updated_at": now,
+            }
+        await self.collection.update_one({"_id": job["_id"], "status": RUNNING, "worker": worker}, {"$set": update})
+        if update["status"] == DEAD:
+            self._notify(job["_id"])
+        return update["status"]
+
+    async def wait_for_work(self, timeout: float) -> None:
+        # enqueue in this process wakes idle workers without waiting for the next poll
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _notify(self, job_id: str) -> None:
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, job_id: str, timeout: float, poll_interval: float = 1.0) -> Optional[Dict[str, Any]]:
+        """Long-poll until the job is done/dead or `timeout` elapses.
+
+        Jobs finished by this process wake the waiter at once; jobs finished
+        by other workers are seen on the next poll.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                job = await self.get(job_id)
+                remaining = deadline - loop.time()
+                if job is None or job["status"] in (DONE, DEAD) or remaining <= 0:
+                    return job
+                event = self._finished.setdefault(job_id, asyncio.Event())
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(poll_interval, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._finished.pop(job_id, None)
+
+
+class JobWorkerPool:
+    """`concurrency` asyncio workers pulling from a JobQueue.
+
+    Sized independently of HTTP concurrency; each worker keeps its lease
+    alive while the handler runs.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        *,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._run(f"{self.worker_id}-{i}")) for i in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, worker: str) -> None:
+        while True:
+            try:
+                job = await self.queue.claim(worker)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("job claim failed: %s", e)
+                job = None
+            if job is None:
+                await self.queue.wait_for_work(self.poll_interval)
+                continue
+            try:
+                await self.process(job, worker)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("job %s bookkeeping failed: %s", job["_id"], e)
+
+    async def process(self, job: Dict[str, Any], worker: str) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job["_id"], worker))
+        try:
+            result = await self.handler(job)
+        except asyncio.CancelledError:
+            # shutdown: the lease runs out and another worker picks the job up
+            raise
+        except RetryJob as e:
+            last_attempt = job["attempts"] >= job.get("max_attempts", self.queue.max_attempts)
+            if last_attempt and e.result is not None:
+                await self.queue.complete(job["_id"], worker, e.result)
+            else:
+                await self.queue.fail(job, worker, str(e))
+        except Exception as e:
+            logger.warning("job %s failed: %s", job["_id"], e)
+            await self.queue.fail(job, worker, str(e))
+        else:
+            await self.queue.complete(job["_id"], worker, result)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str, worker: str) -> None:
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                await self.queue.extend_lease(job_id, worker)
+            except Exception as e:
+                logger.debug("lease extension failed for %s: %s", job_id, e)
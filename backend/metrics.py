@@ -0,0 +1,212 @@
+"""Minimal in-process metrics with Prometheus text exposition.
+
+Deliberately tiny: counters, gauges and fixed-bucket histograms keyed by label
+tuples, no locks (everything runs on the event loop thread). Each uvicorn
+worker exposes its own numbers; scrape every worker or aggregate
+upstream.
+"""
+import bisect
+import cProfile
+import io
+import logging
+import pstats
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for key, v in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {_fmt(v)}"
+
+    def reset(self) -> None:
+        self._values.clear()
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[tuple(labels.get(n, "") for n in self.labelnames)] = value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(tuple(labels.get(n, "") for n in self.labelnames))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Iterator[str]:
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = 'le="%s"' % _fmt(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total[0])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+    def reset(self) -> None:
+        self._values.clear()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.type}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for m in self._metrics:
+            m.reset()
+
+
+class SlowRequestProfiler:
+    """Profiles a random sample of requests with cProfile and logs slow ones.
+
+    Only one request is profiled at a time (cProfile is per-thread and does
+    not nest); with `sample_rate` 0 this costs one comparison per request.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, slow_seconds: float = 1.0, top: int = 25):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.top = top
+        self._active = False
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self.sample_rate <= 0 or self._active or random.random() >= self.sample_rate:
+            return None
+        self._active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop(self, profiler: Optional[cProfile.Profile], label: str, elapsed: float) -> None:
+        if profiler is None:
+            return
+        profiler.disable()
+        self._active = False
+        if elapsed < self.slow_seconds:
+            return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(self.top)
+        logger.warning("slow request %s took %.3fs\n%s", label, elapsed, out.getvalue())
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: request latency by route template and status.
+
+    Uses the matched route's path (not the raw URL) as label, so ids in
+    paths do not explode cardinality; unmatched requests share one label.
+    """
+
+    def __init__(self, app, histogram: Histogram, profiler: Optional[SlowRequestProfiler] = None):
+        self.app = app
+        self.histogram = histogram
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        profiler = self.profiler.start() if self.profiler else None
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.observe(elapsed, method=scope["method"], route=path, status=str(status["code"]))
+            if profiler is not None:
+                self.profiler.stop(profiler, f"{scope['method']} {path}", elapsed)
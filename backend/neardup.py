@@ -0,0 +1,129 @@
+"""MinHash/LSH index of recently annotated texts.
+
+Notes are often small edits of earlier ones (one item changed on a
+shopping list, a re-dictated memo). The exact-match annotation cache misses
+those; this index finds an earlier text whose word set has Jaccard
+similarity >= `threshold` so its annotation can be reused.
+
+Each text becomes a MinHash signature of `bands * rows` values over its
+word set; texts sharing any band land in the same bucket, so a lookup only
+compares against a handful of candidates instead of every entry. The
+candidate's similarity is then checked exactly on the stored word sets.
+Entries are evicted least recently used beyond `max_entries`.
+"""
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+
+from fallback import tokenize
+
+_PRIME = np.uint64((1 << 32) + 15)
+
+
+class NearMatch:
+    __slots__ = ("key", "similarity", "value", "removed")
+
+    def __init__(self, key: str, similarity: float, value: Dict[str, Any], removed: FrozenSet[str]):
+        self.key = key
+        self.similarity = similarity
+        self.value = value
+        # words of the earlier text that the new text no longer has
+        self.removed = removed
+
+
+class NearDuplicateIndex:
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        threshold: float = 0.8,
+        *,
+        bands: int = 16,
+        rows: int = 4,
+        min_tokens: int = 5,
+        seed: int = 1,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.min_tokens = min_tokens
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, bands * rows, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, 1 << 31, bands * rows, dtype=np.uint64)[:, None]
+        # key -> (namespace, word set, band keys, value)
+        self._entries: "OrderedDict[str, Tuple[str, FrozenSet[str], List[Tuple], Dict[str, Any]]]" = OrderedDict()
+        self._buckets: Dict[Tuple, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _words(self, text: str) -> Optional[FrozenSet[str]]:
+        words = frozenset(tokenize(text))
+        return words if len(words) >= self.min_tokens else None
+
+    def _band_keys(self, namespace: str, words: FrozenSet[str]) -> List[Tuple]:
+        x = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+        # (a * x + b) mod p stays below 2**64 for a, b < 2**31 and x < 2**32
+        signature = ((self._a * x + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+        return [(namespace, i, signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+
+    def lookup(self, text: str, namespace: str) -> Optional[NearMatch]:
+        """Most similar indexed text in `namespace` at or above the threshold."""
+        if self.max_entries <= 0 or not self._entries:
+            return None
+        words = self._words(text)
+        if words is None:
+            return None
+        candidates: Set[str] = set()
+        for band in self._band_keys(namespace, words):
+            candidates.update(self._buckets.get(band, ()))
+        best: Optional[Tuple[float, str]] = None
+        for key in candidates:
+            other = self._entries[key][1]
+            similarity = len(words & other) / len(words | other)
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, key)
+        if best is None:
+            return None
+        similarity, key = best
+        self._entries.move_to_end(key)
+        _, other, _, value = self._entries[key]
+        return NearMatch(key, similarity, value, other - words)
+
+    def add(self, key: str, text: str, namespace: str, value: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        words = self._words(text)
+        if words is None:
+            return
+        self._remove(key)
+        bands = self._band_keys(namespace, words)
+        for band in bands:
+            self._buckets.setdefault(band, set()).add(key)
+        self._entries[key] = (namespace, words, bands, value)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in entry[2]:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+
+def patch_annotation(value: Dict[str, Any], removed: FrozenSet[str]) -> Tuple[Dict[str, Any], int]:
+    """Drop tags that only named words the new text no longer contains."""
+    tags = value.get("tags") or []
+    kept = [t for t in tags if not (set(tokenize(t)) and set(tokenize(t)) <= removed)]
+    return {**value, "tags": kept}, len(tags) - len(kept)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: Optional[float]):
+        super().__init__("AI rate limit exceeded")
+        self.retry_after = retry_after
+
+
+class GCRALimiter:
+    """In-process token bucket, implemented as GCRA.
+
+    State per key is a single float (the theoretical arrival time), so a
+    check is O(1) and memory is one entry per active key. A key whose TAT
+    lies in the past has a full bucket and carries no information, which
+    is what the periodic sweep evicts.
+    """
+
+    def __init__(
+        self,
+        rate_per_min: int,
+        burst: Optional[int] = None,
+        *,
+        sweep_interval: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.interval = 60.0 / max(1, rate_per_min)
+        self.burst = max(1, burst or rate_per_min)
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._tat: Dict[str, float] = {}
+        self._next_sweep = clock() + sweep_interval
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def reset(self) -> None:
+        self._tat.clear()
+
+    def check(self, key: str, cost: int = 1) -> Optional[float]:
+        """Charge `cost` tokens; return None if allowed, else seconds to wait."""
+        now = self.clock()
+        if now >= self._next_sweep:
+            self.sweep(now)
+        if cost > self.burst:
+            return float("inf")
+        tat = max(self._tat.get(key, now), now)
+        new_tat = tat + cost * self.interval
+        over = new_tat - now - self.burst * self.interval
+        if over > 1e-9:
+            return over
+        self._tat[key] = new_tat
+        return None
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = self.clock() if now is None else now
+        idle = [k for k, tat in self._tat.items() if tat <= now]
+        for k in idle:
+            del self._tat[k]
+        self._next_sweep = now + self.sweep_interval
+        return len(idle)
+
+    async def acquire(self, key: str, cost: int = 1) -> None:
+        wait = self.check(key, cost)
+        if wait is not None:
+            raise RateLimited(wait)
+
+
+class MongoGCRALimiter:
+    """GCRA shared by all workers through one atomic update per check.
+
+    Each key is a document holding its TAT in epoch seconds; the decision
+    and the new TAT are computed server-side in a single pipeline update,
+    so concurrent workers cannot double-spend. Idle keys expire through a
+    TTL index on `expires_at`. If Mongo is slow or down we fall back to the
+    local limiter instead of failing requests.
+    """
+
+    def __init__(
+        self,
+        collection,
+        rate_per_min: int,
+        burst: Optional[int] = None,
+        *,
+        timeout: float = 0.2,
+        fallback: Optional[GCRALimiter] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.collection = collection
+        self.interval = 60.0 / max(1, rate_per_min)
+        self.burst = max(1, burst or rate_per_min)
+        self.timeout = timeout
+        self.clock = clock
+        self.fallback = fallback or GCRALimiter(rate_per_min, burst)
+
+    def reset(self) -> None:
+        self.fallback.reset()
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def acquire(self, key: str, cost: int = 1) -> None:
+        if cost > self.burst:
+            raise RateLimited(float("inf"))
+        now = self.clock()
+        limit = self.burst * self.interval
+        new_tat = {"$add": [{"$max": ["$tat", now]}, cost * self.interval]}
+        allowed = {"$lte": [{"$subtract": [new_tat, now]}, limit]}
+        update = [{"$set": {
+            "allowed": allowed,
+            "tat": {"$cond": [allowed, new_tat, {"$ifNull": ["$tat", now]}]},
+            # tat never exceeds now + limit, so the key is idle by then
+            "expires_at": datetime.utcnow() + timedelta(seconds=limit + 1),
+        }}]
+        try:
+            doc = await asyncio.wait_for(
+                self.collection.find_one_and_update(
+                    {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+                ),
+                timeout=self.timeout,
+            )
+        except Exception as e:
+            logger.warning("shared rate limiter unavailable, using local limiter: %s", e)
+            await self.fallback.acquire(key, cost)
+            return
+        if not doc.get("allowed"):
+            raise RateLimited(max(0.0, doc["tat"] + cost * self.interval - now - limit))
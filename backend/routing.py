@@ -0,0 +1,173 @@
+"""Per-request model and token budget selection.
+
+Models are configured with a quality tier (`name=tier,...`, higher is
+better). A request needs a minimum tier: the base tier, one lower when
+`custom_categories` turns it into a constrained pick-from-list task, one
+higher for long inputs. Among the models that meet it, the router picks
+the one with the lowest observed latency (EWMA over our own upstream
+calls), skipping models whose EWMA error rate is too high (the rate
+decays while a model is idle, so it gets retried). When a route has a
+latency SLO and no qualifying model is expected to meet it, a lower-tier
+model that does is used instead.
+"""
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+def parse_models(spec: str, default: str) -> Dict[str, int]:
+    """`name=tier,name=tier` -> {name: tier}, in the configured order."""
+    models: Dict[str, int] = {}
+    for part in spec.split(","):
+        name, sep, tier = part.strip().rpartition("=")
+        if sep and name:
+            models[name] = int(tier)
+        elif part.strip():
+            models[part.strip()] = 1
+    return models or {default: 1}
+
+
+def parse_slos(spec: str) -> Dict[str, float]:
+    """`route=ms,route=ms` -> {route: seconds}; 0 means no SLO."""
+    slos: Dict[str, float] = {}
+    for part in spec.split(","):
+        route, sep, ms = part.strip().partition("=")
+        if sep and route and float(ms) > 0:
+            slos[route] = float(ms) / 1000
+    return slos
+
+
+class ModelStats:
+    __slots__ = ("latency", "error_rate", "calls", "last_at")
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.error_rate = 0.0
+        self.calls = 0
+        self.last_at = 0.0
+
+
+class Route:
+    __slots__ = ("model", "reason", "tier", "max_tokens")
+
+    def __init__(self, model: str, reason: str, tier: int, max_tokens: int):
+        self.model = model
+        self.reason = reason
+        self.tier = tier
+        self.max_tokens = max_tokens
+
+    def metadata(self) -> Dict[str, object]:
+        return {"model": self.model, "reason": self.reason, "tier": self.tier, "max_tokens": self.max_tokens}
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        models: Dict[str, int],
+        *,
+        base_tier: int = 1,
+        long_input_chars: int = 4000,
+        min_tokens: int = 200,
+        max_tokens: int = 400,
+        slos: Optional[Dict[str, float]] = None,
+        max_error_rate: float = 0.5,
+        error_half_life: float = 60.0,
+        initial_latency: float = 2.0,
+        alpha: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.models = dict(models)
+        self.base_tier = base_tier
+        self.long_input_chars = long_input_chars
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.slos = slos or {}
+        self.max_error_rate = max_error_rate
+        self.error_half_life = error_half_life
+        self.alpha = alpha
+        self.clock = clock
+        self.stats = {name: ModelStats(initial_latency) for name in self.models}
+
+    def required_tier(self, text: str, custom_categories: Optional[Sequence[str]]) -> int:
+        tier = self.base_tier
+        if custom_categories:
+            tier -= 1
+        if len(text) > self.long_input_chars:
+            tier += 1
+        tiers = self.models.values()
+        return max(min(tiers), min(tier, max(tiers)))
+
+    def token_budget(self, text: str, custom_categories: Optional[Sequence[str]]) -> int:
+        # the answer is a few tags and one or two sentences; it grows a little with the input
+        share = min(1.0, len(text) / self.long_input_chars)
+        budget = self.min_tokens + (self.max_tokens - self.min_tokens) * share
+        if custom_categories:
+            budget -= 50
+        return int(max(self.min_tokens / 2, budget))
+
+    def _rank(self, names: List[str]) -> List[str]:
+        order = list(self.models)
+        # fastest first; on equal latency the cheaper (lower tier), then configured order
+        return sorted(names, key=lambda n: (self.stats[n].latency, self.models[n], order.index(n)))
+
+    def route(
+        self,
+        text: str,
+        custom_categories: Optional[Sequence[str]] = None,
+        *,
+        requested: Optional[str] = None,
+        route: str = "annotate",
+    ) -> Route:
+        budget = self.token_budget(text, custom_categories)
+        tier = self.required_tier(text, custom_categories)
+        if requested:
+            return Route(requested, "requested", self.models.get(requested, tier), budget)
+        healthy = [n for n in self.models if self.error_rate(n) <= self.max_error_rate]
+        pool = healthy or list(self.models)
+        qualified = self._rank([n for n in pool if self.models[n] >= tier])
+        reason = "fastest_in_tier" if healthy else "all_unhealthy"
+        if not qualified:
+            # every model good enough is failing: still prefer quality over a healthy lower tier
+            qualified = self._rank([n for n in self.models if self.models[n] >= tier])
+            qualified = qualified or self._rank(list(self.models))
+            reason = "tier_unhealthy"
+        slo = self.slos.get(route)
+        if slo is None:
+            return Route(qualified[0], reason, tier, budget)
+        within = [n for n in qualified if self.stats[n].latency <= slo]
+        if within:
+            return Route(within[0], reason, tier, budget)
+        # nothing good enough is fast enough: trade quality for the SLO
+        below = self._rank([n for n in pool if self.models[n] < tier and self.stats[n].latency <= slo])
+        if below:
+            return Route(below[0], "slo_downgrade", tier, budget)
+        return Route(self._rank(pool)[0], "slo_unmet", tier, budget)
+
+    def error_rate(self, model: str) -> float:
+        stats = self.stats[model]
+        # decays while a model gets no traffic, so an avoided model is tried again eventually
+        idle = max(0.0, self.clock() - stats.last_at)
+        return stats.error_rate * 0.5 ** (idle / self.error_half_life)
+
+    def observe(self, model: str, seconds: float, ok: bool) -> None:
+        stats = self.stats.get(model)
+        if stats is None:
+            return
+        if ok:
+            # failed calls time out or fail fast, neither says much about latency;
+            # the first measurement replaces the configured prior outright
+            stats.latency += (self.alpha if stats.calls else 1.0) * (seconds - stats.latency)
+        stats.error_rate = self.error_rate(model)
+        stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+        stats.calls += 1
+        stats.last_at = self.clock()
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        return {
+            name: {
+                "tier": tier,
+                "latency": round(self.stats[name].latency, 3),
+                "error_rate": round(self.error_rate(name), 3),
+                "calls": self.stats[name].calls,
+            }
+            for name, tier in self.models.items()
+        }
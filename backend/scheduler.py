@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BACKGROUND = "background"
+# served strictly in this order; fairness applies between clients of one class
+PRIORITIES = (INTERACTIVE, BATCH, BACKGROUND)
+
+
+class Overloaded(Exception):
+    def __init__(self, estimated_wait: float):
+        super().__init__(f"AI upstream queue full (estimated wait {estimated_wait:.1f}s)")
+        self.estimated_wait = estimated_wait
+
+
+class Admission:
+    """Who an upstream call is for: client key, priority class, absolute deadline."""
+
+    __slots__ = ("client", "priority", "deadline")
+
+    def __init__(self, client: str, priority: str = INTERACTIVE, deadline: Optional[float] = None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r}")
+        self.client = client
+        self.priority = priority
+        # monotonic time after which a queued call is shed; None waits as long as needed
+        self.deadline = deadline
+
+
+def parse_weights(spec: Optional[str]) -> Dict[str, float]:
+    """`key=weight,key=weight` -> {key: weight}; keys use the rate limiter's format."""
+    weights: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        key, sep, value = part.strip().rpartition("=")
+        if sep and key:
+            weights[key] = max(0.01, float(value))
+    return weights
+
+
+class FairScheduler:
+    """Admission control in front of the upstream.
+
+    At most `max_inflight` calls run at once. Waiting calls are served by
+    priority class, and within a class by self-clocked weighted fair
+    queuing: each call gets the tag max(V, client's last tag) + 1/weight
+    and the smallest tag goes next, so a client flooding the queue only
+    delays itself. A call whose estimated wait exceeds its deadline is
+    rejected immediately with `Overloaded` (and so is one whose deadline
+    passes while queued), letting the caller answer with the fallback.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int,
+        *,
+        weights: Optional[Dict[str, float]] = None,
+        initial_service_time: float = 2.0,
+        ewma_alpha: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_inflight = max(1, max_inflight)
+        self.weights = weights or {}
+        self.service_time = initial_service_time
+        self.ewma_alpha = ewma_alpha
+        self.clock = clock
+        self.inflight = 0
+        self.shed = 0
+        self._seq = itertools.count()
+        self._queues: Dict[str, List[list]] = {p: [] for p in PRIORITIES}
+        self._waiting: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self._virtual: Dict[str, float] = {p: 0.0 for p in PRIORITIES}
+        # (priority, client) -> (last tag, calls queued); dropped once nothing is queued
+        self._clients: Dict[Tuple[str, str], Tuple[float, int]] = {}
+
+    def queued(self, priority: Optional[str] = None) -> int:
+        if priority is None:
+            return sum(self._waiting.values())
+        return self._waiting[priority]
+
+    def estimated_wait(self, priority: str) -> float:
+        """Expected queueing delay for a call of `priority` arriving now."""
+        rank = PRIORITIES.index(priority)
+        ahead = sum(self._waiting[p] for p in PRIORITIES[:rank + 1])
+        if self.inflight < self.max_inflight and ahead == 0:
+            return 0.0
+        # a slot frees up every service_time / max_inflight seconds on average
+        return (ahead + 1) * self.service_time / self.max_inflight
+
+    async def acquire(self, admission: Admission) -> float:
+        """Wait for a slot; returns the seconds spent queued."""
+        priority = admission.priority
+        if self.estimated_wait(priority) == 0.0:
+            self.inflight += 1
+            return 0.0
+        now = self.clock()
+        estimate = self.estimated_wait(priority)
+        if admission.deadline is not None and now + estimate > admission.deadline:
+            self.shed += 1
+            raise Overloaded(estimate)
+
+        key = (priority, admission.client)
+        last, count = self._clients.get(key, (0.0, 0))
+        tag = max(self._virtual[priority], last) + 1.0 / self.weights.get(admission.client, 1.0)
+        self._clients[key] = (tag, count + 1)
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority], [tag, next(self._seq), fut])
+        self._waiting[priority] += 1
+        try:
+            timeout = None if admission.deadline is None else max(0.0, admission.deadline - now)
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise Overloaded(self.clock() - now)
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                # granted a slot while being cancelled: hand it on
+                self.release(None)
+            raise
+        finally:
+            self._waiting[priority] -= 1
+            last, count = self._clients[key]
+            if count == 1:
+                del self._clients[key]
+            else:
+                self._clients[key] = (last, count - 1)
+        return self.clock() - now
+
+    def release(self, service_seconds: Optional[float]) -> None:
+        self.inflight -= 1
+        if service_seconds is not None:
+            self.service_time += self.ewma_alpha * (service_seconds - self.service_time)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self.inflight < self.max_inflight:
+                tag, _, fut = heapq.heappop(queue)
+                if fut.done():
+                    continue  # gave up waiting
+                self._virtual[priority] = tag
+                self.inflight += 1
+                fut.set_result(None)
+            if self.inflight >= self.max_inflight:
+                return
+
+    @asynccontextmanager
+    async def slot(self, admission: Admission) -> AsyncIterator[float]:
+        waited = await self.acquire(admission)
+        started = self.clock()
+        try:
+            yield waited
+        finally:
+            self.release(self.clock() - started)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "queued": {p: self._waiting[p] for p in PRIORITIES},
+            "service_time": round(self.service_time, 3),
+            "shed": self.shed,
+        }
@@ -0,0 +1,444 @@
+"""Per-user hybrid note search: BM25 keywords plus embedding cosine.
+
+Each user who opts in gets a `SearchIndex` held in memory: an inverted
+index (term -> {slot: tf}) updated incrementally on every upsert, and one
+contiguous float32 matrix with a row per note. A query scores all
+candidates at once with NumPy, mixes the two signals like the app's
+`searchCombined` (0.6 keyword + 0.4 positive cosine) and picks the top k
+with `argpartition`. Above `ivf_min_docs` notes the vector side switches
+to an IVF coarse quantizer (spherical k-means) and only scans the
+`nprobe` closest lists, plus the keyword hits. `SearchService` trains the
+quantizer in a background thread and keeps answering from the previous
+one (or brute force) until it is ready; queries also run off the event
+loop.
+
+Notes are persisted in Mongo so an index can be rebuilt after a restart
+or after it was evicted from memory.
+"""
+import asyncio
+import functools
+import math
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from pymongo import DeleteMany, ReplaceOne
+
+from fallback import tokenize
+
+K1 = 1.2
+B = 0.75
+KEYWORD_WEIGHT = 0.6
+VECTOR_WEIGHT = 0.4
+
+
+class IVFIndex:
+    """Coarse quantizer: slot -> nearest of `nlist` unit centroids."""
+
+    def __init__(self, centroids: np.ndarray, assign: np.ndarray):
+        self.centroids = centroids
+        self.assign = assign
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, usable: np.ndarray, nlist: int, iterations: int = 8,
+              sample: int = 20000, seed: int = 0) -> "IVFIndex":
+        rows = np.flatnonzero(usable)
+        rnd = np.random.default_rng(seed)
+        train = vectors[rnd.choice(rows, size=min(sample, len(rows)), replace=False)]
+        nlist = max(1, min(nlist, len(train)))
+        centroids = train[rnd.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(train @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, train)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # empty lists keep their old centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+        assign = np.full(len(vectors), -1, dtype=np.int32)
+        for start in range(0, len(rows), 8192):
+            chunk = rows[start:start + 8192]
+            assign[chunk] = np.argmax(vectors[chunk] @ centroids.T, axis=1)
+        return cls(centroids, assign)
+
+    def nearest(self, vec: np.ndarray) -> int:
+        return int(np.argmax(self.centroids @ vec))
+
+    def probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        sims = self.centroids @ query
+        nprobe = min(nprobe, len(sims))
+        return np.argpartition(-sims, nprobe - 1)[:nprobe]
+
+
+class SearchIndex:
+    def __init__(self, dim: int, *, ivf_min_docs: int = 20000, nprobe: int = 8, capacity: int = 1024):
+        self.dim = dim
+        self.ivf_min_docs = ivf_min_docs
+        self.nprobe = nprobe
+        self.slots: Dict[str, int] = {}
+        self.ids: List[Optional[str]] = []
+        self.free: List[int] = []
+        self.size = 0  # high-water mark of used slots
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.has_vec = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.pinned = np.zeros(capacity, dtype=bool)
+        self.updated_at = np.zeros(capacity, dtype=np.int64)
+        self.category = np.full(capacity, -1, dtype=np.int32)
+        self.doc_len = np.zeros(capacity, dtype=np.float32)
+        self.categories: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_terms: Dict[int, Dict[str, int]] = {}
+        self.total_len = 0
+        self._term_arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.ivf: Optional[IVFIndex] = None
+        self._ivf_built_at = 0
+        # slots written while a quantizer trains; they are reassigned when it is installed
+        self._ivf_dirty: Optional[Set[int]] = None
+        # held by SearchService around searches and writes that run concurrently
+        self.lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _grow(self) -> None:
+        cap = len(self.alive) * 2
+        for name in ("vectors", "has_vec", "alive", "pinned", "updated_at", "category", "doc_len"):
+            old = getattr(self, name)
+            new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+            if name == "category":
+                new.fill(-1)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        if self.ivf is not None:
+            assign = np.full(cap, -1, dtype=np.int32)
+            assign[:len(self.ivf.assign)] = self.ivf.assign
+            self.ivf.assign = assign
+
+    def _allocate(self, note_id: str) -> int:
+        if self.free:
+            slot = self.free.pop()
+            self.ids[slot] = note_id
+        else:
+            if self.size == len(self.alive):
+                self._grow()
+            slot = self.size
+            self.size += 1
+            self.ids.append(note_id)
+        self.slots[note_id] = slot
+        return slot
+
+    def _drop_terms(self, slot: int) -> None:
+        for term in self.doc_terms.pop(slot, {}):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(slot, None)
+                if not posting:
+                    del self.postings[term]
+            self._term_arrays.pop(term, None)
+        self.total_len -= int(self.doc_len[slot])
+        self.doc_len[slot] = 0
+
+    def upsert(
+        self,
+        note_id: str,
+        text: str,
+        *,
+        tags: Optional[List[str]] = None,
+        category: Optional[str] = None,
+        pinned: bool = False,
+        updated_at: int = 0,
+        vector: Optional[np.ndarray] = None,
+    ) -> None:
+        slot = self.slots.get(note_id)
+        if slot is None:
+            slot = self._allocate(note_id)
+        else:
+            self._drop_terms(slot)
+        # same fields the app's keyword score looks at
+        tokens = tokenize("\n".join([text or "", " ".join(tags or []), category or ""]))
+        counts: Dict[str, int] = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[slot] = tf
+            self._term_arrays.pop(term, None)
+        self.doc_terms[slot] = counts
+        self.doc_len[slot] = len(tokens)
+        self.total_len += len(tokens)
+        self.alive[slot] = True
+        self.pinned[slot] = bool(pinned)
+        self.updated_at[slot] = int(updated_at)
+        self.category[slot] = self.categories.setdefault(category, len(self.categories)) if category else -1
+        if self._ivf_dirty is not None:
+            self._ivf_dirty.add(slot)
+        if vector is not None:
+            self.vectors[slot] = vector
+            self.has_vec[slot] = True
+            if self.ivf is not None:
+                self.ivf.assign[slot] = self.ivf.nearest(vector)
+        else:
+            self.has_vec[slot] = False
+            if self.ivf is not None:
+                self.ivf.assign[slot] = -1
+
+    def remove(self, note_id: str) -> bool:
+        slot = self.slots.pop(note_id, None)
+        if slot is None:
+            return False
+        self._drop_terms(slot)
+        self.alive[slot] = False
+        self.has_vec[slot] = False
+        self.ids[slot] = None
+        if self.ivf is not None:
+            self.ivf.assign[slot] = -1
+        if self._ivf_dirty is not None:
+            self._ivf_dirty.add(slot)
+        self.free.append(slot)
+        return True
+
+    def _term(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._term_arrays.get(term)
+        if arrays is None:
+            posting = self.postings.get(term, {})
+            arrays = (
+                np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float32, count=len(posting)),
+            )
+            self._term_arrays[term] = arrays
+        return arrays
+
+    def keyword_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        n = len(self.slots)
+        if not n:
+            return scores
+        avgdl = max(self.total_len / n, 1e-9)
+        for term in set(tokenize(query)):
+            slots, tfs = self._term(term)
+            if not len(slots):
+                continue
+            idf = math.log(1 + (n - len(slots) + 0.5) / (len(slots) + 0.5))
+            norm = K1 * (1 - B + B * self.doc_len[slots] / avgdl)
+            scores[slots] += idf * tfs * (K1 + 1) / (tfs + norm)
+        return scores
+
+    def ivf_due(self) -> bool:
+        """Whether the quantizer needs (re)training; drops it below `ivf_min_docs`."""
+        n = int((self.has_vec[:self.size] & self.alive[:self.size]).sum())
+        if n < self.ivf_min_docs:
+            self.ivf = None
+            return False
+        # rebuild once the corpus doubled since the last training run
+        return self.ivf is None or n >= 2 * self._ivf_built_at
+
+    def train_ivf(self) -> Tuple[IVFIndex, int]:
+        """Train a quantizer on the current vectors; may run in a thread while writes continue.
+
+        Only reads the index: the caller starts `_ivf_dirty` beforehand, on the
+        thread that does the writes, so slots written meanwhile get reassigned.
+        """
+        size = self.size
+        usable = self.has_vec[:size] & self.alive[:size]
+        n = int(usable.sum())
+        return IVFIndex.build(self.vectors[:size], usable, nlist=int(math.sqrt(n))), n
+
+    def install_ivf(self, ivf: IVFIndex, trained_on: int) -> None:
+        assign = np.full(len(self.alive), -1, dtype=np.int32)
+        assign[:len(ivf.assign)] = ivf.assign
+        for slot in self._ivf_dirty or ():
+            assign[slot] = ivf.nearest(self.vectors[slot]) if self.alive[slot] and self.has_vec[slot] else -1
+        ivf.assign = assign
+        self.ivf = ivf
+        self._ivf_built_at = trained_on
+        self._ivf_dirty = None
+
+    def build_ivf(self) -> None:
+        """Synchronous (re)build, for callers without an event loop."""
+        if self.ivf_due():
+            self._ivf_dirty = set()
+            self.install_ivf(*self.train_ivf())
+
+    def vector_scores(self, query_vec: np.ndarray, keyword_hits: np.ndarray) -> np.ndarray:
+        ivf = self.ivf
+        if ivf is None:
+            sims = self.vectors[:self.size] @ query_vec
+        else:
+            sims = np.zeros(self.size, dtype=np.float32)
+            probes = ivf.probe(query_vec, self.nprobe)
+            rows = np.flatnonzero(np.isin(ivf.assign[:self.size], probes) | keyword_hits)
+            sims[rows] = self.vectors[rows] @ query_vec
+        sims[~self.has_vec[:self.size]] = 0.0
+        return sims
+
+    def search(
+        self,
+        query: str,
+        query_vec: Optional[np.ndarray] = None,
+        *,
+        limit: int = 50,
+        category: Optional[str] = None,
+        date_from: Optional[int] = None,
+        date_to: Optional[int] = None,
+        pinned_only: bool = False,
+    ) -> List[Dict[str, Any]]:
+        n = self.size
+        mask = self.alive[:n].copy()
+        if category:
+            code = self.categories.get(category)
+            if code is None:
+                return []
+            mask &= self.category[:n] == code
+        if date_from:
+            mask &= self.updated_at[:n] >= date_from
+        if date_to:
+            mask &= self.updated_at[:n] <= date_to
+        if pinned_only:
+            mask &= self.pinned[:n]
+
+        if not query.strip():
+            # no query: newest first, like the app without a search term
+            rows = np.flatnonzero(mask)
+            rows = rows[np.argsort(-self.updated_at[rows], kind="stable")][:limit]
+            return [{"id": self.ids[i], "score": 0.0, "keyword": 0.0, "similarity": 0.0} for i in rows]
+
+        keyword = self.keyword_scores(query)
+        sims = self.vector_scores(query_vec, keyword > 0) if query_vec is not None else np.zeros(n, np.float32)
+        scores = KEYWORD_WEIGHT * keyword + VECTOR_WEIGHT * np.maximum(sims, 0)
+        scores[~mask] = 0.0
+        rows = np.flatnonzero(scores > 0)
+        if len(rows) > limit:
+            rows = rows[np.argpartition(-scores[rows], limit - 1)[:limit]]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return [
+            {"id": self.ids[i], "score": float(scores[i]), "keyword": float(keyword[i]), "similarity": float(sims[i])}
+            for i in rows
+        ]
+
+
+class SearchService:
+    """Keeps the indexes of recently active users in memory (LRU).
+
+    With a Mongo collection, notes are stored there as well and an index
+    that is not in memory is rebuilt from it on first use.
+    """
+
+    def __init__(
+        self,
+        collection,
+        dim: int,
+        *,
+        max_users: int = 100,
+        ivf_min_docs: int = 20000,
+        nprobe: int = 8,
+        executor=None,
+    ):
+        self.collection = collection
+        self.dim = dim
+        self.max_users = max_users
+        self.ivf_min_docs = ivf_min_docs
+        self.nprobe = nprobe
+        self._indexes: "OrderedDict[str, SearchIndex]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Lock] = {}
+        # searches and IVF training run here (None: the loop's default executor)
+        self.executor = executor
+        self._ivf_builds: Dict[str, asyncio.Task] = {}
+
+    async def ensure_indexes(self) -> None:
+        if self.collection is not None:
+            await self.collection.create_index([("user", 1), ("updated_at", -1)])
+
+    def _new_index(self) -> SearchIndex:
+        return SearchIndex(self.dim, ivf_min_docs=self.ivf_min_docs, nprobe=self.nprobe)
+
+    def _apply(self, index: SearchIndex, note: Dict[str, Any]) -> None:
+        vec = note.get("vec")
+        index.upsert(
+            note["note_id"],
+            note.get("text") or "",
+            tags=note.get("tags"),
+            category=note.get("category"),
+            pinned=note.get("pinned", False),
+            updated_at=note.get("updated_at", 0),
+            vector=np.frombuffer(vec, dtype="<f4") if vec is not None and len(vec) == 4 * self.dim else None,
+        )
+
+    def _load(self, docs: List[Dict[str, Any]]) -> SearchIndex:
+        index = self._new_index()
+        for doc in docs:
+            self._apply(index, doc)
+        return index
+
+    async def index_for(self, user: str) -> SearchIndex:
+        index = self._indexes.get(user)
+        if index is not None:
+            self._indexes.move_to_end(user)
+            return index
+        lock = self._loading.setdefault(user, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(user)
+            if index is None:
+                docs = []
+                if self.collection is not None:
+                    docs = [doc async for doc in self.collection.find({"user": user}, {"_id": 0})]
+                # tokenizing a large account takes a while; the index is built off the loop
+                # and only published once complete
+                loop = asyncio.get_running_loop()
+                index = await loop.run_in_executor(self.executor, self._load, docs)
+                self._indexes[user] = index
+                while len(self._indexes) > self.max_users:
+                    self._indexes.popitem(last=False)
+        self._loading.pop(user, None)
+        return index
+
+    async def upsert(self, user: str, notes: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """`notes`: dicts with note_id, text, tags, category, pinned, updated_at, deleted, vec (bytes)."""
+        live = [n for n in notes if not n.get("deleted")]
+        gone = [n["note_id"] for n in notes if n.get("deleted")]
+        if self.collection is not None:
+            ops: List[Any] = [
+                ReplaceOne({"_id": f"{user}:{n['note_id']}"},
+                           {"user": user, **{k: v for k, v in n.items() if k != "deleted"}}, upsert=True)
+                for n in live
+            ]
+            if gone:
+                ops.append(DeleteMany({"user": user, "note_id": {"$in": gone}}))
+            if ops:
+                await self.collection.bulk_write(ops, ordered=False)
+        index = await self.index_for(user)
+        async with index.lock:
+            for n in live:
+                self._apply(index, n)
+            removed = sum(index.remove(note_id) for note_id in gone)
+        self._refresh_ivf(user, index)
+        return len(live), removed
+
+    async def search(self, user: str, query: str, query_vec: Optional[np.ndarray] = None,
+                     **filters: Any) -> Tuple[List[Dict[str, Any]], int]:
+        """(results, notes in the index); scoring runs in the executor."""
+        index = await self.index_for(user)
+        loop = asyncio.get_running_loop()
+        async with index.lock:
+            results = await loop.run_in_executor(
+                self.executor, functools.partial(index.search, query, query_vec, **filters))
+        self._refresh_ivf(user, index)
+        return results, len(index)
+
+    def _refresh_ivf(self, user: str, index: SearchIndex) -> None:
+        task = self._ivf_builds.get(user)
+        if (task is None or task.done()) and index.ivf_due():
+            self._ivf_builds[user] = asyncio.create_task(self._build_ivf(user, index))
+
+    async def _build_ivf(self, user: str, index: SearchIndex) -> None:
+        # k-means takes about a second at 20k notes; queries meanwhile use the previous quantizer
+        loop = asyncio.get_running_loop()
+        index._ivf_dirty = set()
+        try:
+            ivf, trained_on = await loop.run_in_executor(self.executor, index.train_ivf)
+        except Exception:
+            index._ivf_dirty = None
+            raise
+        finally:
+            if self._ivf_builds.get(user) is asyncio.current_task():
+                del self._ivf_builds[user]
+        async with index.lock:
+            index.install_ivf(ivf, trained_on)
@@ -1,52 +1,440 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status, Request, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, status, Request, Depends, Query
+from fastapi import Path as FastAPIPath
 from dotenv import load_dotenv
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import sys
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
+import base64
+import gzip
+import hashlib
 import json
-import requests
+import math
+import threading
+import time
+import zlib
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# sibling modules are imported flat, both for `uvicorn server:app` and `backend.server`
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from upstream import UpstreamClient, UpstreamRateLimited  # noqa: E402
+from annotation_cache import AnnotationCache, annotation_cache_key  # noqa: E402
+from neardup import NearDuplicateIndex, patch_annotation  # noqa: E402
+from singleflight import SingleFlight  # noqa: E402
+from ratelimit import GCRALimiter, MongoGCRALimiter, RateLimited  # noqa: E402
+from circuit import CircuitBreaker, CircuitOpen, backoff_delay, is_upstream_failure  # noqa: E402
+from accounts import issue_token, new_account_id, verify_token  # noqa: E402
+from routing import ModelRouter, Route, parse_models, parse_slos  # noqa: E402
+from scheduler import BACKGROUND, BATCH, INTERACTIVE, Admission, FairScheduler, Overloaded, parse_weights  # noqa: E402
+from fallback import FallbackAnnotator, tokenize  # noqa: E402
+from entities import DATA_DIR as GAZETTEER_DIR, EntityExtractor, entity_tags  # noqa: E402
+from chunking import merge_annotations, split_into_chunks  # noqa: E402
+from streaming import IncrementalAnnotationParser, sse_event  # noqa: E402
+from jobs import JobConflict, JobQueue, JobWorkerPool, RetryJob  # noqa: E402
+from metrics import MetricsMiddleware, Registry, SlowRequestProfiler  # noqa: E402
+from warmup import Step, Warmup  # noqa: E402
+from writebatch import WriteBatcher  # noqa: E402
+from embeddings import base64_to_vector, encode_vectors, load_embedder, split_batches  # noqa: E402
+from search import SearchService  # noqa: E402
+from sync import SyncStore  # noqa: E402
+from snapshots import (  # noqa: E402
+    FilesystemChunkStore,
+    GridFSChunkStore,
+    UploadError,
+    UploadStaging,
+    chunk_key,
+    parse_range,
+    slice_chunks,
+    valid_digest,
+)
+from pymongo import WriteConcern  # noqa: E402
+
+# MongoDB connection; nothing connects before the first operation or the startup warm-up,
+# and missing settings fail /readyz instead of the import
+MONGO_URL = os.getenv('MONGO_URL')
+DB_NAME = os.getenv('DB_NAME')
+# connections kept open (and opened during warm-up) so the first requests skip the handshake
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '4'))
+client = AsyncIOMotorClient(
+    MONGO_URL or 'mongodb://localhost:27017', connect=False, minPoolSize=MONGO_MIN_POOL_SIZE)
+db = client[DB_NAME or 'offline_notes']
 
 EMERGENT_LLM_KEY = os.getenv('EMERGENT_LLM_KEY')
 EMERGENT_LLM_BASE_URL = os.getenv('EMERGENT_LLM_BASE_URL', 'https://api.emergent-llm.gateway/v1')
 EMERGENT_DEFAULT_MODEL = os.getenv('EMERGENT_DEFAULT_MODEL', 'gpt-4o-mini')
 AI_TIMEOUT_SECONDS = int(os.getenv('AI_TIMEOUT_SECONDS', '25'))
+# model routing: `name=tier,...` (higher tier = better); empty means EMERGENT_DEFAULT_MODEL only
+AI_MODELS = os.getenv('AI_MODELS', '')
+AI_ROUTING_BASE_TIER = int(os.getenv('AI_ROUTING_BASE_TIER', '1'))
+AI_ROUTING_LONG_INPUT_CHARS = int(os.getenv('AI_ROUTING_LONG_INPUT_CHARS', '4000'))
+AI_ROUTING_MIN_TOKENS = int(os.getenv('AI_ROUTING_MIN_TOKENS', '200'))
+AI_ROUTING_MAX_TOKENS = int(os.getenv('AI_ROUTING_MAX_TOKENS', '400'))
+AI_ROUTING_MAX_ERROR_RATE = float(os.getenv('AI_ROUTING_MAX_ERROR_RATE', '0.5'))
+# latency SLOs per route (annotate, stream, batch, jobs) as `route=ms,...`
+AI_ROUTE_SLOS_MS = os.getenv('AI_ROUTE_SLOS_MS', '')
 AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', '2'))
+AI_BACKOFF_BASE_SECONDS = float(os.getenv('AI_BACKOFF_BASE_SECONDS', '1.5'))
+AI_BACKOFF_MAX_SECONDS = float(os.getenv('AI_BACKOFF_MAX_SECONDS', '10'))
+AI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', '5'))
+AI_CIRCUIT_RECOVERY_SECONDS = float(os.getenv('AI_CIRCUIT_RECOVERY_SECONDS', '30'))
+AI_CIRCUIT_HALF_OPEN_MAX_CALLS = int(os.getenv('AI_CIRCUIT_HALF_OPEN_MAX_CALLS', '1'))
 RATE_LIMIT_PER_MIN = int(os.getenv('AI_RATE_LIMIT_PER_MIN', '30'))
+RATE_LIMIT_BURST = int(os.getenv('AI_RATE_LIMIT_BURST', str(RATE_LIMIT_PER_MIN)))
+# ip | api_key (X-API-Key header) | header:<Name>
+RATE_LIMIT_KEY = os.getenv('AI_RATE_LIMIT_KEY', 'ip')
+# memory (per worker) | mongo (shared across workers)
+RATE_LIMIT_BACKEND = os.getenv('AI_RATE_LIMIT_BACKEND', 'memory')
+AI_CONNECT_TIMEOUT_SECONDS = float(os.getenv('AI_CONNECT_TIMEOUT_SECONDS', '5'))
+AI_POOL_MAX_CONNECTIONS = int(os.getenv('AI_POOL_MAX_CONNECTIONS', '100'))
+AI_POOL_MAX_KEEPALIVE = int(os.getenv('AI_POOL_MAX_KEEPALIVE', '20'))
+# admission control: global cap on concurrent upstream calls, fair queuing per client key
+AI_SCHED_MAX_INFLIGHT = int(os.getenv('AI_SCHED_MAX_INFLIGHT', '32'))
+AI_SCHED_CLIENT_WEIGHTS = os.getenv('AI_SCHED_CLIENT_WEIGHTS', '')
+# longest queue wait before the fallback is returned instead; X-Deadline-Ms may lower it
+AI_SCHED_INTERACTIVE_DEADLINE_SECONDS = float(os.getenv('AI_SCHED_INTERACTIVE_DEADLINE_SECONDS', '3'))
+AI_SCHED_BATCH_DEADLINE_SECONDS = float(os.getenv('AI_SCHED_BATCH_DEADLINE_SECONDS', '30'))
+AI_HTTP2 = os.getenv('AI_HTTP2', '1') == '1'
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '2048'))
+AI_CACHE_TTL_SECONDS = int(os.getenv('AI_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+AI_CACHE_MONGO = os.getenv('AI_CACHE_MONGO', '1') == '1'
+AI_CACHE_MONGO_TIMEOUT_MS = int(os.getenv('AI_CACHE_MONGO_TIMEOUT_MS', '100'))
+# reuse the annotation of an earlier text with word-set Jaccard >= threshold; 0 entries disables
+AI_NEARDUP_MAX_ENTRIES = int(os.getenv('AI_NEARDUP_MAX_ENTRIES', '4096'))
+AI_NEARDUP_THRESHOLD = float(os.getenv('AI_NEARDUP_THRESHOLD', '0.8'))
+AI_BATCH_MAX_ITEMS = int(os.getenv('AI_BATCH_MAX_ITEMS', '100'))
+AI_BATCH_CONCURRENCY = int(os.getenv('AI_BATCH_CONCURRENCY', '8'))
+AI_FALLBACK_STATS_PATH = os.getenv('AI_FALLBACK_STATS_PATH')
+# gazetteers (<type>.txt) for entity extraction, compiled once at startup
+AI_GAZETTEER_DIR = os.getenv('AI_GAZETTEER_DIR', str(GAZETTEER_DIR))
+AI_ENTITIES_MAX = int(os.getenv('AI_ENTITIES_MAX', '30'))
+# longer texts are scanned for entities in a worker thread instead of on the event loop
+AI_ENTITIES_OFFLOAD_CHARS = int(os.getenv('AI_ENTITIES_OFFLOAD_CHARS', '8000'))
+# texts longer than the threshold are annotated chunk-wise (map) and merged (reduce)
+AI_CHUNK_THRESHOLD_CHARS = int(os.getenv('AI_CHUNK_THRESHOLD_CHARS', '12000'))
+AI_CHUNK_MAX_CHARS = int(os.getenv('AI_CHUNK_MAX_CHARS', '6000'))
+AI_CHUNK_CONCURRENCY = int(os.getenv('AI_CHUNK_CONCURRENCY', '4'))
+# background annotation jobs (Mongo queue); worker count is independent of HTTP concurrency
+AI_JOBS_ENABLED = os.getenv('AI_JOBS_ENABLED', '1') == '1'
+AI_JOBS_CONCURRENCY = int(os.getenv('AI_JOBS_CONCURRENCY', '4'))
+AI_JOBS_LEASE_SECONDS = float(os.getenv('AI_JOBS_LEASE_SECONDS', '60'))
+AI_JOBS_MAX_ATTEMPTS = int(os.getenv('AI_JOBS_MAX_ATTEMPTS', '3'))
+AI_JOBS_POLL_SECONDS = float(os.getenv('AI_JOBS_POLL_SECONDS', '1'))
+AI_JOBS_RESULT_TTL_SECONDS = int(os.getenv('AI_JOBS_RESULT_TTL_SECONDS', str(24 * 3600)))
+AI_JOBS_MAX_WAIT_SECONDS = float(os.getenv('AI_JOBS_MAX_WAIT_SECONDS', '30'))
+STATUS_PAGE_MAX = int(os.getenv('STATUS_PAGE_MAX', '1000'))
+STATUS_STREAM_BATCH_SIZE = int(os.getenv('STATUS_STREAM_BATCH_SIZE', '500'))
+# single status writes are grouped into one insert_many per flush window
+WRITE_BATCH_MAX = int(os.getenv('WRITE_BATCH_MAX', '500'))
+WRITE_BATCH_FLUSH_MS = float(os.getenv('WRITE_BATCH_FLUSH_MS', '10'))
+INGEST_MAX_EVENTS = int(os.getenv('INGEST_MAX_EVENTS', '5000'))
+# write concern for ingest writes: w=1 | majority | <n>, j=journaled
+WRITE_CONCERN_W = os.getenv('WRITE_CONCERN_W', '1')
+WRITE_CONCERN_J = os.getenv('WRITE_CONCERN_J', 'false').lower() in ('1', 'true', 'yes')
+# hash (same vectors as the app's on-device fallback) | onnx (EMBED_MODEL_DIR)
+EMBED_BACKEND = os.getenv('EMBED_BACKEND', 'hash')
+EMBED_MODEL_DIR = os.getenv('EMBED_MODEL_DIR')
+EMBED_MAX_TEXTS = int(os.getenv('EMBED_MAX_TEXTS', '1024'))
+EMBED_MAX_CHARS = int(os.getenv('EMBED_MAX_CHARS', '2000000'))
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '128'))
+EMBED_THREADS = int(os.getenv('EMBED_THREADS', '2'))
+# /api/embed has its own bucket (same key and backend as the AI limiter), so embedding cannot use up the annotate budget
+EMBED_RATE_LIMIT_PER_MIN = int(os.getenv('EMBED_RATE_LIMIT_PER_MIN', '120'))
+EMBED_RATE_LIMIT_BURST = int(os.getenv('EMBED_RATE_LIMIT_BURST', str(EMBED_RATE_LIMIT_PER_MIN)))
+# opt-in server-side note search; indexes of recently active users stay in memory
+SEARCH_MONGO = os.getenv('SEARCH_MONGO', '1') == '1'
+SEARCH_MAX_USERS = int(os.getenv('SEARCH_MAX_USERS', '100'))
+SEARCH_MAX_NOTES = int(os.getenv('SEARCH_MAX_NOTES', '1000'))
+SEARCH_IVF_MIN_DOCS = int(os.getenv('SEARCH_IVF_MIN_DOCS', '20000'))
+SEARCH_NPROBE = int(os.getenv('SEARCH_NPROBE', '8'))
+SYNC_MAX_CHANGES = int(os.getenv('SYNC_MAX_CHANGES', '1000'))
+SYNC_PULL_MAX = int(os.getenv('SYNC_PULL_MAX', '1000'))
+SYNC_MAX_PAYLOAD_CHARS = int(os.getenv('SYNC_MAX_PAYLOAD_CHARS', '2000000'))
+SYNC_GZIP_MIN_BYTES = int(os.getenv('SYNC_GZIP_MIN_BYTES', '1024'))
+# push bodies: cap on the bytes received and, for gzip, on the bytes they inflate to
+SYNC_MAX_BODY_BYTES = int(os.getenv('SYNC_MAX_BODY_BYTES', str(32 * 1024 * 1024)))
+SYNC_MAX_DECOMPRESSED_BYTES = int(os.getenv('SYNC_MAX_DECOMPRESSED_BYTES', str(64 * 1024 * 1024)))
+# payload bytes per pull page; a page still holds at least one record
+SYNC_PULL_MAX_BYTES = int(os.getenv('SYNC_PULL_MAX_BYTES', str(8 * 1024 * 1024)))
+SYNC_INFLIGHT_TIMEOUT_SECONDS = float(os.getenv('SYNC_INFLIGHT_TIMEOUT_SECONDS', '60'))
+# encrypted backup snapshots: chunk store 'fs' (SNAPSHOT_DIR) or 'gridfs'; partial uploads always stage on disk
+SNAPSHOT_STORE = os.getenv('SNAPSHOT_STORE', 'fs')
+SNAPSHOT_DIR = Path(os.getenv('SNAPSHOT_DIR', str(ROOT_DIR / 'data' / 'snapshots')))
+SNAPSHOT_MAX_CHUNK_BYTES = int(os.getenv('SNAPSHOT_MAX_CHUNK_BYTES', str(16 * 1024 * 1024)))
+SNAPSHOT_MAX_CHUNKS = int(os.getenv('SNAPSHOT_MAX_CHUNKS', '100000'))
+# signs the bearer tokens of opt-in accounts (search, sync, snapshots); unset disables those APIs
+ACCOUNT_TOKEN_SECRET = os.getenv('ACCOUNT_TOKEN_SECRET', '')
+# fraction of requests to run under cProfile; profiles slower than the threshold are logged
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_SECONDS = float(os.getenv('PROFILE_SLOW_SECONDS', '1'))
+# per-step limit for the background warm-up; /readyz stays 503 until it has finished
+STARTUP_WARM_TIMEOUT_SECONDS = float(os.getenv('STARTUP_WARM_TIMEOUT_SECONDS', '5'))
+READY_MONGO_TIMEOUT_MS = int(os.getenv('READY_MONGO_TIMEOUT_MS', '500'))
+
+# Prometheus metrics, exposed at /metrics
+metrics_registry = Registry()
+http_request_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"])
+annotate_stage_seconds = metrics_registry.histogram(
+    "ai_annotate_stage_seconds", "Latency of annotate hot-path stages", ["stage"])
+embed_stage_seconds = metrics_registry.histogram(
+    "embed_stage_seconds", "Latency of /api/embed stages", ["stage"])
+upstream_retries_total = metrics_registry.counter(
+    "ai_upstream_retries_total", "Upstream LLM call retries")
+upstream_429_total = metrics_registry.counter(
+    "ai_upstream_429_total", "Upstream LLM 429 responses")
+fallbacks_total = metrics_registry.counter(
+    "ai_fallbacks_total", "Deterministic fallback annotations by reason", ["reason"])
+rate_limit_rejections_total = metrics_registry.counter(
+    "ai_rate_limit_rejections_total", "Requests rejected by rate_guard", ["budget"])
+annotation_cache_total = metrics_registry.counter(
+    "ai_annotation_cache_total", "Annotation cache lookups by result", ["result"])
+mongo_operation_seconds = metrics_registry.histogram(
+    "mongo_operation_seconds", "Mongo operation latency", ["operation"])
+startup_seconds = metrics_registry.gauge(
+    "app_startup_seconds", "Duration of startup phases and warm-up steps", ["phase"])
+
+# shared keep-alive pool for the LLM gateway, opened/closed with the app
+upstream = UpstreamClient(
+    EMERGENT_LLM_BASE_URL,
+    EMERGENT_LLM_KEY,
+    max_connections=AI_POOL_MAX_CONNECTIONS,
+    max_keepalive=AI_POOL_MAX_KEEPALIVE,
+    connect_timeout=AI_CONNECT_TIMEOUT_SECONDS,
+    read_timeout=AI_TIMEOUT_SECONDS,
+    http2=AI_HTTP2,
+    observe=lambda stage, seconds: annotate_stage_seconds.observe(seconds, stage=stage),
+)
+
+# fail fast to the deterministic fallback while the gateway is down
+upstream_breaker = CircuitBreaker(
+    failure_threshold=AI_CIRCUIT_FAILURE_THRESHOLD,
+    recovery_timeout=AI_CIRCUIT_RECOVERY_SECONDS,
+    half_open_max_calls=AI_CIRCUIT_HALF_OPEN_MAX_CALLS,
+)
+
+# picks model and max_tokens per request from tiers and live latency/error EWMAs
+model_router = ModelRouter(
+    parse_models(AI_MODELS, EMERGENT_DEFAULT_MODEL),
+    base_tier=AI_ROUTING_BASE_TIER,
+    long_input_chars=AI_ROUTING_LONG_INPUT_CHARS,
+    min_tokens=AI_ROUTING_MIN_TOKENS,
+    max_tokens=AI_ROUTING_MAX_TOKENS,
+    slos=parse_slos(AI_ROUTE_SLOS_MS),
+    max_error_rate=AI_ROUTING_MAX_ERROR_RATE,
+)
+
+# every upstream call waits here for a slot; interactive before batch before background jobs
+upstream_scheduler = FairScheduler(AI_SCHED_MAX_INFLIGHT, weights=parse_weights(AI_SCHED_CLIENT_WEIGHTS))
+
+# content-addressed cache of successful LLM annotations (LRU + Mongo TTL collection)
+annotation_cache = AnnotationCache(
+    db.annotation_cache if AI_CACHE_MONGO else None,
+    max_entries=AI_CACHE_MAX_ENTRIES,
+    ttl_seconds=AI_CACHE_TTL_SECONDS,
+    mongo_timeout=AI_CACHE_MONGO_TIMEOUT_MS / 1000,
+)
+
+# MinHash/LSH over recently annotated texts, for small edits the exact cache misses
+near_duplicates = NearDuplicateIndex(AI_NEARDUP_MAX_ENTRIES, AI_NEARDUP_THRESHOLD)
+
+# the fallback annotator, entity extractor and embedder read statistics, gazetteers and
+# models from disk; the "models"/"embedder" warm-up steps build them off the event loop,
+# and whatever a request needs first is built on first use. Not at import time.
+_fallback_annotator: Optional[FallbackAnnotator] = None
+_entity_extractor: Optional[EntityExtractor] = None
+_embedder = None
+_models_lock = threading.Lock()
+
+def get_fallback_annotator() -> FallbackAnnotator:
+    # offline keyword/summary extraction for the no-LLM path
+    global _fallback_annotator
+    if _fallback_annotator is None:
+        with _models_lock:
+            if _fallback_annotator is None:
+                _fallback_annotator = FallbackAnnotator(stats_path=AI_FALLBACK_STATS_PATH)
+    return _fallback_annotator
+
+def get_entity_extractor() -> EntityExtractor:
+    # one Aho-Corasick pass over the text for gazetteer entities, plus date/amount/email/phone patterns
+    global _entity_extractor
+    if _entity_extractor is None:
+        with _models_lock:
+            if _entity_extractor is None:
+                _entity_extractor = EntityExtractor.from_dir(Path(AI_GAZETTEER_DIR))
+    return _entity_extractor
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _models_lock:
+            if _embedder is None:
+                _embedder = load_embedder(EMBED_BACKEND, EMBED_MODEL_DIR, threads=EMBED_THREADS)
+    return _embedder
+
+# identical annotations already in flight share one upstream call
+annotation_flights = SingleFlight()
+
+job_queue = JobQueue(
+    db.ai_jobs,
+    lease_seconds=AI_JOBS_LEASE_SECONDS,
+    max_attempts=AI_JOBS_MAX_ATTEMPTS,
+    result_ttl_seconds=AI_JOBS_RESULT_TTL_SECONDS,
+)
+
+ingest_write_concern = WriteConcern(
+    w=int(WRITE_CONCERN_W) if WRITE_CONCERN_W.isdigit() else WRITE_CONCERN_W,
+    j=WRITE_CONCERN_J,
+)
+
+def make_writer(collection_name: str) -> WriteBatcher:
+    return WriteBatcher(
+        db.get_collection(collection_name, write_concern=ingest_write_concern),
+        max_batch=WRITE_BATCH_MAX,
+        flush_interval=WRITE_BATCH_FLUSH_MS / 1000,
+        observe=lambda seconds: mongo_operation_seconds.observe(seconds, operation=f"{collection_name}.insert_many"),
+    )
+
+status_writer = make_writer("status_checks")
+audit_writer = make_writer("audit_events")
+
+# embedding work runs off the event loop; NumPy releases the GIL for the heavy parts
+embed_executor = ThreadPoolExecutor(max_workers=EMBED_THREADS, thread_name_prefix="embed")
+
+# indexes are sized by the embedder, so the service is built with it
+search_service: Optional[SearchService] = None
+
+def get_search_service() -> SearchService:
+    global search_service
+    if search_service is None:
+        search_service = SearchService(
+            db.search_notes if SEARCH_MONGO else None,
+            get_embedder().dim,
+            max_users=SEARCH_MAX_USERS,
+            ivf_min_docs=SEARCH_IVF_MIN_DOCS,
+            nprobe=SEARCH_NPROBE,
+        )
+    return search_service
+
+# delta sync of client-encrypted records, cursor = per-account sequence
+sync_store = SyncStore(
+    db.sync_records,
+    db.sync_counters,
+    db.sync_devices,
+    inflight_timeout=SYNC_INFLIGHT_TIMEOUT_SECONDS,
+)
+
+# content-addressed snapshot chunks + per-account manifests (db.snapshots)
+snapshot_chunks = (
+    GridFSChunkStore(db) if SNAPSHOT_STORE == 'gridfs' else FilesystemChunkStore(SNAPSHOT_DIR / 'chunks')
+)
+snapshot_staging = UploadStaging(SNAPSHOT_DIR / 'partial', SNAPSHOT_MAX_CHUNK_BYTES)
+
+# connection pools, indexes and the embedder are warmed behind the server, not in front of it
+warmup = Warmup(
+    STARTUP_WARM_TIMEOUT_SECONDS, observe=lambda phase, seconds: startup_seconds.set(seconds, phase=phase))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# simple in-memory rate limiter per client IP
-_rate: Dict[str, List[datetime]] = {}
+# token-bucket (GCRA) rate limiter, O(1) state per key with idle-key eviction
+_local_rate_limiter = GCRALimiter(RATE_LIMIT_PER_MIN, RATE_LIMIT_BURST)
+rate_limiter = (
+    MongoGCRALimiter(db.rate_limits, RATE_LIMIT_PER_MIN, RATE_LIMIT_BURST, fallback=_local_rate_limiter)
+    if RATE_LIMIT_BACKEND == 'mongo' else _local_rate_limiter
+)
+_local_embed_rate_limiter = GCRALimiter(EMBED_RATE_LIMIT_PER_MIN, EMBED_RATE_LIMIT_BURST)
+embed_rate_limiter = (
+    MongoGCRALimiter(
+        db.embed_rate_limits, EMBED_RATE_LIMIT_PER_MIN, EMBED_RATE_LIMIT_BURST, fallback=_local_embed_rate_limiter)
+    if RATE_LIMIT_BACKEND == 'mongo' else _local_embed_rate_limiter
+)
+
+def rate_limit_key(req: Request) -> str:
+    ip = req.client.host if req.client else 'unknown'
+    header = None
+    if RATE_LIMIT_KEY == 'api_key':
+        header = 'x-api-key'
+    elif RATE_LIMIT_KEY.startswith('header:'):
+        header = RATE_LIMIT_KEY.split(':', 1)[1]
+    value = req.headers.get(header) if header else None
+    if not value:
+        return f"ip:{ip}"
+    # never persist raw keys in the shared limiter collection
+    return "key:" + hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+
+def bearer_account(req: Request) -> Optional[str]:
+    if not ACCOUNT_TOKEN_SECRET:
+        return None
+    scheme, _, token = req.headers.get("authorization", "").partition(" ")
+    return verify_token(ACCOUNT_TOKEN_SECRET, token.strip()) if scheme.lower() == "bearer" else None
+
+def request_user(req: Request) -> str:
+    # the account comes from a server-signed token, never from a client-asserted id
+    if not ACCOUNT_TOKEN_SECRET:
+        raise HTTPException(status_code=503, detail="Accounts are not configured (ACCOUNT_TOKEN_SECRET)")
+    account = bearer_account(req)
+    if account is None:
+        raise HTTPException(
+            status_code=401, detail="Missing or invalid account token", headers={"WWW-Authenticate": "Bearer"})
+    return account
+
+def caller_scope(req: Request) -> str:
+    # who owns a job: the API key or account when there is one (stable across network
+    # changes), else the rate-limit key, so anonymous clients never share jobs
+    api_key = req.headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]
+    account = bearer_account(req)
+    return f"account:{account}" if account else rate_limit_key(req)
 
-def rate_guard(ip: str):
-  now = datetime.utcnow()
-  window = now - timedelta(minutes=1)
-  lst = _rate.get(ip, [])
-  lst = [t for t in lst if t > window]
-  if len(lst) >= RATE_LIMIT_PER_MIN:
-    _rate[ip] = lst
-    raise HTTPException(status_code=429, detail="AI rate limit exceeded")
-  lst.append(now)
-  _rate[ip] = lst
+def admission_for(req: Request, priority: str) -> Admission:
+    limit = AI_SCHED_INTERACTIVE_DEADLINE_SECONDS if priority == INTERACTIVE else AI_SCHED_BATCH_DEADLINE_SECONDS
+    try:
+        requested = float(req.headers.get("x-deadline-ms", "")) / 1000
+    except ValueError:
+        requested = limit
+    return Admission(rate_limit_key(req), priority, time.monotonic() + max(0.0, min(limit, requested)))
+
+async def rate_guard(req: Request, cost: int = 1, budget: str = "annotate"):
+    # budget: annotate (AI endpoints) | embed (/api/embed, own bucket and stage metrics)
+    limiter, stages = (embed_rate_limiter, embed_stage_seconds) if budget == "embed" else (
+        rate_limiter, annotate_stage_seconds)
+    try:
+        with stages.time(stage="rate_guard"):
+            await limiter.acquire(rate_limit_key(req), cost)
+    except RateLimited as e:
+        rate_limit_rejections_total.inc(budget=budget)
+        headers = None
+        if e.retry_after is not None and math.isfinite(e.retry_after):
+            headers = {"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        detail = "Embedding rate limit exceeded" if budget == "embed" else "AI rate limit exceeded"
+        raise HTTPException(status_code=429, detail=detail, headers=headers)
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -57,20 +445,188 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class StatusCheckBulkRequest(BaseModel):
+    # client-generated ids make replays after an offline period idempotent
+    events: List[StatusCheck] = Field(min_length=1, max_length=INGEST_MAX_EVENTS)
+
+class AuditEvent(BaseModel):
+    id: str = Field(min_length=1, max_length=128)
+    at: int  # epoch millis, as recorded on the device
+    action: str = Field(min_length=1, max_length=128)
+    meta: Optional[Any] = None
+
+class AuditBulkRequest(BaseModel):
+    events: List[AuditEvent] = Field(min_length=1, max_length=INGEST_MAX_EVENTS)
+
+class BulkIngestResponse(BaseModel):
+    received: int
+    inserted: int
+    duplicates: int
+    errors: List[Dict[str, Any]] = []
+
 class AnnotationRequest(BaseModel):
     text: str = Field(min_length=1, max_length=50000)
     model: Optional[str] = None
     custom_categories: Optional[List[str]] = None
     include_confidence: bool = True
+    use_cache: bool = True
+    # None: chunk automatically above AI_CHUNK_THRESHOLD_CHARS
+    chunked: Optional[bool] = None
+    # False: annotate locally only, the text never goes to the upstream
+    ai_opt_in: bool = True
+
+class Entity(BaseModel):
+    text: str
+    type: str
+    normalized: Optional[str] = None
+    start: int
+    end: int
 
 class AnnotationResponse(BaseModel):
     categories: List[str]
     tags: List[str]
     summary: str
+    entities: List[Entity] = []
     confidence: Optional[float] = None
     processing_time: Optional[float] = None
     metadata: Optional[dict] = None
 
+class AnnotationJob(BaseModel):
+    id: str
+    status: str
+    attempts: int = 0
+    result: Optional[AnnotationResponse] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class EmbedRequest(BaseModel):
+    texts: List[str] = Field(min_length=1, max_length=EMBED_MAX_TEXTS)
+
+class EmbedResponse(BaseModel):
+    model: str
+    dim: int
+    # base64 of little-endian float32, the layout float32ToBlob stores on the device
+    encoding: str = "float32-le-base64"
+    vectors: List[str]
+    processing_time: float
+
+class AccountToken(BaseModel):
+    account_id: str
+    # send as `Authorization: Bearer <token>` to the search, sync and snapshot APIs
+    token: str
+
+class SearchNote(BaseModel):
+    id: str = Field(min_length=1, max_length=200)
+    text: str = Field("", max_length=50000)
+    tags: List[str] = []
+    category: Optional[str] = None
+    pinned: bool = False
+    updated_at: int = 0  # epoch millis, like notes.updatedAt on the device
+    deleted: bool = False
+    # float32-le-base64 as returned by /api/embed; computed server-side when missing
+    vector: Optional[str] = None
+
+class SearchNotesRequest(BaseModel):
+    notes: List[SearchNote] = Field(min_length=1, max_length=SEARCH_MAX_NOTES)
+
+class SearchNotesResponse(BaseModel):
+    upserted: int
+    removed: int
+    embedded: int
+
+class SearchRequest(BaseModel):
+    query: str = Field("", max_length=1000)
+    category: Optional[str] = None
+    date_from: Optional[int] = None
+    date_to: Optional[int] = None
+    pinned_only: bool = False
+    limit: int = Field(50, ge=1, le=500)
+
+class SearchHit(BaseModel):
+    id: str
+    score: float
+    keyword: float
+    similarity: float
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+    total: int
+    processing_time: float
+
+class SyncChange(BaseModel):
+    id: str = Field(min_length=1, max_length=200)
+    kind: str = Field("note", pattern="^[a-z_]{1,32}$")
+    updated_at: int = Field(ge=0)  # epoch millis, notes.updatedAt
+    deleted_at: Optional[int] = None  # tombstone, notes.deletedAt
+    # opaque client-encrypted blob (base64); the server never looks inside
+    payload: Optional[str] = Field(None, max_length=SYNC_MAX_PAYLOAD_CHARS)
+
+class SyncPushRequest(BaseModel):
+    device_id: str = Field(min_length=1, max_length=200)
+    changes: List[SyncChange] = Field(min_length=1, max_length=SYNC_MAX_CHANGES)
+
+class SyncPushResponse(BaseModel):
+    accepted: int
+    # ids whose server copy is as new or newer; pull to get it
+    stale: List[str]
+    # account-wide progress after the push; not a pull cursor (other devices'
+    # changes below it may not have been pulled yet)
+    watermark: int
+
+class SyncRecord(BaseModel):
+    id: str
+    kind: str
+    updated_at: Optional[int] = None
+    deleted_at: Optional[int] = None
+    payload: Optional[str] = None
+    seq: int
+
+class SyncPullResponse(BaseModel):
+    changes: List[SyncRecord]
+    cursor: int
+    has_more: bool
+
+SHA256_PATTERN = r'^[0-9a-f]{64}$'
+
+class SnapshotChunkQuery(BaseModel):
+    hashes: List[str] = Field(min_length=1, max_length=SNAPSHOT_MAX_CHUNKS)
+
+class SnapshotChunkRef(BaseModel):
+    hash: str = Field(pattern=SHA256_PATTERN)
+    size: int = Field(ge=1, le=SNAPSHOT_MAX_CHUNK_BYTES)
+
+class SnapshotManifestInput(BaseModel):
+    chunks: List[SnapshotChunkRef] = Field(min_length=1, max_length=SNAPSHOT_MAX_CHUNKS)
+    label: Optional[str] = Field(default=None, max_length=200)
+
+class SnapshotManifest(SnapshotManifestInput):
+    id: str
+    size: int
+    created_at: datetime
+
+class SnapshotSummary(BaseModel):
+    id: str
+    size: int
+    chunk_count: int
+    label: Optional[str] = None
+    created_at: datetime
+
+class BatchAnnotationItem(AnnotationRequest):
+    id: str = Field(min_length=1, max_length=200)
+
+class BatchAnnotationRequest(BaseModel):
+    items: List[BatchAnnotationItem] = Field(min_length=1, max_length=AI_BATCH_MAX_ITEMS)
+    stream: bool = False
+
+class BatchAnnotationResult(BaseModel):
+    id: str
+    result: AnnotationResponse
+
+class BatchAnnotationResponse(BaseModel):
+    results: List[BatchAnnotationResult]
+    processing_time: Optional[float] = None
+
 @api_router.get("/")
 async def root():
     return {"message": "Hello World"}
@@ -79,38 +635,99 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    await status_writer.insert({"_id": status_obj.id, **status_obj.dict()})
     return status_obj
 
+async def bulk_ingest(writer: WriteBatcher, docs: List[Dict[str, Any]]) -> BulkIngestResponse:
+    result = await writer.insert_many(docs)
+    return BulkIngestResponse(
+        received=len(docs),
+        inserted=result.inserted,
+        duplicates=len(result.duplicates),
+        errors=[{"index": i, "id": docs[i]["_id"], "error": msg} for i, msg in sorted(result.errors.items())],
+    )
+
+@api_router.post("/status/bulk", response_model=BulkIngestResponse)
+async def create_status_checks_bulk(input: StatusCheckBulkRequest):
+    return await bulk_ingest(status_writer, [{"_id": ev.id, **ev.dict()} for ev in input.events])
+
+@api_router.post("/audit/bulk", response_model=BulkIngestResponse)
+async def create_audit_events_bulk(input: AuditBulkRequest):
+    received_at = datetime.utcnow()
+    return await bulk_ingest(
+        audit_writer, [{"_id": ev.id, **ev.dict(), "received_at": received_at} for ev in input.events])
+
+STATUS_PROJECTION = {"_id": 0, "id": 1, "client_name": 1, "timestamp": 1}
+STATUS_SORT = [("timestamp", -1), ("id", -1)]
+
+def encode_status_cursor(doc: Dict[str, Any]) -> str:
+    raw = json.dumps([doc["timestamp"].isoformat(), doc["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_status_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, id_ = json.loads(raw)
+        return datetime.fromisoformat(ts), str(id_)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def status_query(
+    client_name: Optional[str], since: Optional[datetime], until: Optional[datetime], cursor: Optional[str]
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    if client_name is not None:
+        query["client_name"] = client_name
+    if since is not None or until is not None:
+        query["timestamp"] = {}
+        if since is not None:
+            query["timestamp"]["$gte"] = since
+        if until is not None:
+            query["timestamp"]["$lt"] = until
+    if cursor:
+        # keyset pagination on (timestamp, id), newest first
+        ts, id_ = decode_status_cursor(cursor)
+        query["$and"] = [{"$or": [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "id": {"$lt": id_}}]}]
+    return query
+
+def status_ndjson_line(doc: Dict[str, Any]) -> str:
+    return json.dumps({**doc, "timestamp": doc["timestamp"].isoformat()}) + "\n"
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    response: Response,
+    limit: int = Query(100, ge=1, le=STATUS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    client_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    query = status_query(client_name, since, until, cursor)
+    if format == "ndjson":
+        # stream straight off the Motor cursor; memory stays flat regardless of collection size
+        find = db.status_checks.find(query, STATUS_PROJECTION).sort(STATUS_SORT).batch_size(STATUS_STREAM_BATCH_SIZE)
 
-@api_router.post("/ai/annotate", response_model=AnnotationResponse)
-async def annotate_text(req: Request, input: AnnotationRequest):
-    # rate guard
-    rate_guard(req.client.host if req.client else 'unknown')
-
-    if not EMERGENT_LLM_KEY:
-        # Privacy-first: no online call, return deterministic fallback below
-        EMERGENT_MISSING = True
-    else:
-        EMERGENT_MISSING = False
-
-    async def call_llm() -> Dict[str, Any]:
-        headers = {
-            "Authorization": f"Bearer {EMERGENT_LLM_KEY}",
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "User-Agent": "offline-notes/ai-annotate"
-        }
-        categories_instruction = (
-            f"Use these categories strictly: {', '.join(input.custom_categories)}"
-            if input.custom_categories else
-            "Choose 1-3 suitable categories (e.g., Business, Private, Health, Travel, Finance)"
-        )
-        user_prompt = f"""
+        async def lines():
+            async for doc in find:
+                yield status_ndjson_line(doc)
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    with mongo_operation_seconds.time(operation="status_checks.find"):
+        docs = await db.status_checks.find(query, STATUS_PROJECTION).sort(STATUS_SORT).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = encode_status_cursor(docs[-1])
+    return [StatusCheck(**status_check) for status_check in docs]
+
+def build_llm_payload(input: AnnotationRequest, model: str, max_tokens: int = 400) -> Dict[str, Any]:
+    categories_instruction = (
+        f"Use these categories strictly: {', '.join(input.custom_categories)}"
+        if input.custom_categories else
+        "Choose 1-3 suitable categories (e.g., Business, Private, Health, Travel, Finance)"
+    )
+    user_prompt = f"""
 You are an expert annotation service. Analyze the text and return ONLY valid JSON with:
 {{
   "categories": [".."],
@@ -125,79 +742,863 @@ Rules:
 - confidence in [0.0, 1.0]
 Text:\n{input.text}
 """
-        payload = {
-            "model": input.model or EMERGENT_DEFAULT_MODEL,
-            "messages": [
-                {"role": "system", "content": "Return structured JSON as requested."},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.2,
-            "response_format": {"type": "json_object"},
-            "max_tokens": 400
-        }
-        url = f"{EMERGENT_LLM_BASE_URL}/chat/completions"
-        r = requests.post(url, headers=headers, json=payload, timeout=AI_TIMEOUT_SECONDS)
-        if r.status_code == 429:
-            raise HTTPException(status_code=429, detail="AI rate limit upstream")
-        r.raise_for_status()
-        return r.json()
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": "Return structured JSON as requested."},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": 0.2,
+        "response_format": {"type": "json_object"},
+        "max_tokens": max_tokens
+    }
 
-    start = datetime.utcnow()
-    # retry with backoff
+def parse_llm_content(data: Any) -> Dict[str, Any]:
+    with annotate_stage_seconds.time(stage="parse"):
+        return _parse_llm_content(data)
+
+def _parse_llm_content(data: Any) -> Dict[str, Any]:
+    content: Optional[str] = None
+    if isinstance(data, dict) and data.get("choices"):
+        content = data["choices"][0]["message"]["content"]
+    elif isinstance(data, dict) and data.get("output"):
+        content = data["output"]
+    if not content:
+        raise ValueError("No content from LLM")
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        txt = content.strip()
+        if txt.startswith("```") and txt.endswith("```"):
+            txt = "\n".join(txt.splitlines()[1:-1]).strip()
+        return json.loads(txt)
+
+def build_summary_payload(summaries: List[str], model: str) -> Dict[str, Any]:
+    parts = "\n".join(f"- {x}" for x in summaries)
+    user_prompt = f"""
+Combine these partial summaries of one long text into a single summary.
+Return ONLY valid JSON: {{"summary": ".."}}
+Rules:
+- 1-2 sentences
+- same language as the summaries
+Partial summaries:\n{parts}
+"""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": "Return structured JSON as requested."},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": 0.2,
+        "response_format": {"type": "json_object"},
+        "max_tokens": 200
+    }
+
+async def call_llm_with_retries(payload: Dict[str, Any], admission: Optional[Admission] = None) -> Dict[str, Any]:
+    admission = admission or Admission("internal")
     last_exc: Optional[Exception] = None
     for attempt in range(AI_MAX_RETRIES + 1):
+        if not upstream_breaker.allow():
+            raise CircuitOpen(upstream_breaker.retry_in())
+        retry_after: Optional[float] = None
+        sent = False
         try:
-            data = await asyncio.wait_for(call_llm(), timeout=AI_TIMEOUT_SECONDS)
-            content: Optional[str] = None
-            if isinstance(data, dict) and data.get("choices"):
-                content = data["choices"][0]["message"]["content"]
-            elif isinstance(data, dict) and data.get("output"):
-                content = data["output"]
-            if not content:
-                raise ValueError("No content from LLM")
-            try:
-                parsed = json.loads(content)
-            except json.JSONDecodeError:
-                txt = content.strip()
-                if txt.startswith("```") and txt.endswith("```"):
-                    txt = "\n".join(txt.splitlines()[1:-1]).strip()
-                parsed = json.loads(txt)
-            dt = (datetime.utcnow() - start).total_seconds()
-            return AnnotationResponse(
-                categories=[str(x) for x in (parsed.get("categories") or [])][:3],
-                tags=[str(x).lower() for x in (parsed.get("tags") or [])][:8],
-                summary=str(parsed.get("summary") or "")[:2000],
-                confidence=(None if not input.include_confidence else float(parsed.get("confidence") or 0.0)),
-                processing_time=dt,
-                metadata={"model": input.model or EMERGENT_DEFAULT_MODEL}
-            )
+            # Overloaded propagates: queueing longer than the deadline ends in the fallback
+            async with upstream_scheduler.slot(admission) as waited:
+                annotate_stage_seconds.observe(waited, stage="queue")
+                t0 = time.monotonic()
+                sent = True
+                try:
+                    data = await asyncio.wait_for(upstream.chat_completion(payload), timeout=AI_TIMEOUT_SECONDS)
+                except Exception:
+                    model_router.observe(payload["model"], time.monotonic() - t0, ok=False)
+                    raise
+        except (Overloaded, asyncio.CancelledError):
+            # shed or cancelled while queued: the breaker's half-open probe was never used
+            if not sent:
+                upstream_breaker.release()
+            raise
         except Exception as e:
             last_exc = e
-            if attempt < AI_MAX_RETRIES:
-                await asyncio.sleep(1.5 * (attempt + 1))
+            retry_after = getattr(e, "retry_after", None)
+            if isinstance(e, UpstreamRateLimited):
+                upstream_429_total.inc()
+            if is_upstream_failure(e):
+                upstream_breaker.record_failure(retry_after)
             else:
+                # any other 4xx (bad request, bad or missing key) fails the same way on every attempt
+                upstream_breaker.record_success()
                 break
+        else:
+            upstream_breaker.record_success()
+            try:
+                parsed = parse_llm_content(data)
+            except Exception as e:
+                last_exc = e
+                model_router.observe(payload["model"], time.monotonic() - t0, ok=False)
+            else:
+                model_router.observe(payload["model"], time.monotonic() - t0, ok=True)
+                return parsed
+        if attempt >= AI_MAX_RETRIES:
+            break
+        delay = backoff_delay(attempt, AI_BACKOFF_BASE_SECONDS, AI_BACKOFF_MAX_SECONDS, retry_after)
+        if delay is None:
+            break
+        upstream_retries_total.inc()
+        await asyncio.sleep(delay)
+    raise last_exc
+
+def llm_annotation(input: AnnotationRequest, parsed: Dict[str, Any], model: str) -> AnnotationResponse:
+    return AnnotationResponse(
+        categories=[str(x) for x in (parsed.get("categories") or [])][:3],
+        tags=[str(x).lower() for x in (parsed.get("tags") or [])][:8],
+        summary=str(parsed.get("summary") or "")[:2000],
+        confidence=(None if not input.include_confidence else float(parsed.get("confidence") or 0.0)),
+        metadata={"model": model}
+    )
+
+def fallback_reason(exc: Optional[Exception]) -> str:
+    if exc is None:
+        return "no_llm"
+    if isinstance(exc, CircuitOpen):
+        return "circuit_open"
+    if isinstance(exc, Overloaded):
+        return "overloaded"
+    if isinstance(exc, UpstreamRateLimited):
+        return "upstream_429"
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if isinstance(exc, (ValueError, json.JSONDecodeError)):
+        return "invalid_response"
+    return "upstream_error"
+
+def annotation_entities(text: str) -> List[Entity]:
+    with annotate_stage_seconds.time(stage="entities"):
+        return [Entity(**e) for e in get_entity_extractor().extract(text, AI_ENTITIES_MAX)]
+
+async def extract_entities(text: str) -> List[Entity]:
+    if len(text) < AI_ENTITIES_OFFLOAD_CHARS:
+        return annotation_entities(text)
+    return await asyncio.get_running_loop().run_in_executor(None, annotation_entities, text)
+
+async def cached_annotation(input: AnnotationRequest, cached: Dict[str, Any]) -> AnnotationResponse:
+    resp = AnnotationResponse(**cached)
+    if "entities" not in cached:
+        # cached before entities were stored with the result
+        resp.entities = await extract_entities(input.text)
+    return resp
 
-    # deterministic fallback
-    text = input.text.strip()
-    words = [w.lower() for w in ''.join([c if c.isalnum() or c.isspace() else ' ' for c in text]).split()]
-    uniq: List[str] = []
-    for w in words:
-        if len(w) > 3 and w not in uniq:
-            uniq.append(w)
-    tags = uniq[:5]
-    categories = input.custom_categories[:2] if input.custom_categories else []
-    summary = (text[:180] + '...') if len(text) > 200 else text
-    dt = (datetime.utcnow() - start).total_seconds()
+def local_annotation(input: AnnotationRequest, entities: Optional[List[Entity]] = None) -> AnnotationResponse:
+    if entities is None:
+        entities = annotation_entities(input.text)
+    with annotate_stage_seconds.time(stage="fallback"):
+        result = get_fallback_annotator().annotate(input.text, input.custom_categories)
+    # named entities make better tags than frequent words, including the words they are made of
+    covered = {token for e in entities for token in tokenize(f"{e.text} {e.normalized}")}
+    keywords = [tag for tag in result["tags"] if tag not in covered]
+    result["tags"] = list(dict.fromkeys(entity_tags([e.dict() for e in entities]) + keywords))[:5]
     return AnnotationResponse(
-        categories=categories,
-        tags=tags,
-        summary=summary,
+        **result,
+        entities=entities,
         confidence=(None if not input.include_confidence else 0.0),
-        processing_time=dt,
-        metadata={"note": "fallback-no-external-llm", "error": str(last_exc)[:200] if last_exc else None}
     )
 
+def fallback_annotation(
+    input: AnnotationRequest, last_exc: Optional[Exception], entities: Optional[List[Entity]] = None
+) -> AnnotationResponse:
+    fallbacks_total.inc(reason=fallback_reason(last_exc))
+    resp = local_annotation(input, entities)
+    resp.metadata = {"note": "fallback-no-external-llm", "error": str(last_exc)[:200] if last_exc else None}
+    return resp
+
+def opted_out_annotation(input: AnnotationRequest, entities: List[Entity]) -> AnnotationResponse:
+    resp = local_annotation(input, entities)
+    resp.metadata = {"note": "local-no-ai-opt-in"}
+    return resp
+
+def use_chunking(input: AnnotationRequest) -> bool:
+    if input.chunked is not None:
+        return input.chunked
+    return len(input.text) > AI_CHUNK_THRESHOLD_CHARS
+
+async def annotate_chunked(
+    input: AnnotationRequest, model: str, admission: Optional[Admission] = None, max_tokens: int = 400
+) -> Tuple[AnnotationResponse, bool]:
+    """Map-reduce annotation; returns (response, degraded).
+
+    Chunks run concurrently; a failed chunk gets the deterministic fallback
+    so the rest still counts. If every chunk fails the last error is raised
+    and the caller falls back for the whole text.
+    """
+    chunks = split_into_chunks(input.text, AI_CHUNK_MAX_CHARS)
+    sem = asyncio.Semaphore(max(1, AI_CHUNK_CONCURRENCY))
+
+    async def run(chunk: str) -> Tuple[AnnotationResponse, Optional[Exception]]:
+        part = input.copy(update={"text": chunk})
+        async with sem:
+            try:
+                parsed = await call_llm_with_retries(build_llm_payload(part, model, max_tokens), admission)
+                return llm_annotation(part, parsed, model), None
+            except Exception as e:
+                return fallback_annotation(part, e), e
+
+    results = await asyncio.gather(*(run(c) for c in chunks))
+    errors = [e for _, e in results if e is not None]
+    if len(errors) == len(results):
+        raise errors[-1]
+
+    merged = merge_annotations(
+        [r.dict() for r, _ in results], [len(c) for c in chunks], input.include_confidence)
+    summaries = [r.summary for r, e in results if e is None and r.summary]
+    summary = summaries[0] if summaries else ""
+    if len(summaries) > 1:
+        try:
+            parsed = await call_llm_with_retries(build_summary_payload(summaries, model), admission)
+            summary = str(parsed.get("summary") or "") or " ".join(summaries)
+        except Exception:
+            summary = get_fallback_annotator().annotate(" ".join(summaries))["summary"]
+    resp = AnnotationResponse(
+        **merged,
+        summary=summary[:2000],
+        metadata={"model": model, "chunks": len(chunks), "chunks_failed": len(errors)}
+    )
+    return resp, bool(errors)
+
+def near_duplicate_namespace(input: AnnotationRequest, model: str, scope: str) -> str:
+    # reuse only within one caller (see caller_scope) and across requests that would
+    # share a cache key apart from the text
+    return scope + "|" + annotation_cache_key("", model, input.custom_categories, input.include_confidence)
+
+def remember_near_duplicate(
+    input: AnnotationRequest, model: str, scope: Optional[str], key: str, result: Dict[str, Any]
+) -> None:
+    if scope is None:
+        return
+    # the summary and entities describe the earlier text; a near hit recomputes them
+    reusable = {k: v for k, v in result.items() if k not in ("summary", "entities")}
+    near_duplicates.add(key, input.text, near_duplicate_namespace(input, model, scope), reusable)
+
+async def near_duplicate_annotation(
+    input: AnnotationRequest, model: str, scope: Optional[str]
+) -> Optional[Tuple[AnnotationResponse, Dict[str, Any]]]:
+    if scope is None:
+        return None
+    match = near_duplicates.lookup(input.text, near_duplicate_namespace(input, model, scope))
+    if match is None:
+        return None
+    value, dropped = patch_annotation(match.value, match.removed)
+    with annotate_stage_seconds.time(stage="fallback"):
+        summary = get_fallback_annotator().annotate(input.text, input.custom_categories)["summary"]
+    resp = AnnotationResponse(**value, summary=summary, entities=await extract_entities(input.text))
+    return resp, {"similarity": round(match.similarity, 3), "of": match.key[:16], "tags_dropped": dropped}
+
+def route_model(input: AnnotationRequest, route: str) -> Route:
+    return model_router.route(input.text, input.custom_categories, requested=input.model, route=route)
+
+async def annotate_one(
+    input: AnnotationRequest, admission: Optional[Admission] = None, route: str = "annotate",
+    scope: Optional[str] = None,
+) -> AnnotationResponse:
+    """`scope` is the caller (see caller_scope); without one nothing is shared as a near duplicate."""
+    start = datetime.utcnow()
+    # the cache key stays on the requested model; routing only picks who answers a miss
+    model = input.model or EMERGENT_DEFAULT_MODEL
+    key = annotation_cache_key(input.text, model, input.custom_categories, input.include_confidence)
+
+    def finish(resp: AnnotationResponse, **meta: Any) -> AnnotationResponse:
+        annotation_cache_total.inc(result=meta.get("cache", "bypass"))
+        resp.metadata = {**(resp.metadata or {}), **meta, "circuit": upstream_breaker.state}
+        resp.processing_time = (datetime.utcnow() - start).total_seconds()
+        return resp
+
+    if not input.ai_opt_in:
+        return finish(opted_out_annotation(input, await extract_entities(input.text)))
+
+    cache_state = "bypass"
+    if input.use_cache:
+        cached, tier = await annotation_cache.get(key)
+        if cached is not None:
+            return finish(await cached_annotation(input, cached), cache="hit", cache_tier=tier)
+        near = await near_duplicate_annotation(input, model, scope)
+        if near is not None:
+            return finish(near[0], cache="near", near_duplicate=near[1])
+        cache_state = "miss"
+
+    routed = route_model(input, route)
+
+    async def fetch() -> Dict[str, Any]:
+        degraded = False
+        if use_chunking(input):
+            resp, degraded = await annotate_chunked(input, routed.model, admission, routed.max_tokens)
+        else:
+            parsed = await call_llm_with_retries(
+                build_llm_payload(input, routed.model, routed.max_tokens), admission)
+            resp = llm_annotation(input, parsed, routed.model)
+        # cached with the result, so hits skip the extraction
+        resp.entities = await extract_entities(input.text)
+        result = resp.dict(exclude={"processing_time"})
+        # partially fallen-back chunked results are not cached as LLM results
+        if input.use_cache and not degraded:
+            await annotation_cache.set(key, result)
+            remember_near_duplicate(input, model, scope, key, result)
+        return result
+
+    # a caller that bypasses the cache or is chunked differently must not get (or write) the other's result
+    flight_key = f"{key}|cache={int(input.use_cache)}|chunked={int(use_chunking(input))}"
+    try:
+        # a leader shed under its own priority and deadline does not take the followers with it
+        result, shared = await annotation_flights.do(flight_key, fetch, retry_on=(Overloaded,))
+    except Exception as e:
+        # deterministic fallback, never cached
+        resp = fallback_annotation(input, e, await extract_entities(input.text))
+        return finish(resp, cache=cache_state, routing=routed.metadata())
+
+    resp = finish(AnnotationResponse(**result), cache=cache_state, routing=routed.metadata())
+    if shared:
+        resp.metadata["coalesced"] = True
+    return resp
+
+@api_router.get("/ai/health")
+async def ai_health():
+    return {
+        "upstream_configured": bool(EMERGENT_LLM_KEY),
+        "circuit": upstream_breaker.snapshot(),
+        "scheduler": upstream_scheduler.snapshot(),
+        "models": model_router.snapshot(),
+    }
+
+@api_router.post("/ai/annotate", response_model=AnnotationResponse)
+async def annotate_text(req: Request, input: AnnotationRequest):
+    # rate guard
+    await rate_guard(req)
+    resp = await annotate_one(input, admission_for(req, INTERACTIVE), scope=caller_scope(req))
+    # serialize once ourselves (and measure it) instead of re-validating via response_model
+    with annotate_stage_seconds.time(stage="serialize"):
+        body = resp.json()
+    return Response(content=body, media_type="application/json")
+
+async def stream_annotation(
+    input: AnnotationRequest, admission: Optional[Admission] = None, route: str = "stream", scope: Optional[str] = None
+):
+    """SSE events: categories, tags, summary (deltas), then one final result.
+
+    The `result` event is authoritative; if the upstream fails mid-stream it
+    carries the deterministic fallback even after partial LLM events.
+    """
+    start = datetime.utcnow()
+    model = input.model or EMERGENT_DEFAULT_MODEL
+
+    def emit_result(resp: AnnotationResponse, **meta: Any):
+        resp.metadata = {**(resp.metadata or {}), **meta, "circuit": upstream_breaker.state}
+        resp.processing_time = (datetime.utcnow() - start).total_seconds()
+        return sse_event("result", resp.dict())
+
+    def emit_all(resp: AnnotationResponse, **meta: Any):
+        yield sse_event("categories", resp.categories)
+        yield sse_event("tags", resp.tags)
+        yield sse_event("summary", {"delta": resp.summary})
+        yield emit_result(resp, **meta)
+
+    if not input.ai_opt_in:
+        for event in emit_all(opted_out_annotation(input, await extract_entities(input.text)), stream="local"):
+            yield event
+        return
+    key = annotation_cache_key(input.text, model, input.custom_categories, input.include_confidence)
+    if input.use_cache:
+        cached, tier = await annotation_cache.get(key)
+        if cached is not None:
+            resp = await cached_annotation(input, cached)
+            for event in emit_all(resp, cache="hit", cache_tier=tier, stream="cached"):
+                yield event
+            return
+        near = await near_duplicate_annotation(input, model, scope)
+        if near is not None:
+            for event in emit_all(near[0], cache="near", near_duplicate=near[1], stream="cached"):
+                yield event
+            return
+    if use_chunking(input):
+        # chunked annotation has no single token stream; send it in one go
+        for event in emit_all(await annotate_one(input, admission, route, scope), stream="buffered"):
+            yield event
+        return
+    if not upstream_breaker.allow():
+        entities = await extract_entities(input.text)
+        resp = fallback_annotation(input, CircuitOpen(upstream_breaker.retry_in()), entities)
+        for event in emit_all(resp, stream="fallback"):
+            yield event
+        return
+
+    routed = route_model(input, route)
+    parser = IncrementalAnnotationParser()
+    sent = set()
+
+    def emit_missing(resp: AnnotationResponse):
+        for name in ("categories", "tags"):
+            if name not in sent:
+                yield sse_event(name, getattr(resp, name))
+        if "summary" not in sent:
+            yield sse_event("summary", {"delta": resp.summary})
+
+    payload = build_llm_payload(input, routed.model, routed.max_tokens)
+    t0 = time.monotonic()
+    sent_request = False
+    try:
+        async with upstream_scheduler.slot(admission or Admission("internal")):
+            t0 = time.monotonic()
+            sent_request = True
+            async for delta in upstream.stream_chat_completion(payload):
+                for name, value in parser.feed(delta):
+                    sent.add(name)
+                    if name == "summary":
+                        value = {"delta": value}
+                    elif name == "categories":
+                        value = [str(x) for x in value][:3]
+                    else:
+                        value = [str(x).lower() for x in value][:8]
+                    yield sse_event(name, value)
+        upstream_breaker.record_success()
+        resp = llm_annotation(input, parse_llm_content({"output": parser.buf}), routed.model)
+    except Exception as e:
+        if is_upstream_failure(e):
+            upstream_breaker.record_failure(getattr(e, "retry_after", None))
+        if not sent_request:
+            upstream_breaker.release()
+        elif not isinstance(e, Overloaded):
+            model_router.observe(routed.model, time.monotonic() - t0, ok=False)
+        # degrade: the final result event carries the deterministic fallback
+        resp = fallback_annotation(input, e, await extract_entities(input.text))
+        for event in emit_missing(resp):
+            yield event
+        yield emit_result(resp, stream="fallback", routing=routed.metadata())
+        return
+    model_router.observe(routed.model, time.monotonic() - t0, ok=True)
+
+    resp.entities = await extract_entities(input.text)
+    if input.use_cache:
+        result = resp.dict(exclude={"processing_time"})
+        await annotation_cache.set(key, result)
+        remember_near_duplicate(input, model, scope, key, result)
+    for event in emit_missing(resp):
+        yield event
+    yield emit_result(resp, cache="miss" if input.use_cache else "bypass", stream="live", routing=routed.metadata())
+
+@api_router.post("/ai/annotate/stream")
+async def annotate_text_stream(req: Request, input: AnnotationRequest):
+    await rate_guard(req)
+    return StreamingResponse(
+        stream_annotation(input, admission_for(req, INTERACTIVE), scope=caller_scope(req)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.post("/ai/annotate/batch", response_model=BatchAnnotationResponse)
+async def annotate_batch(req: Request, input: BatchAnnotationRequest):
+    ids = [item.id for item in input.items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=422, detail="Duplicate item ids in batch")
+    # a batch costs as much rate budget as its items would individually; more than the
+    # burst could never be admitted, so that is a client error rather than a 429 forever
+    if len(input.items) > rate_limiter.burst:
+        raise HTTPException(
+            status_code=413, detail=f"Batch exceeds the rate limit burst of {rate_limiter.burst} items")
+    await rate_guard(req, cost=len(input.items))
+
+    start = datetime.utcnow()
+    sem = asyncio.Semaphore(max(1, AI_BATCH_CONCURRENCY))
+
+    async def run(item: BatchAnnotationItem) -> BatchAnnotationResult:
+        async with sem:
+            # the deadline starts per item, not per batch
+            result = await annotate_one(item, admission_for(req, BATCH), "batch", caller_scope(req))
+            return BatchAnnotationResult(id=item.id, result=result)
+
+    if not input.stream:
+        results = await asyncio.gather(*(run(item) for item in input.items))
+        return BatchAnnotationResponse(
+            results=list(results),
+            processing_time=(datetime.utcnow() - start).total_seconds()
+        )
+
+    async def ndjson():
+        tasks = [asyncio.create_task(run(item)) for item in input.items]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                result = await fut
+                yield result.json() + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+async def run_annotation_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    # queued jobs yield to live requests and wait for a slot as long as it takes; among
+    # themselves they share upstream slots fairly per submitting client
+    admission = Admission(job.get("client") or "jobs", BACKGROUND)
+    resp = await annotate_one(AnnotationRequest(**job["payload"]), admission, "jobs", job.get("owner"))
+    if (resp.metadata or {}).get("note") == "fallback-no-external-llm":
+        # a queued job can afford to wait for the upstream; keep the fallback as last resort
+        raise RetryJob((resp.metadata or {}).get("error") or "fallback", resp.dict())
+    return resp.dict()
+
+job_workers = JobWorkerPool(
+    job_queue, run_annotation_job, concurrency=AI_JOBS_CONCURRENCY, poll_interval=AI_JOBS_POLL_SECONDS)
+
+def annotation_job(doc: Dict[str, Any]) -> AnnotationJob:
+    return AnnotationJob(
+        id=doc["_id"],
+        status=doc["status"],
+        attempts=doc.get("attempts", 0),
+        result=doc.get("result"),
+        error=doc.get("error"),
+        created_at=doc["created_at"],
+        updated_at=doc["updated_at"],
+    )
+
+@api_router.post("/ai/jobs", response_model=AnnotationJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_annotation_job(req: Request, input: AnnotationRequest):
+    await rate_guard(req)
+    owner = caller_scope(req)
+    job_id = None
+    idempotency_key = req.headers.get("idempotency-key")
+    if idempotency_key:
+        # a client retrying after a dropped connection gets the same job back
+        job_id = hashlib.sha256(f"{owner}|{idempotency_key}".encode("utf-8")).hexdigest()[:32]
+    try:
+        doc = await job_queue.enqueue(input.dict(), job_id=job_id, client=rate_limit_key(req), owner=owner)
+    except JobConflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different request")
+    return annotation_job(doc)
+
+@api_router.get("/ai/jobs/{job_id}", response_model=AnnotationJob)
+async def get_annotation_job(req: Request, job_id: str, wait: float = 0):
+    wait = max(0.0, min(wait, AI_JOBS_MAX_WAIT_SECONDS))
+    doc = await job_queue.get(job_id)
+    # someone else's job is reported like a missing one
+    if doc is None or doc.get("owner") != caller_scope(req):
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait:
+        doc = await job_queue.wait(job_id, wait) or doc
+    return annotation_job(doc)
+
+def embed_batch(texts: List[str]) -> List[str]:
+    return encode_vectors(get_embedder().embed(texts))
+
+@api_router.post("/embed", response_model=EmbedResponse)
+async def embed_texts(req: Request, input: EmbedRequest):
+    if sum(len(t) for t in input.texts) > EMBED_MAX_CHARS:
+        raise HTTPException(status_code=413, detail=f"At most {EMBED_MAX_CHARS} characters per request")
+    await rate_guard(req, budget="embed")
+    start = datetime.utcnow()
+    loop = asyncio.get_running_loop()
+    with embed_stage_seconds.time(stage="embed"):
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(embed_executor, embed_batch, batch)
+            for batch in split_batches(input.texts, EMBED_BATCH_SIZE)
+        ))
+    embedder = get_embedder()
+    return EmbedResponse(
+        model=embedder.name,
+        dim=embedder.dim,
+        vectors=[v for part in parts for v in part],
+        processing_time=(datetime.utcnow() - start).total_seconds(),
+    )
+
+@api_router.post("/accounts", response_model=AccountToken, status_code=status.HTTP_201_CREATED)
+async def create_account():
+    if not ACCOUNT_TOKEN_SECRET:
+        raise HTTPException(status_code=503, detail="Accounts are not configured (ACCOUNT_TOKEN_SECRET)")
+    account = new_account_id()
+    return AccountToken(account_id=account, token=issue_token(ACCOUNT_TOKEN_SECRET, account))
+
+@api_router.put("/search/notes", response_model=SearchNotesResponse)
+async def upsert_search_notes(req: Request, input: SearchNotesRequest):
+    user = request_user(req)
+    embedder = get_embedder()
+    vectors: Dict[str, bytes] = {}
+    missing: List[SearchNote] = []
+    for note in input.notes:
+        if note.deleted:
+            continue
+        if note.vector is None:
+            missing.append(note)
+            continue
+        try:
+            vec = base64_to_vector(note.vector)
+        except ValueError:
+            vec = None
+        if vec is None or len(vec) != embedder.dim:
+            raise HTTPException(status_code=400, detail=f"Note {note.id}: vector must be {embedder.dim} float32 values")
+        vectors[note.id] = vec.tobytes()
+    if missing:
+        # the app embeds the note text only (upsertEmbedding)
+        loop = asyncio.get_running_loop()
+        batches = split_batches(missing, EMBED_BATCH_SIZE)
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(embed_executor, embedder.embed, [n.text for n in batch]) for batch in batches
+        ))
+        for batch, matrix in zip(batches, parts):
+            for note, vec in zip(batch, matrix):
+                vectors[note.id] = vec.astype("<f4").tobytes()
+    upserted, removed = await get_search_service().upsert(user, [
+        {
+            "note_id": n.id,
+            "text": n.text,
+            "tags": n.tags,
+            "category": n.category,
+            "pinned": n.pinned,
+            "updated_at": n.updated_at,
+            "deleted": n.deleted,
+            "vec": vectors.get(n.id),
+        }
+        for n in input.notes
+    ])
+    return SearchNotesResponse(upserted=upserted, removed=removed, embedded=len(missing))
+
+@api_router.delete("/search/notes/{note_id}")
+async def delete_search_note(req: Request, note_id: str):
+    _, removed = await get_search_service().upsert(request_user(req), [{"note_id": note_id, "deleted": True}])
+    return {"removed": removed}
+
+@api_router.post("/search", response_model=SearchResponse)
+async def search_notes(req: Request, input: SearchRequest):
+    user = request_user(req)
+    start = datetime.utcnow()
+    query_vec = None
+    if input.query.strip():
+        loop = asyncio.get_running_loop()
+        query_vec = (await loop.run_in_executor(embed_executor, get_embedder().embed, [input.query]))[0]
+    results, total = await get_search_service().search(
+        user,
+        input.query,
+        query_vec,
+        limit=input.limit,
+        category=input.category,
+        date_from=input.date_from,
+        date_to=input.date_to,
+        pinned_only=input.pinned_only,
+    )
+    return SearchResponse(
+        results=[SearchHit(**r) for r in results],
+        total=total,
+        processing_time=(datetime.utcnow() - start).total_seconds(),
+    )
+
+def body_too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+
+async def read_json_body(req: Request, model):
+    # sync clients may gzip large pushes
+    if int(req.headers.get("content-length") or 0) > SYNC_MAX_BODY_BYTES:
+        raise body_too_large(SYNC_MAX_BODY_BYTES)
+    parts = []
+    size = 0
+    async for part in req.stream():
+        size += len(part)
+        if size > SYNC_MAX_BODY_BYTES:
+            raise body_too_large(SYNC_MAX_BODY_BYTES)
+        parts.append(part)
+    raw = b"".join(parts)
+    if req.headers.get("content-encoding", "").lower() == "gzip":
+        # bounded: a few KB of gzip can inflate to gigabytes
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            raw = inflater.decompress(raw, SYNC_MAX_DECOMPRESSED_BYTES)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="Invalid gzip body")
+        if inflater.unconsumed_tail:
+            raise body_too_large(SYNC_MAX_DECOMPRESSED_BYTES)
+        if not inflater.eof:
+            raise HTTPException(status_code=400, detail="Invalid gzip body")
+    try:
+        return model.model_validate_json(raw)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+def compressed_json(req: Request, model: BaseModel) -> Response:
+    body = model.json().encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= SYNC_GZIP_MIN_BYTES and "gzip" in req.headers.get("accept-encoding", "").lower():
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@api_router.post("/sync/push", response_model=SyncPushResponse)
+async def sync_push(req: Request):
+    account = request_user(req)
+    input = await read_json_body(req, SyncPushRequest)
+    accepted, stale, watermark = await sync_store.push(account, input.device_id, [c.dict() for c in input.changes])
+    return compressed_json(req, SyncPushResponse(accepted=accepted, stale=stale, watermark=watermark))
+
+@api_router.get("/sync/pull", response_model=SyncPullResponse)
+async def sync_pull(
+    req: Request,
+    device_id: str = Query(..., min_length=1, max_length=200),
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=SYNC_PULL_MAX),
+):
+    account = request_user(req)
+    docs, next_cursor, has_more = await sync_store.pull(account, device_id, cursor, limit, SYNC_PULL_MAX_BYTES)
+    changes = [SyncRecord(id=d.pop("record_id"), **d) for d in docs]
+    return compressed_json(req, SyncPullResponse(changes=changes, cursor=next_cursor, has_more=has_more))
+
+@api_router.get("/sync/devices")
+async def sync_devices(req: Request):
+    return {"devices": await sync_store.device_states(request_user(req))}
+
+SNAPSHOT_ID_PATTERN = r'^[A-Za-z0-9._-]{1,100}$'
+
+def snapshot_digest(digest: str) -> str:
+    if not valid_digest(digest):
+        raise HTTPException(status_code=400, detail="Chunk id must be a lowercase sha256 hex digest")
+    return digest
+
+def header_int(req: Request, name: str) -> int:
+    try:
+        value = int(req.headers[name])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Missing or invalid {name} header")
+    if value < 0:
+        raise HTTPException(status_code=400, detail=f"Missing or invalid {name} header")
+    return value
+
+def ranged_stream(req: Request, size: int, pieces) -> StreamingResponse:
+    """Stream `pieces(start, end)` for the request's Range header (200, 206 or 416)."""
+    try:
+        byte_range = parse_range(req.headers.get("range"), size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    start, end = byte_range or (0, size - 1)
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start + 1)}
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        pieces(start, end),
+        status_code=206 if byte_range else 200,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
+
+@api_router.post("/snapshots/chunks/missing")
+async def snapshot_missing_chunks(req: Request, input: SnapshotChunkQuery):
+    # the dedupe step: the client uploads only what this returns
+    account = request_user(req)
+    digests = list(dict.fromkeys(snapshot_digest(d) for d in input.hashes))
+    sizes = await snapshot_chunks.sizes([chunk_key(account, d) for d in digests])
+    return {"missing": [d for d in digests if sizes[chunk_key(account, d)] is None]}
+
+@api_router.head("/snapshots/chunks/{digest}")
+async def snapshot_chunk_offset(req: Request, digest: str):
+    key = chunk_key(request_user(req), snapshot_digest(digest))
+    size = (await snapshot_chunks.sizes([key]))[key]
+    if size is not None:
+        return Response(headers={"Upload-Offset": str(size), "Content-Length": str(size)})
+    # not stored yet: the client resumes its upload from here
+    return Response(status_code=404, headers={"Upload-Offset": str(snapshot_staging.offset(key))})
+
+@api_router.patch("/snapshots/chunks/{digest}")
+async def snapshot_upload_chunk(req: Request, digest: str):
+    key = chunk_key(request_user(req), snapshot_digest(digest))
+    offset = header_int(req, "Upload-Offset")
+    total = header_int(req, "Upload-Length")
+    size = (await snapshot_chunks.sizes([key]))[key]
+    if size is not None:
+        return Response(status_code=200, headers={"Upload-Offset": str(size)})
+    try:
+        written, complete = await snapshot_staging.append(key, offset, total, req.stream())
+    except UploadError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Upload-Offset": str(snapshot_staging.offset(key))},
+        )
+    if complete is None:
+        return Response(status_code=204, headers={"Upload-Offset": str(written)})
+    await snapshot_chunks.put_file(key, complete)
+    return Response(status_code=201, headers={"Upload-Offset": str(written)})
+
+@api_router.get("/snapshots/chunks/{digest}")
+async def snapshot_download_chunk(req: Request, digest: str):
+    key = chunk_key(request_user(req), snapshot_digest(digest))
+    size = (await snapshot_chunks.sizes([key]))[key]
+    if size is None:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    return ranged_stream(req, size, lambda start, end: snapshot_chunks.open_range(key, start, end))
+
+@api_router.put("/snapshots/{snapshot_id}", response_model=SnapshotManifest)
+async def snapshot_commit(req: Request, input: SnapshotManifestInput,
+                          snapshot_id: str = FastAPIPath(..., pattern=SNAPSHOT_ID_PATTERN)):
+    account = request_user(req)
+    keys = [chunk_key(account, c.hash) for c in input.chunks]
+    sizes = await snapshot_chunks.sizes(keys)
+    bad = sorted({c.hash for c, k in zip(input.chunks, keys) if sizes[k] != c.size})
+    if bad:
+        raise HTTPException(status_code=409, detail={"message": "Chunks missing or size mismatch", "chunks": bad})
+    manifest = SnapshotManifest(
+        id=snapshot_id,
+        chunks=input.chunks,
+        label=input.label,
+        size=sum(c.size for c in input.chunks),
+        created_at=datetime.utcnow(),
+    )
+    await db.snapshots.replace_one(
+        {"_id": f"{account}:{snapshot_id}"},
+        {**manifest.dict(), "account": account, "chunk_count": len(input.chunks)},
+        upsert=True,
+    )
+    return manifest
+
+@api_router.get("/snapshots", response_model=List[SnapshotSummary])
+async def snapshot_list(req: Request, limit: int = Query(50, ge=1, le=500)):
+    projection = {"_id": 0, "id": 1, "size": 1, "chunk_count": 1, "label": 1, "created_at": 1}
+    docs = await db.snapshots.find({"account": request_user(req)}, projection).sort([("created_at", -1)]).to_list(limit)
+    return [SnapshotSummary(**d) for d in docs]
+
+async def load_snapshot(req: Request, snapshot_id: str) -> Tuple[str, SnapshotManifest]:
+    account = request_user(req)
+    doc = await db.snapshots.find_one({"_id": f"{account}:{snapshot_id}"})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return account, SnapshotManifest(**doc)
+
+@api_router.get("/snapshots/{snapshot_id}", response_model=SnapshotManifest)
+async def snapshot_manifest(req: Request, snapshot_id: str):
+    return (await load_snapshot(req, snapshot_id))[1]
+
+@api_router.get("/snapshots/{snapshot_id}/content")
+async def snapshot_content(req: Request, snapshot_id: str):
+    # the whole snapshot as one byte stream; restore can fetch disjoint ranges in parallel
+    account, manifest = await load_snapshot(req, snapshot_id)
+
+    async def pieces(start: int, end: int):
+        for i, lo, hi in slice_chunks([c.size for c in manifest.chunks], start, end):
+            async for block in snapshot_chunks.open_range(chunk_key(account, manifest.chunks[i].hash), lo, hi):
+                yield block
+
+    return ranged_stream(req, manifest.size, pieces)
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    # liveness only: the process serves requests; dependencies are /readyz's business
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    body: Dict[str, Any] = {"warmup": warmup.snapshot(), "circuit": upstream_breaker.state}
+    try:
+        await asyncio.wait_for(ping_mongo(), timeout=READY_MONGO_TIMEOUT_MS / 1000)
+        body["mongo"] = "ok"
+    except asyncio.TimeoutError:
+        body["mongo"] = "timeout"
+    except Exception as e:
+        body["mongo"] = str(e)[:200]
+    body["ready"] = warmup.ready and body["mongo"] == "ok"
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -208,6 +1609,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    MetricsMiddleware,
+    histogram=http_request_seconds,
+    profiler=SlowRequestProfiler(PROFILE_SAMPLE_RATE, PROFILE_SLOW_SECONDS),
+)
 
 # Configure logging
 logging.basicConfig(
@@ -215,7 +1621,82 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# httpx logs every upstream request at INFO, which costs real time under load
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+async def ensure_background_indexes():
+    try:
+        await db.status_checks.create_index(STATUS_SORT)
+        await db.status_checks.create_index([("client_name", 1)] + STATUS_SORT)
+    except Exception as e:
+        logger.warning("status_checks index setup failed: %s", e)
+    try:
+        await sync_store.ensure_indexes()
+    except Exception as e:
+        logger.warning("sync index setup failed: %s", e)
+    try:
+        await db.snapshots.create_index([("account", 1), ("created_at", -1)])
+        await snapshot_chunks.ensure_indexes()
+    except Exception as e:
+        logger.warning("snapshot index setup failed: %s", e)
+
+async def ping_mongo() -> None:
+    if not (MONGO_URL and DB_NAME):
+        raise RuntimeError("MONGO_URL and DB_NAME must be set")
+    await db.command("ping")
+
+async def warm_mongo_pool() -> None:
+    # concurrent pings each check out a connection of their own, so this many get opened
+    await asyncio.gather(*(ping_mongo() for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+
+async def warm_embedder() -> None:
+    # loads the model, then runs the first inference, which is much slower than the rest
+    await asyncio.get_running_loop().run_in_executor(embed_executor, lambda: get_embedder().embed(["warm-up"]))
+
+async def load_models() -> None:
+    await asyncio.get_running_loop().run_in_executor(
+        None, lambda: (get_fallback_annotator(), get_entity_extractor()))
+
+async def ensure_search_indexes() -> None:
+    await asyncio.get_running_loop().run_in_executor(embed_executor, get_embedder)
+    await get_search_service().ensure_indexes()
+
+async def start_job_workers() -> None:
+    try:
+        await job_queue.ensure_indexes()
+    finally:
+        job_workers.start()
+
+def warmup_steps() -> Dict[str, Step]:
+    steps = {"mongo": warm_mongo_pool, "models": load_models, "embedder": warm_embedder}
+    if EMERGENT_LLM_KEY:
+        steps["upstream"] = upstream.warm
+    if AI_CACHE_MONGO:
+        steps["annotation_cache_indexes"] = annotation_cache.ensure_indexes
+    if RATE_LIMIT_BACKEND == 'mongo':
+        steps["rate_limit_indexes"] = rate_limiter.ensure_indexes
+        steps["embed_rate_limit_indexes"] = embed_rate_limiter.ensure_indexes
+    if SEARCH_MONGO:
+        steps["search_indexes"] = ensure_search_indexes
+    if AI_JOBS_ENABLED:
+        steps["jobs"] = start_job_workers
+    return steps
+
+async def startup():
+    t0 = time.monotonic()
+    await upstream.start()
+    # in the background: an unreachable Mongo must not hold up startup for the selection timeout
+    app.state.index_task = asyncio.create_task(ensure_background_indexes())
+    # without the upstream annotations degrade to the fallback, so it does not gate /readyz
+    warmup.start(warmup_steps(), optional={"upstream"})
+    startup_seconds.set(time.monotonic() - t0, phase="lifespan")
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def shutdown():
+    await warmup.aclose()
+    app.state.index_task.cancel()
+    await job_workers.stop()
+    await status_writer.aclose()
+    await audit_writer.aclose()
+    client.close()
+    await upstream.aclose()
+    embed_executor.shutdown(wait=False)
@@ -0,0 +1,40 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple, Type
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key onto one in-flight task.
+
+    The first caller starts the task; callers arriving while it runs await
+    the same result (or exception). The task is shielded, so a caller that
+    disconnects does not cancel the work for the others. Exceptions listed
+    in `retry_on` describe the leader rather than the work (its admission
+    was shed, say): a follower that sees one runs its own `fn` instead.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(
+        self, key: str, fn: Callable[[], Awaitable[Any]], retry_on: Tuple[Type[BaseException], ...] = ()
+    ) -> Tuple[Any, bool]:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            return await asyncio.shield(task), False
+        try:
+            return await asyncio.shield(task), True
+        except retry_on:
+            return await fn(), False
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # mark the exception as retrieved when every waiter has gone away
+            task.exception()
@@ -0,0 +1,236 @@
+"""Content-addressed chunk storage for encrypted snapshots.
+
+The app cuts its (already encrypted) snapshot and attachments into chunks
+and names each by its SHA-256, so a chunk the server already holds for
+the account is never sent again. Chunks are uploaded resumably: bytes are
+appended to a staging file at an explicit offset and only moved into the
+store once the digest matches. Reads stream fixed-size blocks for a byte
+range, so neither direction holds a whole chunk in memory.
+
+Chunks are keyed per account (`chunk_key`) so one account cannot probe
+for another's content. Stores: `FilesystemChunkStore` (local disk) and
+`GridFSChunkStore` (Mongo GridFS, filename = key). Staging is always on
+local disk since GridFS files cannot be appended to.
+"""
+import asyncio
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+BLOCK_SIZE = 256 * 1024
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def valid_digest(digest: str) -> bool:
+    return bool(_HASH_RE.match(digest))
+
+
+def chunk_key(account: str, digest: str) -> str:
+    namespace = hashlib.sha256(account.encode("utf-8")).hexdigest()[:16]
+    return f"{namespace}/{digest}"
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Single `bytes=` range -> inclusive (start, end); None means whole body.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    m = _RANGE_RE.match(header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        raise ValueError(header)
+    if not m.group(1):
+        # suffix range: last n bytes
+        n = int(m.group(2))
+        if n == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - n), size - 1
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+def slice_chunks(sizes: Sequence[int], start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    """Map an inclusive byte range of the concatenation to (chunk index, start, end) pieces."""
+    offset = 0
+    for i, size in enumerate(sizes):
+        chunk_end = offset + size - 1
+        if chunk_end >= start and offset <= end:
+            yield i, max(start, offset) - offset, min(end, chunk_end) - offset
+        if chunk_end >= end:
+            return
+        offset += size
+
+
+def _read_block(path: Path, offset: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+async def stream_file(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    pos = start
+    while pos <= end:
+        block = await asyncio.to_thread(_read_block, path, pos, min(BLOCK_SIZE, end - pos + 1))
+        if not block:
+            return
+        pos += len(block)
+        yield block
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FilesystemChunkStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        namespace, digest = key.split("/")
+        return self.root / namespace / digest[:2] / digest
+
+    async def ensure_indexes(self) -> None:
+        return None
+
+    async def sizes(self, keys: Iterable[str]) -> Dict[str, Optional[int]]:
+        def stat_all():
+            out: Dict[str, Optional[int]] = {}
+            for key in keys:
+                try:
+                    out[key] = os.stat(self._path(key)).st_size
+                except FileNotFoundError:
+                    out[key] = None
+            return out
+
+        return await asyncio.to_thread(stat_all)
+
+    async def put_file(self, key: str, path: Path) -> None:
+        target = self._path(key)
+        await asyncio.to_thread(target.parent.mkdir, parents=True, exist_ok=True)
+        await asyncio.to_thread(os.replace, path, target)
+
+    async def open_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        async for block in stream_file(self._path(key), start, end):
+            yield block
+
+
+class GridFSChunkStore:
+    def __init__(self, db, bucket_name: str = "snapshot_chunks"):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+        self.files = db[f"{bucket_name}.files"]
+
+    async def ensure_indexes(self) -> None:
+        await self.files.create_index("filename", unique=True)
+
+    async def sizes(self, keys: Iterable[str]) -> Dict[str, Optional[int]]:
+        out: Dict[str, Optional[int]] = {key: None for key in keys}
+        async for doc in self.files.find({"filename": {"$in": list(out)}}, {"filename": 1, "length": 1}):
+            out[doc["filename"]] = doc["length"]
+        return out
+
+    async def put_file(self, key: str, path: Path) -> None:
+        from pymongo.errors import DuplicateKeyError
+
+        stream = self.bucket.open_upload_stream(key)
+        try:
+            size = (await asyncio.to_thread(os.stat, path)).st_size
+            async for block in stream_file(path, 0, size - 1):
+                await stream.write(block)
+            await stream.close()
+        except DuplicateKeyError:
+            # the same content was committed concurrently
+            await stream.abort()
+        except BaseException:
+            await stream.abort()
+            raise
+        finally:
+            await asyncio.to_thread(path.unlink, True)
+
+    async def open_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        grid_out = await self.bucket.open_download_stream_by_name(key)
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = await grid_out.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
+
+
+class UploadStaging:
+    """Partial chunk uploads on local disk, appended at explicit offsets."""
+
+    def __init__(self, root: Path, max_chunk_bytes: int):
+        self.root = Path(root)
+        self.max_chunk_bytes = max_chunk_bytes
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def path(self, key: str) -> Path:
+        return self.root / (key.replace("/", "-") + ".part")
+
+    def offset(self, key: str) -> int:
+        try:
+            return self.path(key).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    async def append(
+        self, key: str, offset: int, total: int, body: AsyncIterator[bytes]
+    ) -> Tuple[int, Optional[Path]]:
+        """Write `body` at `offset`; returns (new offset, verified file once complete)."""
+        if total > self.max_chunk_bytes:
+            raise UploadError(f"chunk larger than {self.max_chunk_bytes} bytes", 413)
+        # one writer per key; the entry lives only while someone holds or waits for it
+        lock, users = self._locks.get(key, (asyncio.Lock(), 0))
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                return await self._append(key, offset, total, body)
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    async def _append(
+        self, key: str, offset: int, total: int, body: AsyncIterator[bytes]
+    ) -> Tuple[int, Optional[Path]]:
+        current = self.offset(key)
+        if offset != current:
+            raise UploadError(f"offset {offset} does not match {current}", 409)
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # bytes written before a dropped connection stay; the client resumes from offset()
+        with open(path, "ab") as f:
+            async for block in body:
+                if current + len(block) > total:
+                    raise UploadError("body exceeds Upload-Length", 413)
+                await asyncio.to_thread(f.write, block)
+                current += len(block)
+        if current < total:
+            return current, None
+        if await asyncio.to_thread(_sha256_file, path) != key.rsplit("/", 1)[1]:
+            path.unlink(missing_ok=True)
+            raise UploadError("content does not match digest", 422)
+        return current, path
@@ -0,0 +1,100 @@
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+_LIST_KEYS = ("categories", "tags")
+_LIST_START_RE = {name: re.compile(r'"%s"\s*:\s*\[' % name) for name in _LIST_KEYS}
+_SUMMARY_START_RE = re.compile(r'"summary"\s*:\s*"')
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _find_array_end(buf: str, start: int) -> Optional[int]:
+    # index of the `]` closing the array whose `[` is at buf[start]
+    depth = 0
+    in_str = esc = False
+    for i in range(start, len(buf)):
+        c = buf[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif c == "\\":
+                esc = True
+            elif c == '"':
+                in_str = False
+        elif c == '"':
+            in_str = True
+        elif c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def _complete_prefix(raw: str) -> Tuple[str, bool]:
+    """Longest decodable prefix of a JSON string body, and whether it closed."""
+    i = 0
+    n = len(raw)
+    while i < n:
+        c = raw[i]
+        if c == '"':
+            return raw[:i], True
+        if c == "\\":
+            if i + 1 >= n:
+                break
+            step = 6 if raw[i + 1] == "u" else 2
+            if i + step > n:
+                break
+            i += step
+            continue
+        i += 1
+    return raw[:i], False
+
+
+class IncrementalAnnotationParser:
+    """Pulls fields out of the annotation JSON while it is still streaming.
+
+    `categories` and `tags` are emitted once their array is complete;
+    `summary` is emitted piecewise as its string value arrives.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self._sent: set = set()
+        self._summary_pos: Optional[int] = None
+        self._summary_done = False
+
+    def feed(self, delta: str) -> List[Tuple[str, Any]]:
+        self.buf += delta
+        events: List[Tuple[str, Any]] = []
+        for name in _LIST_KEYS:
+            if name in self._sent:
+                continue
+            m = _LIST_START_RE[name].search(self.buf)
+            if not m:
+                continue
+            end = _find_array_end(self.buf, m.end() - 1)
+            if end is None:
+                continue
+            self._sent.add(name)
+            try:
+                value = json.loads(self.buf[m.end() - 1:end + 1])
+            except json.JSONDecodeError:
+                continue
+            events.append((name, value))
+        if self._summary_pos is None:
+            m = _SUMMARY_START_RE.search(self.buf)
+            if m:
+                self._summary_pos = m.end()
+        if self._summary_pos is not None and not self._summary_done:
+            raw, closed = _complete_prefix(self.buf[self._summary_pos:])
+            if raw:
+                events.append(("summary", json.loads('"' + raw + '"')))
+                self._summary_pos += len(raw)
+            if closed:
+                self._summary_done = True
+        return events
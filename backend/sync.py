@@ -0,0 +1,148 @@
+"""Delta sync of opaque, client-encrypted records.
+
+Every accepted change gets the next value of a per-account sequence
+(`sync_counters`); a device pulls everything after the last sequence it
+has seen, so traffic scales with the amount of change, not the library.
+Records follow the `notes` table semantics: `updated_at` for edits and
+`deleted_at` for tombstones, both epoch millis. Conflicts are resolved
+last-writer-wins on max(updated_at, deleted_at); an older change is
+reported back as stale.
+
+A push reserves its sequence range up front and registers it as in
+flight until its writes are done; pulls never read past the lowest
+in-flight range, so a slow push cannot be skipped by a fast one that
+got a higher range.
+"""
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+
+def change_time(change: Dict[str, Any]) -> int:
+    return max(int(change.get("updated_at") or 0), int(change.get("deleted_at") or 0))
+
+
+class SyncStore:
+    def __init__(self, records, counters, devices, *, inflight_timeout: float = 60.0):
+        self.records = records
+        self.counters = counters
+        self.devices = devices
+        # a push that never unregistered (worker crash) stops holding back pulls after this
+        self.inflight_timeout = inflight_timeout
+
+    async def ensure_indexes(self) -> None:
+        await self.records.create_index([("account", 1), ("seq", 1)])
+        await self.devices.create_index([("account", 1), ("last_seen", -1)])
+
+    async def _reserve(self, account: str, n: int, token: str) -> int:
+        # one atomic pipeline update: bump the sequence and register [start, start + n) as in flight
+        seq = {"$ifNull": ["$seq", 0]}
+        doc = await self.counters.find_one_and_update(
+            {"_id": account},
+            [{"$set": {
+                "seq": {"$add": [seq, n]},
+                "inflight": {"$concatArrays": [
+                    {"$ifNull": ["$inflight", []]},
+                    [{"token": token, "start": {"$add": [seq, 1]}, "at": time.time()}],
+                ]},
+            }}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["seq"] - n + 1
+
+    async def _release(self, account: str, token: str) -> None:
+        await self.counters.update_one({"_id": account}, {"$pull": {"inflight": {"token": token}}})
+
+    async def watermark(self, account: str) -> int:
+        """Highest sequence at or below which every write has landed."""
+        doc = await self.counters.find_one({"_id": account})
+        if not doc:
+            return 0
+        cutoff = time.time() - self.inflight_timeout
+        pending = [e["start"] for e in doc.get("inflight") or [] if e["at"] > cutoff]
+        return min(pending) - 1 if pending else doc["seq"]
+
+    async def push(self, account: str, device: str, changes: List[Dict[str, Any]]) -> Tuple[int, List[str], int]:
+        """Returns (accepted, stale record ids, watermark after the push)."""
+        if not changes:
+            return 0, [], await self.watermark(account)
+        token = uuid.uuid4().hex
+        start = await self._reserve(account, len(changes), token)
+        try:
+            now = time.time()
+            ops = []
+            for i, ch in enumerate(changes):
+                ts = change_time(ch)
+                ops.append(UpdateOne(
+                    {"_id": f"{account}:{ch['kind']}:{ch['id']}", "change_time": {"$lt": ts}},
+                    {"$set": {
+                        "account": account,
+                        "kind": ch["kind"],
+                        "record_id": ch["id"],
+                        "updated_at": ch.get("updated_at"),
+                        "deleted_at": ch.get("deleted_at"),
+                        "payload": ch.get("payload"),
+                        "change_time": ts,
+                        "seq": start + i,
+                        "device": device,
+                        "server_time": now,
+                    }},
+                    upsert=True,
+                ))
+            stale: List[str] = []
+            try:
+                await self.records.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                for err in (e.details or {}).get("writeErrors") or []:
+                    # the filter missed because a newer version exists, so the upsert hit its _id
+                    if err.get("code") != DUPLICATE_KEY:
+                        raise
+                    stale.append(changes[err["index"]]["id"])
+        finally:
+            await self._release(account, token)
+        await self._touch(account, device, pushed=len(changes) - len(stale))
+        return len(changes) - len(stale), stale, await self.watermark(account)
+
+    async def pull(
+        self, account: str, device: str, cursor: int, limit: int, max_bytes: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """Changes after `cursor` made by other devices: (records, next cursor, has_more).
+
+        A page ends after `limit` records or once the payloads reach `max_bytes`,
+        whichever comes first; it always holds at least one record.
+        """
+        upper = await self.watermark(account)
+        query = {"account": account, "seq": {"$gt": cursor, "$lte": upper}, "device": {"$ne": device}}
+        projection = {"_id": 0, "record_id": 1, "kind": 1, "updated_at": 1, "deleted_at": 1, "payload": 1, "seq": 1}
+        docs: List[Dict[str, Any]] = []
+        size = 0
+        has_more = False
+        # iterate instead of to_list so an oversized page is never materialized
+        async for doc in self.records.find(query, projection).sort([("seq", 1)]).limit(limit + 1):
+            size += len(doc.get("payload") or "")
+            if len(docs) >= limit or (docs and max_bytes is not None and size > max_bytes):
+                has_more = True
+                break
+            docs.append(doc)
+        # without more rows, everything up to the watermark has been scanned (own changes included)
+        next_cursor = docs[-1]["seq"] if has_more else max(cursor, upper)
+        await self._touch(account, device, cursor=next_cursor)
+        return docs, next_cursor, has_more
+
+    async def _touch(self, account: str, device: str, *, cursor: Optional[int] = None, pushed: int = 0) -> None:
+        # per-device change index: what each device has pulled up to and when it was last seen
+        update: Dict[str, Any] = {"$set": {"account": account, "device": device, "last_seen": time.time()}}
+        if cursor is not None:
+            update["$max"] = {"cursor": cursor}
+        if pushed:
+            update["$inc"] = {"pushed": pushed}
+        await self.devices.update_one({"_id": f"{account}:{device}"}, update, upsert=True)
+
+    async def device_states(self, account: str) -> List[Dict[str, Any]]:
+        return await self.devices.find({"account": account}, {"_id": 0}).to_list(100)
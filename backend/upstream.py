@@ -0,0 +1,159 @@
+import importlib.util
+import json
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+
+def http2_available() -> bool:
+    # httpx only speaks HTTP/2 when the optional `h2` package is installed
+    return importlib.util.find_spec("h2") is not None
+
+
+class UpstreamRateLimited(Exception):
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("AI rate limit upstream")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class UpstreamClient:
+    """Shared async client for the OpenAI-compatible LLM gateway.
+
+    One keep-alive connection pool per worker; created on startup and
+    closed on shutdown, lazily created if used before startup ran. httpx
+    itself is only imported then, not with this module.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str],
+        *,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 25.0,
+        http2: bool = True,
+        transport: Optional["httpx.AsyncBaseTransport"] = None,
+        observe: Optional[Callable[[str, float], None]] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2 and http2_available()
+        self._transport = transport
+        # observe(stage, seconds) receives upstream_connect / upstream_response timings
+        self.observe = observe
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None or self._client.is_closed:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                http2=self.http2,
+                transport=self._transport,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "application/json",
+                    "User-Agent": "offline-notes/ai-annotate",
+                },
+            )
+        return self._client
+
+    async def start(self) -> None:
+        _ = self.client
+
+    async def warm(self) -> None:
+        """Open a pooled connection (DNS, TCP, TLS, HTTP/2) ahead of the first real call."""
+        # any HTTP status will do, only the connection matters
+        await self.client.get("/models", headers=self._auth_headers())
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def _trace(self):
+        if self.observe is None:
+            return None
+        started: Dict[str, float] = {}
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # only fires when a new connection is opened, not on keep-alive reuse
+            if event_name == "connection.connect_tcp.started":
+                started["connect"] = time.perf_counter()
+            elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                if "connect" in started:
+                    started["connected"] = time.perf_counter()
+            elif event_name.endswith("send_request_headers.started") and "connected" in started:
+                self.observe("upstream_connect", started.pop("connected") - started.pop("connect"))
+
+        return trace
+
+    async def chat_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        trace = self._trace()
+        t0 = time.perf_counter()
+        try:
+            r = await self.client.post(
+                "/chat/completions",
+                json=payload,
+                headers=self._auth_headers(),
+                extensions={"trace": trace} if trace else None,
+            )
+        finally:
+            if self.observe is not None:
+                self.observe("upstream_response", time.perf_counter() - t0)
+        if r.status_code == 429:
+            raise UpstreamRateLimited(parse_retry_after(r.headers.get("Retry-After")))
+        r.raise_for_status()
+        return r.json()
+
+    async def stream_chat_completion(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Yield content deltas of a streamed (SSE) chat completion."""
+        body = {**payload, "stream": True}
+        headers = {**self._auth_headers(), "Accept": "text/event-stream"}
+        async with self.client.stream("POST", "/chat/completions", json=body, headers=headers) as r:
+            if r.status_code == 429:
+                raise UpstreamRateLimited(parse_retry_after(r.headers.get("Retry-After")))
+            if r.status_code >= 400:
+                await r.aread()
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                chunk = json.loads(data)
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
@@ -0,0 +1,97 @@
+"""Background warm-up at startup, reported through `/readyz`.
+
+Startup work that waits on the network (opening the Mongo pool, the
+upstream connection, index creation, the first model inference) runs as
+named steps, concurrently and each with its own timeout, in a task next to
+the server instead of in front of it. A worker accepts connections as soon
+as the app is imported; the load balancer routes to it once `/readyz`
+says the required steps have finished; optional steps (a dependency the
+app degrades without) are reported but do not hold readiness back. A
+failed or timed-out step is reported, not fatal: everything it prepares is
+also set up lazily on first use.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+Step = Callable[[], Awaitable[Any]]
+
+
+class Warmup:
+    def __init__(
+        self,
+        timeout: float = 5.0,
+        *,
+        observe: Optional[Callable[[str, float], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.timeout = timeout
+        # observe(step, seconds) for every step and once more for "warmup" as a whole
+        self.observe = observe
+        self.clock = clock
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.optional: frozenset = frozenset()
+        self.seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.seconds is not None
+
+    @property
+    def ready(self) -> bool:
+        """Every step that is not optional has finished."""
+        return self._task is not None and all(
+            step["status"] != "pending" for name, step in self.steps.items() if name not in self.optional)
+
+    def start(self, steps: Dict[str, Step], optional: Iterable[str] = ()) -> asyncio.Task:
+        self.steps = {name: {"status": "pending"} for name in steps}
+        self.optional = frozenset(optional)
+        self.seconds = None
+        self._task = asyncio.create_task(self.run(steps))
+        return self._task
+
+    async def run(self, steps: Dict[str, Step]) -> None:
+        t0 = self.clock()
+        await asyncio.gather(*(self._step(name, step) for name, step in steps.items()))
+        self.seconds = self.clock() - t0
+        logger.info("warm-up finished in %.0f ms", self.seconds * 1000)
+        if self.observe is not None:
+            self.observe("warmup", self.seconds)
+
+    async def _step(self, name: str, step: Step) -> None:
+        t0 = self.clock()
+        try:
+            await asyncio.wait_for(step(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            result = {"status": "timeout"}
+            logger.warning("warm-up step %s timed out after %.1fs", name, self.timeout)
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)[:200]}
+            logger.warning("warm-up step %s failed: %s", name, e)
+        else:
+            result = {"status": "ok"}
+        seconds = self.clock() - t0
+        result["seconds"] = round(seconds, 3)
+        self.steps[name] = result
+        if self.observe is not None:
+            self.observe(name, seconds)
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "done": self.done,
+            "ready": self.ready,
+            "seconds": None if self.seconds is None else round(self.seconds, 3),
+            "steps": dict(self.steps),
+        }
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class BulkResult:
+    def __init__(
+        self,
+        inserted: int = 0,
+        duplicates: Optional[List[int]] = None,
+        errors: Optional[Dict[int, str]] = None,
+    ):
+        self.inserted = inserted
+        # indexes into the submitted docs
+        self.duplicates = duplicates or []
+        self.errors = errors or {}
+
+
+class WriteBatcher:
+    """Groups single inserts into unordered `insert_many` calls.
+
+    A write waits at most `flush_interval` seconds (or until `max_batch`
+    documents are pending) and then goes out together with everything
+    else that arrived in the window. Documents carry their own `_id`, so a
+    replayed event hits a duplicate-key error, which counts as success.
+    """
+
+    def __init__(
+        self,
+        collection,
+        *,
+        max_batch: int = 500,
+        flush_interval: float = 0.01,
+        observe: Optional[Callable[[float], None]] = None,
+    ):
+        self.collection = collection
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        # observe(seconds) receives the duration of every insert_many
+        self.observe = observe
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushing: Set[asyncio.Task] = set()
+
+    async def insert_many(self, docs: List[Dict[str, Any]]) -> BulkResult:
+        if not docs:
+            return BulkResult()
+        t0 = time.perf_counter()
+        try:
+            res = await self.collection.insert_many(docs, ordered=False)
+            return BulkResult(inserted=len(res.inserted_ids))
+        except BulkWriteError as e:
+            details = e.details or {}
+            errors: Dict[int, str] = {}
+            duplicates: List[int] = []
+            for err in details.get("writeErrors") or []:
+                if err.get("code") == DUPLICATE_KEY:
+                    duplicates.append(err["index"])
+                else:
+                    errors[err["index"]] = err.get("errmsg") or "write failed"
+            return BulkResult(inserted=details.get("nInserted", 0), duplicates=duplicates, errors=errors)
+        finally:
+            if self.observe is not None:
+                self.observe(time.perf_counter() - t0)
+
+    async def insert(self, doc: Dict[str, Any]) -> bool:
+        """Queue one document; returns False if it was already stored."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((doc, fut))
+        if len(self._pending) >= self.max_batch:
+            self._cancel_timer()
+            batch, self._pending = self._pending, []
+            task = asyncio.create_task(self._write(batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await fut
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        await self.flush()
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def flush(self) -> None:
+        batch, self._pending = self._pending, []
+        await self._write(batch)
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        if not batch:
+            return
+        try:
+            result = await self.insert_many([doc for doc, _ in batch])
+        except Exception as e:
+            logger.warning("batched insert of %d documents failed: %s", len(batch), e)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        duplicates = set(result.duplicates)
+        for i, (_, fut) in enumerate(batch):
+            if fut.done():
+                continue
+            if i in result.errors:
+                fut.set_exception(RuntimeError(result.errors[i]))
+            else:
+                fut.set_result(i not in duplicates)
+
+    async def aclose(self) -> None:
+        self._cancel_timer()
+        await self.flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Microbenchmarks for the deterministic fallback annotator.
+
+Compares backend/fallback.py against the previous inline implementation
+(char-by-char rebuild + list-based dedupe) at 1k, 10k and 50k characters.
+
+    python benchmarks/bench_fallback.py [--repeat 20]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fallback import FallbackAnnotator  # noqa: E402
+
+SIZES = (1_000, 10_000, 50_000)
+
+
+def legacy_fallback(text: str) -> dict:
+    text = text.strip()
+    words = [w.lower() for w in ''.join([c if c.isalnum() or c.isspace() else ' ' for c in text]).split()]
+    uniq: List[str] = []
+    for w in words:
+        if len(w) > 3 and w not in uniq:
+            uniq.append(w)
+    summary = (text[:180] + '...') if len(text) > 200 else text
+    return {"tags": uniq[:5], "summary": summary}
+
+
+def make_text(chars: int, seed: int = 7) -> str:
+    # mixed-language note text with a long tail of distinct words, like real transcripts
+    rnd = random.Random(seed)
+    common = ("der die und ist nicht mit meeting budget termin einkauf projekt kunde "
+              "schraubenzieher garage rechnung the and with for notes review").split()
+    out, size = [], 0
+    while size < chars:
+        n = rnd.randint(6, 16)
+        words = [rnd.choice(common) if rnd.random() < 0.6 else f"wort{rnd.randint(0, 20000)}" for _ in range(n)]
+        sentence = " ".join(words).capitalize() + rnd.choice([". ", "! ", "? ", ".\n"])
+        out.append(sentence)
+        size += len(sentence)
+    return "".join(out)[:chars]
+
+
+def bench(fn: Callable[[str], object], text: str, repeat: int) -> List[float]:
+    fn(text)  # warm-up
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    annotator = FallbackAnnotator()
+    print(f"{'chars':>7} {'impl':>8} {'mean ms':>9} {'p95 ms':>9}")
+    for size in SIZES:
+        text = make_text(size)
+        for name, fn in (("legacy", legacy_fallback), ("fallback", annotator.annotate)):
+            samples = sorted(bench(fn, text, args.repeat))
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            print(f"{size:>7} {name:>8} {statistics.mean(samples):>9.2f} {p95:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""Load and latency benchmarks for the backend against a stub LLM upstream.
+
+Each scenario starts `backend.server:app` under uvicorn next to a fresh
+stub upstream (benchmarks/stub_llm.py), drives it with `--concurrency`
+closed-loop clients for `--duration` seconds and reports p50/p95/p99
+latency, throughput, error rate and RSS growth of the backend process.
+
+    python benchmarks/bench_load.py                       # all scenarios
+    python benchmarks/bench_load.py -s annotate --latency-ms 120 --rate-429 0.05
+    python benchmarks/bench_load.py --baseline benchmarks/baseline_load.json
+    python benchmarks/bench_load.py --baseline benchmarks/baseline_load.json --update-baseline
+
+With `--baseline` the run exits non-zero when a scenario regresses:
+p95/p99 above baseline * (1 + latency tolerance), throughput below
+baseline * (1 - throughput tolerance), or more RSS growth / errors than
+the baseline allows. The `status` scenario needs a reachable MONGO_URL
+and is skipped otherwise.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from stub_llm import add_stub_arguments
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    make_request: Callable[[int], Request]
+    stub_overrides: Dict[str, Any] = field(default_factory=dict)
+    env: Dict[str, str] = field(default_factory=dict)
+    needs_mongo: bool = False
+
+
+def annotate_request(i: int) -> Request:
+    # distinct text per request so neither cache nor single-flight short-circuits the upstream
+    text = f"Notiz {i}: Meeting mit dem Kunden zum Projektbudget, Termin für die Rechnung nächste Woche."
+    return "POST", "/api/ai/annotate", {"text": text, "use_cache": False}
+
+
+def status_request(i: int) -> Request:
+    if i % 4 == 0:
+        return "POST", "/api/status", {"client_name": f"bench-{i % 16}"}
+    return "GET", "/api/status?limit=50", None
+
+
+SCENARIOS = {
+    "annotate": Scenario("annotate", annotate_request),
+    # upstream always fails: measures the breaker-open + deterministic fallback path
+    "fallback": Scenario(
+        "fallback",
+        annotate_request,
+        stub_overrides={"error_rate": 1.0, "rate_429": 0.0, "malformed_rate": 0.0, "latency_ms": 0.0},
+        env={"AI_MAX_RETRIES": "0"},
+    ),
+    "status": Scenario("status", status_request, needs_mongo=True),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    # Linux only; memory columns stay empty elsewhere
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def mongo_reachable(url: str) -> bool:
+    from pymongo import MongoClient
+
+    try:
+        MongoClient(url, serverSelectionTimeoutMS=1000).admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+async def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"process for {url} exited with {proc.returncode}")
+            try:
+                if (await client.get(url, timeout=1.0)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def stub_command(port: int, args: argparse.Namespace, overrides: Dict[str, Any]) -> List[str]:
+    opts = {
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "error_rate": args.error_rate,
+        "rate_429": args.rate_429,
+        "malformed_rate": args.malformed_rate,
+        "retry_after": args.retry_after,
+        "seed": args.seed,
+        **overrides,
+    }
+    cmd = [sys.executable, str(BENCH_DIR / "stub_llm.py"), "--port", str(port)]
+    for key, value in opts.items():
+        if value is not None:
+            cmd += ["--" + key.replace("_", "-"), str(value)]
+    return cmd
+
+
+def backend_env(stub_port: int, scenario: Scenario) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "bench_load")
+    env.update({
+        "EMERGENT_LLM_KEY": "bench",
+        "EMERGENT_LLM_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        # the benchmark measures the server, not the per-client limiter
+        "AI_RATE_LIMIT_PER_MIN": "100000000",
+        "AI_CACHE_MONGO": "0",
+        "AI_JOBS_ENABLED": "0",
+        "AI_BACKOFF_BASE_SECONDS": "0.05",
+        "AI_BACKOFF_MAX_SECONDS": "0.5",
+    })
+    env.update(scenario.env)
+    return env
+
+
+async def drive(base_url: str, scenario: Scenario, concurrency: int, warmup: float, duration: float,
+                pid: int) -> Dict[str, Any]:
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+    statuses: Dict[str, int] = {}
+    rss_start: Optional[float] = None
+    loop = asyncio.get_running_loop()
+    measure_from = loop.time() + warmup
+    stop_at = measure_from + duration
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        async def worker() -> None:
+            nonlocal errors
+            while True:
+                t0 = loop.time()
+                if t0 >= stop_at:
+                    return
+                method, path, body = scenario.make_request(next(counter))
+                try:
+                    r = await client.request(method, path, json=body)
+                    code = str(r.status_code)
+                except httpx.HTTPError as e:
+                    code = type(e).__name__
+                elapsed = loop.time() - t0
+                if t0 < measure_from:
+                    continue
+                latencies.append(elapsed * 1000)
+                statuses[code] = statuses.get(code, 0) + 1
+                if not code.startswith("2"):
+                    errors += 1
+
+        async def sample_rss_after_warmup() -> None:
+            nonlocal rss_start
+            await asyncio.sleep(warmup)
+            rss_start = rss_mb(pid)
+
+        await asyncio.gather(sample_rss_after_warmup(), *(worker() for _ in range(concurrency)))
+
+    rss_end = rss_mb(pid)
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "requests": n,
+        "throughput_rps": round(n / duration, 1),
+        "error_rate": round(errors / n, 4) if n else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "rss_start_mb": round(rss_start, 1) if rss_start is not None else None,
+        "rss_end_mb": round(rss_end, 1) if rss_end is not None else None,
+        "rss_growth_mb": round(rss_end - rss_start, 1) if rss_start is not None and rss_end is not None else None,
+        "statuses": statuses,
+    }
+
+
+def stop(proc: subprocess.Popen) -> None:
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+async def run_scenario(scenario: Scenario, args: argparse.Namespace) -> Dict[str, Any]:
+    stub_port, app_port = free_port(), free_port()
+    stub = subprocess.Popen(stub_command(stub_port, args, scenario.stub_overrides), cwd=REPO_DIR)
+    app = None
+    try:
+        await wait_ready(f"http://127.0.0.1:{stub_port}/health", stub)
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.server:app", "--host", "127.0.0.1",
+             "--port", str(app_port), "--log-level", "warning"],
+            cwd=REPO_DIR,
+            env=backend_env(stub_port, scenario),
+        )
+        base_url = f"http://127.0.0.1:{app_port}"
+        await wait_ready(base_url + "/api/", app)
+        return await drive(base_url, scenario, args.concurrency, args.warmup, args.duration, app.pid)
+    finally:
+        if app is not None:
+            stop(app)
+        stop(stub)
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            args: argparse.Namespace) -> List[str]:
+    problems: List[str] = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            limit = base[key] * (1 + args.latency_tolerance)
+            if cur[key] > limit:
+                problems.append(f"{name}: {key} {cur[key]} > {limit:.2f} (baseline {base[key]})")
+        floor = base["throughput_rps"] * (1 - args.throughput_tolerance)
+        if cur["throughput_rps"] < floor:
+            problems.append(f"{name}: throughput {cur['throughput_rps']} rps < {floor:.1f} "
+                            f"(baseline {base['throughput_rps']})")
+        if cur["error_rate"] > base["error_rate"] + args.error_slack:
+            problems.append(f"{name}: error rate {cur['error_rate']} > baseline {base['error_rate']} "
+                            f"+ {args.error_slack}")
+        if cur.get("rss_growth_mb") is not None and base.get("rss_growth_mb") is not None:
+            allowed = max(base["rss_growth_mb"], 0) + args.memory_slack_mb
+            if cur["rss_growth_mb"] > allowed:
+                problems.append(f"{name}: RSS growth {cur['rss_growth_mb']} MB > {allowed:.1f} MB")
+    return problems
+
+
+def print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'scenario':>10} {'reqs':>7} {'rps':>8} {'err':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rss +MB':>8}")
+    for name, r in results.items():
+        growth = "-" if r["rss_growth_mb"] is None else f"{r['rss_growth_mb']:.1f}"
+        print(f"{name:>10} {r['requests']:>7} {r['throughput_rps']:>8.1f} {r['error_rate']:>7.2%} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {growth:>8}")
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    results: Dict[str, Dict[str, Any]] = {}
+    for name in args.scenario or list(SCENARIOS):
+        scenario = SCENARIOS[name]
+        if scenario.needs_mongo and not mongo_reachable(mongo_url):
+            print(f"skipping {name}: MongoDB at {mongo_url} not reachable", file=sys.stderr)
+            continue
+        results[name] = await run_scenario(scenario, args)
+    print_table(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2) + "\n")
+    if not args.baseline:
+        return 0
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        doc = {
+            "meta": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "stub_latency_ms": args.latency_ms,
+            },
+            "scenarios": results,
+        }
+        baseline_path.write_text(json.dumps(doc, indent=2) + "\n")
+        print(f"baseline written to {baseline_path}")
+        return 0
+    problems = compare(results, json.loads(baseline_path.read_text())["scenarios"], args)
+    for p in problems:
+        print("REGRESSION " + p, file=sys.stderr)
+    return 1 if problems else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite --baseline with this run")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25)
+    parser.add_argument("--throughput-tolerance", type=float, default=0.20)
+    parser.add_argument("--error-slack", type=float, default=0.01)
+    parser.add_argument("--memory-slack-mb", type=float, default=25.0)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
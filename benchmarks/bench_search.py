@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Query latency of the hybrid search index (BM25 + vectors).
+
+Builds one user's index with synthetic notes and random unit vectors and
+times queries in flat (brute-force) and IVF mode.
+
+    python benchmarks/bench_search.py [--notes 100000] [--repeat 50]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from embeddings import EMBEDDING_DIM, hash_embeddings  # noqa: E402
+from search import SearchIndex  # noqa: E402
+
+QUERIES = ("meeting budget", "garage schraubenzieher", "rechnung kunde projekt")
+
+
+def build(notes: int, seed: int = 7) -> SearchIndex:
+    rnd = random.Random(seed)
+    vocab = [f"wort{i}" for i in range(20000)] + "meeting budget garage schraubenzieher rechnung kunde projekt".split()
+    vecs = np.random.default_rng(seed).standard_normal((notes, EMBEDDING_DIM)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    index = SearchIndex(EMBEDDING_DIM)
+    for i in range(notes):
+        text = " ".join(rnd.choice(vocab) for _ in range(rnd.randint(10, 80)))
+        index.upsert(f"n{i}", text, category=("Business", "Privat", "Ideen")[i % 3], updated_at=i, vector=vecs[i])
+    return index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    index = build(args.notes)
+    print(f"indexed {args.notes} notes in {time.perf_counter() - t0:.1f}s")
+    qvecs = hash_embeddings(QUERIES)
+    for mode, ivf_min_docs in (("flat", args.notes + 1), ("ivf", min(args.notes, index.ivf_min_docs))):
+        index.ivf_min_docs = ivf_min_docs
+        index.build_ivf()  # trains IVF, or drops it in flat mode
+        index.search(QUERIES[0], qvecs[0])  # warm-up
+        samples = []
+        for i in range(args.repeat):
+            q = i % len(QUERIES)
+            t = time.perf_counter()
+            index.search(QUERIES[q], qvecs[q], limit=50, category="Business")
+            samples.append((time.perf_counter() - t) * 1000)
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{mode:>5}: mean {statistics.mean(samples):.2f} ms, p95 {p95:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""OpenAI-compatible stub upstream for load tests.
+
+Answers `POST .../chat/completions` with a canned annotation after a
+configurable delay, and injects 5xx errors, 429s and malformed JSON at
+the given rates. Streaming requests (`"stream": true`) get SSE deltas.
+
+    python benchmarks/stub_llm.py --port 8901 --latency-ms 80 --jitter-ms 20 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 50.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_429: float = 0.0
+    malformed_rate: float = 0.0
+    retry_after: Optional[float] = None
+    seed: Optional[int] = None
+
+
+ANNOTATION = {
+    "categories": ["Business"],
+    "tags": ["meeting", "budget", "projekt"],
+    "summary": "Besprechung zum Projektbudget mit nächsten Schritten.",
+    "confidence": 0.87,
+}
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+    rnd = random.Random(config.seed)
+    app.state.requests = 0
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True, "requests": app.state.requests}
+
+    @app.post("/{prefix:path}/chat/completions")
+    async def chat_completions(prefix: str, request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        delay = max(0.0, config.latency_ms + rnd.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        roll = rnd.random()
+        if roll < config.rate_429:
+            headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+            return JSONResponse({"error": {"message": "rate limited"}}, status_code=429, headers=headers)
+        roll -= config.rate_429
+        await asyncio.sleep(delay)
+        if roll < config.error_rate:
+            return JSONResponse({"error": {"message": "upstream exploded"}}, status_code=500)
+        roll -= config.error_rate
+        content = json.dumps(ANNOTATION, ensure_ascii=False)
+        if roll < config.malformed_rate:
+            content = content[: len(content) // 2]
+        if body.get("stream"):
+            async def events():
+                for i in range(0, len(content), 16):
+                    delta = {"choices": [{"delta": {"content": content[i:i + 16]}}]}
+                    yield f"data: {json.dumps(delta)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return JSONResponse({
+            "id": f"stub-{app.state.requests}",
+            "object": "chat.completion",
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        })
+
+    @app.api_route("/{path:path}", methods=["GET", "POST"])
+    async def not_found(path: str):
+        return PlainTextResponse("not found", status_code=404)
+
+    return app
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with HTTP 500")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction answered with HTTP 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction with truncated JSON content")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_429=args.rate_429,
+        malformed_rate=args.malformed_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
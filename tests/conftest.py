@@ -0,0 +1,40 @@
+import os
+import sys
+from pathlib import Path
+
+# backend modules import each other flat (see server.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# server.py reads these at import time; no Mongo server is contacted by the AI tests
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+# keep the Mongo-backed tiers off so tests never wait on server selection
+os.environ.setdefault("AI_CACHE_MONGO", "0")
+os.environ.setdefault("SEARCH_MONGO", "0")
+# account-scoped APIs (search, sync, snapshots) verify tokens signed with this
+os.environ.setdefault("ACCOUNT_TOKEN_SECRET", "test-secret")
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from backend import server  # noqa: E402
+from upstream import UpstreamClient  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_ai_state():
+    # the annotate path keeps module-level state in server.py; start every test from empty
+    server.annotation_cache.memory.clear()
+    server.near_duplicates.clear()
+    server.rate_limiter.reset()
+    server.embed_rate_limiter.reset()
+    server.upstream_breaker.reset()
+
+
+@pytest.fixture
+def mock_upstream(monkeypatch):
+    """Point server.upstream at an httpx MockTransport handler for the rest of the test."""
+    def install(handler, **kwargs):
+        monkeypatch.setattr(server, 'upstream', UpstreamClient(
+            'https://llm.test/v1', 'test-key', transport=httpx.MockTransport(handler), **kwargs))
+    return install
@@ -1,50 +1,150 @@
 import json
-from unittest.mock import patch
+
+import httpx
 from fastapi.testclient import TestClient
 
+from backend import server
 from backend.server import app
+from ratelimit import GCRALimiter
 
 client = TestClient(app)
 
-@patch('backend.server.requests.post')
-def test_ai_success(mock_post):
-    mock_post.return_value.status_code = 200
-    mock_post.return_value.json.return_value = {
-        "choices": [{"message": {"content": json.dumps({
-            "categories": ["Business"],
-            "tags": ["sales", "marketing"],
-            "summary": "Kurzfassung",
-            "confidence": 0.9
-        })}}]
-    }
+
+def test_ai_success(mock_upstream):
+    seen = {}
+
+    def handler(request: httpx.Request):
+        seen['url'] = str(request.url)
+        seen['auth'] = request.headers.get('authorization')
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": json.dumps({
+                "categories": ["Business"],
+                "tags": ["sales", "marketing"],
+                "summary": "Kurzfassung",
+                "confidence": 0.9
+            })}}]
+        })
+
+    mock_upstream(handler)
     resp = client.post('/api/ai/annotate', json={"text": "Test sales meeting"})
     assert resp.status_code == 200
     body = resp.json()
     assert 'categories' in body and 'tags' in body and 'summary' in body
+    assert seen['url'] == 'https://llm.test/v1/chat/completions'
+    assert seen['auth'] == 'Bearer test-key'
 
-@patch('backend.server.requests.post')
-def test_ai_rate_limit_upstream(mock_post):
-    class R:
-        status_code = 429
-        def raise_for_status(self):
-            pass
-        def json(self):
-            return {}
-    mock_post.return_value = R()
+
+def test_ai_rate_limit_upstream(mock_upstream):
+    mock_upstream(lambda request: httpx.Response(429, json={}))
     resp = client.post('/api/ai/annotate', json={"text": "Test"})
     # our endpoint converts 429 upstream into fallback 200 due to retry+fallback
     assert resp.status_code in (200, 429)
 
-@patch('backend.server.requests.post')
-def test_ai_invalid_json(mock_post):
-    class R:
-        status_code = 200
-        def raise_for_status(self):
-            pass
-        def json(self):
-            return {"choices": [{"message": {"content": "not json"}}]}
-    mock_post.return_value = R()
+
+def test_ai_invalid_json(mock_upstream):
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json={"choices": [{"message": {"content": "not json"}}]})
+
+    mock_upstream(handler)
     resp = client.post('/api/ai/annotate', json={"text": "Hello"})
     assert resp.status_code == 200
     body = resp.json()
-    assert 'summary' in body
\ No newline at end of file
+    assert 'summary' in body
+
+
+def llm_ok(calls):
+    def handler(request: httpx.Request):
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": json.dumps({
+                "categories": ["Private"], "tags": ["Einkauf"], "summary": "Liste", "confidence": 0.7
+            })}}]
+        })
+    return handler
+
+
+def test_ai_cache_hit_skips_upstream(mock_upstream):
+    calls = []
+    mock_upstream(llm_ok(calls))
+    first = client.post('/api/ai/annotate', json={"text": "Milch, Brot, Eier"}).json()
+    second = client.post('/api/ai/annotate', json={"text": "Milch, Brot, Eier"}).json()
+    assert len(calls) == 1
+    assert first['metadata']['cache'] == 'miss'
+    assert second['metadata']['cache'] == 'hit'
+    assert second['metadata']['cache_tier'] == 'memory'
+    assert second['tags'] == ['einkauf']
+
+
+def test_ai_cache_key_includes_options_and_bypass(mock_upstream):
+    calls = []
+    mock_upstream(llm_ok(calls))
+    client.post('/api/ai/annotate', json={"text": "Termin"})
+    client.post('/api/ai/annotate', json={"text": "Termin", "include_confidence": False})
+    client.post('/api/ai/annotate', json={"text": "Termin", "custom_categories": ["Business"]})
+    bypass = client.post('/api/ai/annotate', json={"text": "Termin", "use_cache": False}).json()
+    assert len(calls) == 4
+    assert bypass['metadata']['cache'] == 'bypass'
+
+
+def test_ai_fallback_not_cached(monkeypatch, mock_upstream):
+    monkeypatch.setattr(server, 'AI_MAX_RETRIES', 0)
+    mock_upstream(lambda request: httpx.Response(500))
+    body = client.post('/api/ai/annotate', json={"text": "Fallback Notiz"}).json()
+    assert body['metadata']['note'] == 'fallback-no-external-llm'
+    assert len(server.annotation_cache.memory) == 0
+
+
+def echo_llm(request: httpx.Request):
+    text = json.loads(request.content)["messages"][1]["content"].rsplit("Text:\n", 1)[1].strip()
+    if text.startswith("fail"):
+        return httpx.Response(500)
+    return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+        "categories": ["Business"], "tags": [text], "summary": text, "confidence": 0.5
+    })}}]})
+
+
+def test_ai_batch_in_order_with_per_item_fallback(monkeypatch, mock_upstream):
+    monkeypatch.setattr(server, 'AI_MAX_RETRIES', 0)
+    items = [{"id": "a", "text": "eins"}, {"id": "b", "text": "fail zwei"}, {"id": "c", "text": "drei"}]
+    mock_upstream(echo_llm)
+    resp = client.post('/api/ai/annotate/batch', json={"items": items})
+    assert resp.status_code == 200
+    results = resp.json()['results']
+    assert [r['id'] for r in results] == ['a', 'b', 'c']
+    assert results[0]['result']['summary'] == 'eins'
+    assert results[1]['result']['metadata']['note'] == 'fallback-no-external-llm'
+    assert results[2]['result']['tags'] == ['drei']
+
+
+def test_ai_batch_stream_ndjson(mock_upstream):
+    items = [{"id": str(i), "text": f"notiz {i}"} for i in range(5)]
+    mock_upstream(echo_llm)
+    resp = client.post('/api/ai/annotate/batch', json={"items": items, "stream": True})
+    assert resp.status_code == 200
+    assert resp.headers['content-type'].startswith('application/x-ndjson')
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert sorted(line['id'] for line in lines) == [str(i) for i in range(5)]
+
+
+def test_ai_batch_charges_rate_limit_per_item(monkeypatch, mock_upstream):
+    monkeypatch.setattr(server, 'rate_limiter', GCRALimiter(3))
+    items = [{"id": str(i), "text": f"notiz {i}"} for i in range(3)]
+    mock_upstream(echo_llm)
+    assert client.post('/api/ai/annotate/batch', json={"items": items}).status_code == 200
+    assert client.post('/api/ai/annotate/batch', json={"items": items[:2]}).status_code == 429
+    limited = client.post('/api/ai/annotate', json={"text": "noch eine"})
+    assert limited.status_code == 429
+    assert int(limited.headers['retry-after']) >= 1
+
+
+def test_ai_batch_larger_than_burst_is_rejected_up_front(monkeypatch):
+    monkeypatch.setattr(server, 'rate_limiter', GCRALimiter(30))
+    items = [{"id": str(i), "text": f"notiz {i}"} for i in range(31)]
+    resp = client.post('/api/ai/annotate/batch', json={"items": items})
+    assert resp.status_code == 413
+    assert "30 items" in resp.json()['detail']
+
+
+def test_ai_batch_rejects_duplicate_ids():
+    items = [{"id": "x", "text": "eins"}, {"id": "x", "text": "zwei"}]
+    assert client.post('/api/ai/annotate/batch', json={"items": items}).status_code == 422
@@ -0,0 +1,48 @@
+import asyncio
+
+from annotation_cache import AnnotationCache, LRUCache, annotation_cache_key
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        return self.docs.get(query["_id"])
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = doc
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", {"v": 1})
+    lru.set("b", {"v": 2})
+    assert lru.get("a") == {"v": 1}
+    lru.set("c", {"v": 3})
+    assert lru.get("b") is None
+    assert lru.get("a") == {"v": 1}
+    assert len(lru) == 2
+
+
+def test_cache_key_is_content_addressed():
+    k = annotation_cache_key("Hallo", "gpt-4o-mini", None, True)
+    assert k == annotation_cache_key("Hallo", "gpt-4o-mini", [], True)
+    assert k != annotation_cache_key("Hallo!", "gpt-4o-mini", None, True)
+    assert k != annotation_cache_key("Hallo", "gpt-4o", None, True)
+    assert k != annotation_cache_key("Hallo", "gpt-4o-mini", ["Business"], True)
+    assert k != annotation_cache_key("Hallo", "gpt-4o-mini", None, False)
+
+
+def test_mongo_tier_backfills_memory():
+    async def run():
+        coll = FakeCollection()
+        writer = AnnotationCache(coll)
+        await writer.set("k", {"summary": "s"})
+        await asyncio.gather(*writer._pending)
+        reader = AnnotationCache(coll)
+        assert await reader.get("k") == ({"summary": "s"}, "mongo")
+        assert await reader.get("k") == ({"summary": "s"}, "memory")
+        assert await reader.get("missing") == (None, None)
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import httpx
+
+from backend import server
+from chunking import merge_annotations, split_into_chunks
+
+
+def test_split_prefers_paragraph_and_sentence_boundaries():
+    paras = ["Absatz eins. " * 3, "Absatz zwei. " * 3, "Absatz drei. " * 3]
+    text = "\n\n".join(p.strip() for p in paras)
+    chunks = split_into_chunks(text, 60)
+    assert chunks == [p.strip() for p in paras]
+
+    long_para = " ".join(f"Satz {i} endet hier." for i in range(20))
+    chunks = split_into_chunks(long_para, 60)
+    assert all(len(c) <= 60 for c in chunks)
+    assert all(c.endswith(".") for c in chunks)
+    assert " ".join(c.replace("\n\n", " ") for c in chunks) == long_para
+
+
+def test_split_hard_cuts_oversized_sentence():
+    chunks = split_into_chunks("wort " * 100, 50)
+    assert all(len(c) <= 50 for c in chunks)
+    assert sum(c.count("wort") for c in chunks) == 100
+
+
+def test_merge_votes_by_length_and_confidence():
+    parts = [
+        {"categories": ["Business"], "tags": ["budget", "q3"], "confidence": 0.9},
+        {"categories": ["business", "Finance"], "tags": ["budget"], "confidence": 0.8},
+        {"categories": ["Travel"], "tags": ["hotel"], "confidence": 0.0},
+    ]
+    merged = merge_annotations(parts, [100, 100, 50])
+    assert merged["categories"] == ["Business", "Finance", "Travel"]
+    assert merged["tags"][0] == "budget"
+    assert merged["confidence"] == (0.9 * 100 + 0.8 * 100) / 250
+    assert merge_annotations(parts, [1, 1, 1], include_confidence=False)["confidence"] is None
+
+
+def test_chunked_annotation_with_failed_chunk(monkeypatch, mock_upstream):
+    calls = []
+
+    def handler(request: httpx.Request):
+        prompt = json.loads(request.content)["messages"][1]["content"]
+        calls.append(prompt)
+        if "Combine these partial summaries" in prompt:
+            return httpx.Response(200, json={"choices": [{"message": {"content": '{"summary": "Gesamt"}'}}]})
+        if "KAPUTT" in prompt:
+            return httpx.Response(400)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Business"], "tags": ["projekt"], "summary": "Teil", "confidence": 0.8
+        })}}]})
+
+    mock_upstream(handler)
+    monkeypatch.setattr(server, 'AI_CHUNK_MAX_CHARS', 100)
+    monkeypatch.setattr(server, 'AI_MAX_RETRIES', 0)
+
+    paragraphs = ["Projekt Alpha Planung. " * 3, "KAPUTT Projekt. " * 3, "Projekt Beta Abschluss. " * 3]
+    req = server.AnnotationRequest(text="\n\n".join(paragraphs), chunked=True)
+    resp = asyncio.run(server.annotate_one(req))
+
+    assert resp.metadata["chunks"] == 3
+    assert resp.metadata["chunks_failed"] == 1
+    assert resp.categories == ["Business"]
+    assert resp.tags[0] == "projekt"
+    assert resp.summary == "Gesamt"
+    assert len(calls) == 4
+    # degraded results are not cached
+    assert len(server.annotation_cache.memory) == 0
@@ -0,0 +1,103 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import server
+from circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, backoff_delay, is_upstream_failure
+from upstream import UpstreamRateLimited
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_breaker_honors_longer_retry_after():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5, clock=clock)
+    breaker.record_failure(retry_after=60)
+    clock.now = 30
+    assert breaker.state == OPEN
+    assert breaker.retry_in() == pytest.approx(30)
+
+
+def test_backoff_jitter_and_retry_after():
+    for attempt in range(4):
+        assert 0 <= backoff_delay(attempt, 1.0, 5.0) <= min(5.0, 2 ** attempt)
+    assert backoff_delay(0, 1.0, 5.0, retry_after=3) == 3
+    assert backoff_delay(0, 1.0, 5.0, retry_after=30) is None
+
+
+def test_failure_classification():
+    req = httpx.Request("POST", "https://llm.test/v1/chat/completions")
+    assert is_upstream_failure(UpstreamRateLimited(1))
+    assert is_upstream_failure(httpx.ConnectError("down", request=req))
+    assert is_upstream_failure(httpx.HTTPStatusError("", request=req, response=httpx.Response(503)))
+    assert not is_upstream_failure(httpx.HTTPStatusError("", request=req, response=httpx.Response(400)))
+    assert not is_upstream_failure(ValueError("No content from LLM"))
+
+
+def test_open_circuit_serves_fallback_without_upstream(monkeypatch, mock_upstream):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(503)
+
+    mock_upstream(handler)
+    monkeypatch.setattr(server, 'upstream_breaker', CircuitBreaker(failure_threshold=2, recovery_timeout=60))
+    monkeypatch.setattr(server, 'AI_BACKOFF_BASE_SECONDS', 0)
+    client = TestClient(server.app)
+
+    first = client.post('/api/ai/annotate', json={"text": "Gateway down"}).json()
+    assert len(calls) == 2  # opened on the second failed attempt
+    assert first['metadata']['circuit'] == 'open'
+
+    second = client.post('/api/ai/annotate', json={"text": "Noch eine Notiz"}).json()
+    assert len(calls) == 2
+    assert second['metadata']['note'] == 'fallback-no-external-llm'
+    assert 'circuit open' in second['metadata']['error']
+
+    health = client.get('/api/ai/health').json()
+    assert health['circuit']['state'] == 'open'
+
+
+def test_client_errors_are_not_retried_or_counted(monkeypatch, mock_upstream):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(401, json={"error": "invalid api key"})
+
+    mock_upstream(handler)
+    monkeypatch.setattr(server, 'upstream_breaker', CircuitBreaker(failure_threshold=1, recovery_timeout=60))
+    monkeypatch.setattr(server, 'AI_MAX_RETRIES', 3)
+    monkeypatch.setattr(server, 'AI_BACKOFF_BASE_SECONDS', 0)
+    retries = server.upstream_retries_total.value()
+    body = TestClient(server.app).post('/api/ai/annotate', json={"text": "Falscher Schlüssel"}).json()
+    assert calls == [1]
+    assert server.upstream_retries_total.value() == retries
+    assert body['metadata']['note'] == 'fallback-no-external-llm'
+    assert body['metadata']['circuit'] == CLOSED
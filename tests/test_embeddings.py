@@ -0,0 +1,76 @@
+import hashlib
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from backend import server
+from embeddings import EMBEDDING_DIM, base64_to_vector, hash_embeddings, text_seed, vector_to_base64
+from ratelimit import GCRALimiter
+
+client = TestClient(server.app)
+
+# sha256 of float32ToBlob(textToDeterministicVector(text)) as computed by the app
+APP_VECTOR_SHA256 = {
+    "Hallo Welt": "1ede26ff0182fbfae409ab17c99b25d9078d86c1c8630ecd0394c95197dfdc89",
+    "Grüße 👋 emoji 🎉": "c870a3c35021c5570524b5a2d496f5f738d98b95f0665b7b50acfe1353fb9e99",
+    "": "82aac6fa7d3846d8e3783ca2da51b6722e12520e319c943574481c89f68b8197",
+}
+
+
+def reference_seed(text):
+    # straight port of the JS loop over charCodeAt
+    seed = 0
+    units = text.encode("utf-16-le")
+    for i in range(0, len(units), 2):
+        seed = (seed * 31 + int.from_bytes(units[i:i + 2], "little")) & 0xFFFFFFFF
+    return seed
+
+
+def test_vectors_are_byte_identical_to_the_app():
+    texts = list(APP_VECTOR_SHA256)
+    for text, vec in zip(texts, hash_embeddings(texts)):
+        assert hashlib.sha256(vec.astype("<f4").tobytes()).hexdigest() == APP_VECTOR_SHA256[text]
+
+
+def test_vectorized_seed_matches_sequential_hash():
+    for text in ("a", "Notiz " * 2000, "\U0001F600 surrogates", "x" * 70000):
+        assert text_seed(text) == reference_seed(text)
+
+
+def test_vectors_are_unit_length_and_deterministic():
+    vecs = hash_embeddings(["eins", "zwei", "eins"])
+    assert vecs.shape == (3, EMBEDDING_DIM) and vecs.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vecs, axis=1), 1.0, atol=1e-6)
+    assert np.array_equal(vecs[0], vecs[2]) and not np.array_equal(vecs[0], vecs[1])
+
+
+def test_base64_roundtrip_is_little_endian_float32():
+    vec = hash_embeddings(["roundtrip"])[0]
+    assert len(vector_to_base64(vec)) == 4 * ((EMBEDDING_DIM * 4 + 2) // 3)
+    assert np.array_equal(base64_to_vector(vector_to_base64(vec)), vec)
+
+
+def test_embed_endpoint_batches_in_order(monkeypatch):
+    monkeypatch.setattr(server, "EMBED_BATCH_SIZE", 2)
+    texts = ["Hallo Welt", "b", "c", "Grüße 👋 emoji 🎉", ""]
+    resp = client.post("/api/embed", json={"texts": texts})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["dim"] == EMBEDDING_DIM and body["model"] == "hash-v1"
+    assert len(body["vectors"]) == len(texts)
+    expected = [vector_to_base64(v) for v in hash_embeddings(texts)]
+    assert body["vectors"] == expected
+
+
+def test_embed_endpoint_validates_batch():
+    assert client.post("/api/embed", json={"texts": []}).status_code == 422
+
+
+def test_embed_has_its_own_rate_limit_budget(monkeypatch):
+    monkeypatch.setattr(server, "embed_rate_limiter", GCRALimiter(60, 2))
+    before = server.annotate_stage_seconds.count(stage="rate_guard")
+    assert [client.post("/api/embed", json={"texts": ["x"]}).status_code for _ in range(3)] == [200, 200, 429]
+    assert server.rate_limit_rejections_total.value(budget="embed") >= 1
+    # the annotate bucket and its stage histogram are untouched
+    assert server.annotate_stage_seconds.count(stage="rate_guard") == before
+    assert len(server.rate_limiter) == 0
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import random
+
+import httpx
+from fastapi.testclient import TestClient
+
+from backend import server
+from entities import AhoCorasick, EntityExtractor, parse_gazetteer
+
+client = TestClient(server.app)
+
+
+def test_automaton_finds_overlapping_patterns_like_naive_search():
+    rnd = random.Random(3)
+    patterns = {"".join(rnd.choice("abc") for _ in range(rnd.randint(1, 4))) for _ in range(30)}
+    ac = AhoCorasick()
+    for p in patterns:
+        ac.add(p, p)
+    ac.build()
+    text = "".join(rnd.choice("abcd") for _ in range(500))
+    naive = {(i, i + len(p), p) for p in patterns for i in range(len(text)) if text.startswith(p, i)}
+    assert set(ac.iter_matches(text)) == naive
+
+
+def test_gazetteer_aliases_boundaries_and_case():
+    extractor = EntityExtractor({
+        "place": parse_gazetteer(["# comment", "München|Muenchen|Munich", "Ulm"]),
+        "organization": parse_gazetteer(["Deutsche Bahn|DB"]),
+    })
+    found = extractor.extract("Mit der DB von munich nach Ulm, nicht Ulmenweg; db ist kein Treffer. Ulm!")
+    assert [(e["text"], e["type"], e["normalized"]) for e in found] == [
+        ("DB", "organization", "Deutsche Bahn"),
+        ("munich", "place", "München"),
+        ("Ulm", "place", "Ulm"),
+    ]
+    assert found[1]["start"] == 15 and found[1]["end"] == 21
+
+
+def test_patterns_are_normalized():
+    extractor = EntityExtractor({})
+    text = ("Am 12. März 2024 bzw. 2024-05-01 oder 3.6.24: 1.234,50 € und USD 12.5 an "
+            "Info@Firma.de, Tel. +49 30 1234567 oder (030) 123 45 67, PLZ 01067 zählt nicht.")
+    found = {(e["type"], e["normalized"]) for e in extractor.extract(text)}
+    assert found == {
+        ("date", "2024-03-12"), ("date", "2024-05-01"), ("date", "2024-06-03"),
+        ("amount", "1234.50 EUR"), ("amount", "12.50 USD"),
+        ("email", "info@firma.de"),
+        ("phone", "+49301234567"), ("phone", "0301234567"),
+    }
+
+
+def test_longest_match_wins_and_duplicates_collapse():
+    extractor = EntityExtractor({"place": parse_gazetteer(["Frankfurt am Main|Frankfurt", "Main"])})
+    found = extractor.extract("Frankfurt am Main, dann wieder Frankfurt.")
+    assert [(e["text"], e["normalized"]) for e in found] == [("Frankfurt am Main", "Frankfurt am Main")]
+
+
+def test_default_gazetteers_load():
+    found = EntityExtractor.from_dir().extract("Termin beim Finanzamt in Köln, iPhone mitnehmen.")
+    assert {(e["type"], e["normalized"]) for e in found} == {
+        ("organization", "Finanzamt"), ("place", "Köln"), ("product", "iPhone")}
+
+
+def test_entities_on_llm_and_fallback_paths_and_opt_out(mock_upstream):
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(1)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Business"], "tags": ["termin"], "summary": "s", "confidence": 0.8})}}]})
+
+    text = "Termin mit der Telekom in Berlin am 01.07.2024"
+    mock_upstream(handler)
+    llm = client.post('/api/ai/annotate', json={"text": text}).json()
+    local = client.post('/api/ai/annotate', json={"text": text, "ai_opt_in": False}).json()
+    expected = [("Telekom", "Deutsche Telekom"), ("Berlin", "Berlin"), ("01.07.2024", "2024-07-01")]
+    assert [(e["text"], e["normalized"]) for e in llm["entities"]] == expected
+    assert llm["tags"] == ["termin"]
+    assert calls == [1]
+    assert local["metadata"]["note"] == "local-no-ai-opt-in"
+    assert [(e["text"], e["normalized"]) for e in local["entities"]] == expected
+    assert local["tags"][:2] == ["deutsche telekom", "berlin"]
+    # keywords that are words of an entity are not repeated next to it
+    assert "telekom" not in local["tags"] and "2024" not in local["tags"]
+
+    mock_upstream(lambda r: httpx.Response(400))
+    fallback = client.post('/api/ai/annotate', json={"text": text + "!", "use_cache": False}).json()
+    assert fallback["metadata"]["note"] == "fallback-no-external-llm"
+    assert [e["normalized"] for e in fallback["entities"]] == [n for _, n in expected]
+
+
+def test_entities_are_cached_with_the_result_and_long_texts_leave_the_loop(mock_upstream, monkeypatch):
+    mock_upstream(lambda r: httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+        "categories": ["Business"], "tags": ["termin"], "summary": "s"})}}]}))
+    on_loop = []
+    extract = server.get_entity_extractor().extract
+
+    def recording_extract(text, limit):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return extract(text, limit)
+
+    monkeypatch.setattr(server.get_entity_extractor(), "extract", recording_extract)
+    monkeypatch.setattr(server, "AI_ENTITIES_OFFLOAD_CHARS", 1000)
+
+    text = "Termin mit der Telekom in Berlin. " + "Weitere Notizen ohne Namen. " * 40
+    miss = client.post('/api/ai/annotate', json={"text": text}).json()
+    hit = client.post('/api/ai/annotate', json={"text": text}).json()
+    assert hit["metadata"]["cache"] == "hit"
+    assert hit["entities"] == miss["entities"] and [e["text"] for e in hit["entities"]] == ["Telekom", "Berlin"]
+    # extracted once, on the miss, and not on the event loop
+    assert on_loop == [False]
@@ -0,0 +1,62 @@
+import json
+
+from fallback import FallbackAnnotator, build_corpus_stats, split_sentences, tokenize
+
+
+def test_tokenize_single_pass_unicode():
+    assert tokenize("Größe: 3 Schraubenzieher, snake_case & Café!") == [
+        "größe", "3", "schraubenzieher", "snake", "case", "café"]
+
+
+def test_split_sentences_on_punctuation_and_newlines():
+    assert split_sentences("Erster Satz. Zweiter Satz!\nDritter") == ["Erster Satz.", "Zweiter Satz!", "Dritter"]
+
+
+def test_tags_skip_stopwords_and_rank_by_frequency():
+    annotator = FallbackAnnotator()
+    text = "Schraubenzieher kaufen. Der Schraubenzieher liegt in der Garage, nicht im Keller. Schraubenzieher!"
+    result = annotator.annotate(text, ["Privat", "Haus", "Garten"])
+    assert result["tags"][0] == "schraubenzieher"
+    assert "nicht" not in result["tags"]
+    assert len(result["tags"]) == len(set(result["tags"]))
+    assert result["categories"] == ["Privat", "Haus"]
+    assert result["summary"] == text
+
+
+def test_idf_from_corpus_stats_reorders_keywords(tmp_path):
+    stats = build_corpus_stats(["meeting notes budget", "meeting agenda", "meeting budget review"])
+    assert stats == {"documents": 3, "df": {
+        "meeting": 3, "notes": 1, "budget": 2, "agenda": 1, "review": 1}}
+    (tmp_path / "stats.json").write_text(json.dumps(stats))
+    plain = FallbackAnnotator().annotate("meeting meeting quarterly")
+    weighted = FallbackAnnotator(stats_path=tmp_path / "stats.json").annotate("meeting meeting quarterly")
+    assert plain["tags"] == ["meeting", "quarterly"]
+    assert weighted["tags"] == ["quarterly", "meeting"]
+
+
+def test_extractive_summary_for_long_text():
+    filler = ("Heute war das Wetter sonnig. Gestern regnete es lange. Am Wochenende besuchen wir Oma. "
+              "Der Hund braucht neues Futter. Im Garten blühen schon Tulpen. Kino am Freitag klingt gut.")
+    text = "Die Steuererklärung für Finanzamt muss bis Juli fertig sein. " + filler + \
+        " Für die Steuererklärung fehlen noch Belege vom Finanzamt."
+    summary = FallbackAnnotator().annotate(text)["summary"]
+    assert summary.startswith("Die Steuererklärung")
+    assert len(summary) <= 300
+    assert summary != text[:180] + "..."
+
+
+def test_summary_does_not_repeat_a_duplicated_sentence():
+    lead = "Die Steuererklärung für das Finanzamt muss bis Juli fertig sein."
+    filler = " Heute war das Wetter sonnig. Gestern regnete es lange. Am Wochenende besuchen wir Oma."
+    text = lead + filler + " die steuererklärung für das finanzamt muss bis juli fertig sein!"
+    summary = FallbackAnnotator().annotate(text)["summary"]
+    assert summary.lower().count("steuererklärung") == 1
+
+
+def test_reload_picks_up_new_stats(tmp_path):
+    path = tmp_path / "stats.json"
+    annotator = FallbackAnnotator(stats_path=path, reload_interval=0)
+    assert annotator.documents == 0
+    path.write_text(json.dumps({"documents": 5, "df": {"alpha": 5}}))
+    assert annotator.maybe_reload()
+    assert annotator.documents == 5
@@ -0,0 +1,223 @@
+import asyncio
+import copy
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import DuplicateKeyError
+
+from backend import server
+from jobs import DEAD, DONE, QUEUED, JobQueue, JobWorkerPool, RetryJob
+
+
+class FakeJobCollection:
+    """Just enough of a Motor collection for the queries JobQueue issues."""
+
+    def __init__(self):
+        self.docs = {}
+
+    @staticmethod
+    def _match(doc, query):
+        for key, cond in query.items():
+            if key == "$or":
+                if not any(FakeJobCollection._match(doc, q) for q in cond):
+                    return False
+            elif isinstance(cond, dict):
+                value = doc.get(key)
+                if "$lte" in cond and not (value is not None and value <= cond["$lte"]):
+                    return False
+                if "$lt" in cond and not (value is not None and value < cond["$lt"]):
+                    return False
+                if "$gte" in cond and not (value is not None and value >= cond["$gte"]):
+                    return False
+            elif doc.get(key) != cond:
+                return False
+        return True
+
+    async def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("dup")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    async def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return copy.deepcopy(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, sort=None, return_document=None):
+        matches = sorted((d for d in self.docs.values() if self._match(d, query)),
+                         key=lambda d: d[sort[0][0]] if sort else 0)
+        if not matches:
+            return None
+        doc = matches[0]
+        doc.update(update.get("$set", {}))
+        for k, v in update.get("$inc", {}).items():
+            doc[k] = doc.get(k, 0) + v
+        return copy.deepcopy(doc)
+
+    async def update_one(self, query, update):
+        for doc in self.docs.values():
+            if self._match(doc, query):
+                doc.update(update["$set"])
+                return SimpleNamespace(modified_count=1)
+        return SimpleNamespace(modified_count=0)
+
+    async def update_many(self, query, update):
+        matches = [d for d in self.docs.values() if self._match(d, query)]
+        for doc in matches:
+            doc.update(update["$set"])
+        return SimpleNamespace(modified_count=len(matches))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_claim_complete_and_lease_expiry():
+    async def scenario():
+        coll = FakeJobCollection()
+        queue = JobQueue(coll, lease_seconds=60)
+        job = await queue.enqueue({"text": "a"})
+        claimed = await queue.claim("w1")
+        assert claimed["_id"] == job["_id"] and claimed["attempts"] == 1
+        assert await queue.claim("w2") is None
+        # worker w1 dies: once the lease is over the job can be claimed again
+        coll.docs[job["_id"]]["lease_until"] = datetime.utcnow() - timedelta(seconds=1)
+        reclaimed = await queue.claim("w2")
+        assert reclaimed["worker"] == "w2" and reclaimed["attempts"] == 2
+        # the stale worker can no longer complete it
+        assert not await queue.complete(job["_id"], "w1", {"summary": "stale"})
+        assert await queue.complete(job["_id"], "w2", {"summary": "ok"})
+        assert (await queue.get(job["_id"]))["status"] == DONE
+
+    run(scenario())
+
+
+def test_retries_then_dead_letter():
+    async def scenario():
+        coll = FakeJobCollection()
+        queue = JobQueue(coll, max_attempts=2, retry_base_seconds=0)
+        job = await queue.enqueue({"text": "a"})
+        claimed = await queue.claim("w")
+        assert await queue.fail(claimed, "w", "boom") == QUEUED
+        claimed = await queue.claim("w")
+        assert claimed["attempts"] == 2
+        assert await queue.fail(claimed, "w", "boom again") == DEAD
+        doc = await queue.get(job["_id"])
+        assert doc["status"] == DEAD and doc["error"] == "boom again"
+
+    run(scenario())
+
+
+def test_expired_lease_on_last_attempt_is_dead_lettered():
+    async def scenario():
+        coll = FakeJobCollection()
+        queue = JobQueue(coll, max_attempts=2)
+        job = await queue.enqueue({"text": "crasht den Worker"})
+        for attempt in (1, 2):
+            claimed = await queue.claim(f"w{attempt}")
+            assert claimed["attempts"] == attempt
+            # the worker dies mid-job every time
+            coll.docs[job["_id"]]["lease_until"] = datetime.utcnow() - timedelta(seconds=1)
+        assert await queue.claim("w3") is None
+        doc = await queue.get(job["_id"])
+        assert doc["status"] == DEAD and doc["attempts"] == 2 and doc["error"] == "lease expired on the last attempt"
+
+    run(scenario())
+
+
+def test_worker_pool_processes_and_long_poll_wakes():
+    async def scenario():
+        queue = JobQueue(FakeJobCollection())
+        attempts = []
+
+        async def handler(job):
+            attempts.append(job["attempts"])
+            if job["attempts"] == 1:
+                raise RetryJob("upstream down", {"summary": "fallback"})
+            return {"summary": job["payload"]["text"].upper()}
+
+        queue.retry_base_seconds = 0
+        pool = JobWorkerPool(queue, handler, concurrency=2, poll_interval=0.01)
+        pool.start()
+        job = await queue.enqueue({"text": "hallo"})
+        done = await queue.wait(job["_id"], timeout=2, poll_interval=0.01)
+        await pool.stop()
+        assert done["status"] == DONE
+        assert done["result"] == {"summary": "HALLO"}
+        assert attempts == [1, 2]
+
+    run(scenario())
+
+
+def test_retry_job_keeps_fallback_on_last_attempt():
+    async def scenario():
+        queue = JobQueue(FakeJobCollection(), max_attempts=1)
+
+        async def handler(job):
+            raise RetryJob("upstream down", {"summary": "fallback"})
+
+        pool = JobWorkerPool(queue, handler)
+        job = await queue.enqueue({"text": "x"})
+        await pool.process(await queue.claim("w"), "w")
+        doc = await queue.get(job["_id"])
+        assert doc["status"] == DONE and doc["result"] == {"summary": "fallback"}
+
+    run(scenario())
+
+
+@pytest.fixture
+def job_client(monkeypatch):
+    monkeypatch.setattr(server, 'job_queue', JobQueue(FakeJobCollection()))
+    return TestClient(server.app)
+
+
+def test_job_endpoints(job_client):
+    resp = job_client.post('/api/ai/jobs', json={"text": "Notiz"}, headers={"Idempotency-Key": "abc"})
+    assert resp.status_code == 202
+    job = resp.json()
+    assert job['status'] == QUEUED
+    again = job_client.post('/api/ai/jobs', json={"text": "Notiz"}, headers={"Idempotency-Key": "abc"}).json()
+    assert again['id'] == job['id']
+
+    assert job_client.get(f"/api/ai/jobs/{job['id']}").json()['status'] == QUEUED
+    assert job_client.get('/api/ai/jobs/nope').status_code == 404
+
+
+def test_idempotency_keys_and_reads_are_scoped_to_the_caller(job_client, monkeypatch):
+    address = {"key": "ip:10.0.0.1"}
+    monkeypatch.setattr(server, 'rate_limit_key', lambda req: address["key"])
+
+    def post(text, **headers):
+        return job_client.post('/api/ai/jobs', json={"text": text}, headers={"Idempotency-Key": "retry-1", **headers})
+
+    keyed = post("Notiz", **{"X-API-Key": "k1"}).json()
+    anonymous = post("Notiz").json()
+    # the retry comes from another network (wifi -> mobile)
+    address["key"] = "ip:100.64.3.7"
+    assert post("Notiz", **{"X-API-Key": "k1"}).json()['id'] == keyed['id']
+    # an unrelated anonymous client with the same key gets its own job and cannot read the first one
+    stranger = post("Notiz").json()
+    assert stranger['id'] not in (keyed['id'], anonymous['id'])
+    assert job_client.get(f"/api/ai/jobs/{anonymous['id']}").status_code == 404
+    assert job_client.get(f"/api/ai/jobs/{keyed['id']}").status_code == 404
+    assert job_client.get(f"/api/ai/jobs/{keyed['id']}", headers={"X-API-Key": "k1"}).status_code == 200
+    # reusing a key for a different text is a conflict, not the old result
+    assert post("Andere Notiz", **{"X-API-Key": "k1"}).status_code == 409
+    assert len(server.job_queue.collection.docs) == 3
+
+
+def test_jobs_are_admitted_under_the_submitting_client(job_client, monkeypatch):
+    job = job_client.post('/api/ai/jobs', json={"text": "Notiz"}).json()
+    doc = server.job_queue.collection.docs[job['id']]
+    assert doc['client'] == "ip:testclient"
+    seen = []
+
+    async def fake_annotate(input, admission, route, scope):
+        seen.append((admission.client, admission.priority, route, scope))
+        return server.AnnotationResponse(categories=[], tags=[], summary="", confidence=0.0,
+                                         processing_time=0.0, metadata={})
+
+    monkeypatch.setattr(server, 'annotate_one', fake_annotate)
+    run(server.run_annotation_job(doc))
+    assert seen == [("ip:testclient", server.BACKGROUND, "jobs", doc['owner'])]
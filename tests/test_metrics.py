@@ -0,0 +1,44 @@
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from backend import server
+from metrics import Registry
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    hits = registry.counter("hits_total", "Hits", ["kind"])
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    hits.inc(kind="a")
+    hits.inc(2, kind="a")
+    latency.observe(0.05)
+    latency.observe(0.1)
+    latency.observe(3)
+    text = registry.render()
+    assert "# TYPE hits_total counter" in text
+    assert 'hits_total{kind="a"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+
+
+def test_metrics_endpoint_reports_annotate_stages(mock_upstream):
+    def handler(request):
+        return httpx.Response(200, json={"choices": [{"message": {"content": "```json\n" + json.dumps({
+            "categories": ["Business"], "tags": ["x"], "summary": "s", "confidence": 0.5}) + "\n```"}}]})
+
+    mock_upstream(handler, observe=lambda stage, seconds: server.annotate_stage_seconds.observe(seconds, stage=stage))
+    server.metrics_registry.reset()
+    client = TestClient(server.app)
+
+    assert client.post('/api/ai/annotate', json={"text": "Metriken bitte"}).status_code == 200
+    text = client.get('/metrics').text
+
+    for stage in ("rate_guard", "upstream_response", "parse", "serialize"):
+        assert f'ai_annotate_stage_seconds_count{{stage="{stage}"}} 1' in text
+    assert 'ai_annotation_cache_total{result="miss"} 1' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/ai/annotate",status="200"} 1' in text
+    assert server.fallbacks_total.value(reason="upstream_error") == 0
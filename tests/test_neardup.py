@@ -0,0 +1,88 @@
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from backend import server
+from neardup import NearDuplicateIndex, patch_annotation
+
+client = TestClient(server.app)
+
+LIST = "Einkaufsliste: Milch, Brot, Eier, Butter, Käse, Tomaten, Gurken, Äpfel, Bananen, Kaffee"
+
+
+def test_lookup_finds_small_edit_in_same_namespace():
+    index = NearDuplicateIndex(max_entries=10, threshold=0.8)
+    index.add("k1", LIST, "ns", {"tags": ["einkauf"]})
+    match = index.lookup(LIST.replace("Kaffee", "Tee"), "ns")
+    assert match is not None and match.key == "k1"
+    assert match.similarity == 10 / 12 and match.removed == {"kaffee"}
+    assert index.lookup(LIST.replace("Kaffee", "Tee"), "other-model") is None
+    assert index.lookup("Ganz anderer Text über das Wetter morgen früh und Regen", "ns") is None
+
+
+def test_threshold_and_short_texts():
+    index = NearDuplicateIndex(threshold=0.95)
+    index.add("k1", LIST, "ns", {})
+    assert index.lookup(LIST.replace("Kaffee", "Tee"), "ns") is None
+    index.add("short", "Milch kaufen", "ns", {})
+    assert len(index) == 1
+
+
+def test_eviction_keeps_buckets_bounded():
+    index = NearDuplicateIndex(max_entries=3)
+    for i in range(10):
+        index.add(f"k{i}", f"{LIST} Nummer{i} Extra{i}", "ns", {"i": i})
+    assert len(index) == 3
+    assert {k for bucket in index._buckets.values() for k in bucket} == {"k7", "k8", "k9"}
+    # a lookup refreshes an entry, so it survives the next eviction
+    assert index.lookup(f"{LIST} Nummer7 Extra7", "ns").key == "k7"
+    index.add("k10", f"{LIST} Nummer10 Extra10", "ns", {})
+    assert "k8" not in index._entries and "k7" in index._entries
+
+
+def test_patch_drops_tags_of_removed_words():
+    value, dropped = patch_annotation({"tags": ["kaffee", "einkauf", "milch"]}, frozenset({"kaffee"}))
+    assert value["tags"] == ["einkauf", "milch"] and dropped == 1
+
+
+def test_annotate_reuses_near_duplicate(mock_upstream):
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(1)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Privat"], "tags": ["einkauf", "kaffee"], "summary": "Einkaufsliste",
+            "confidence": 0.9})}}]})
+
+    mock_upstream(handler)
+    first = client.post('/api/ai/annotate', json={"text": LIST}).json()
+    edited = client.post('/api/ai/annotate', json={"text": LIST.replace("Kaffee", "Tee")}).json()
+    other_categories = client.post('/api/ai/annotate', json={
+        "text": LIST.replace("Kaffee", "Tee"), "custom_categories": ["Haushalt"]}).json()
+    assert calls == [1, 1]
+    assert first["metadata"]["cache"] == "miss"
+    assert edited["metadata"]["cache"] == "near"
+    assert edited["metadata"]["near_duplicate"]["tags_dropped"] == 1
+    assert edited["tags"] == ["einkauf"] and edited["categories"] == ["Privat"]
+    # the earlier summary describes the earlier text; this one is made from the edited text
+    assert edited["summary"] != "Einkaufsliste" and "Tee" in edited["summary"]
+    assert other_categories["metadata"]["cache"] == "miss"
+
+
+def test_near_duplicates_are_not_shared_between_clients(mock_upstream):
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(1)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Privat"], "tags": ["einkauf"], "summary": "Liste von A"})}}]})
+
+    mock_upstream(handler)
+    edited = LIST.replace("Kaffee", "Tee")
+    client.post('/api/ai/annotate', json={"text": LIST}, headers={"X-API-Key": "a"})
+    other = client.post('/api/ai/annotate', json={"text": edited}, headers={"X-API-Key": "b"}).json()
+    same = client.post('/api/ai/annotate', json={"text": LIST.replace("Kaffee", "Saft")},
+                       headers={"X-API-Key": "a"}).json()
+    assert other["metadata"]["cache"] == "miss" and same["metadata"]["cache"] == "near"
+    assert calls == [1, 1]
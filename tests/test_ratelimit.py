@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from ratelimit import GCRALimiter, MongoGCRALimiter, RateLimited
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_gcra_burst_then_steady_rate():
+    clock = FakeClock()
+    limiter = GCRALimiter(60, burst=3, clock=clock)
+    assert [limiter.check("a") for _ in range(3)] == [None, None, None]
+    wait = limiter.check("a")
+    assert wait == pytest.approx(1.0)
+    clock.now += 1.0
+    assert limiter.check("a") is None
+    assert limiter.check("a") is not None
+    # other keys are independent
+    assert limiter.check("b") is None
+
+
+def test_gcra_cost_and_oversized_requests():
+    limiter = GCRALimiter(30, clock=FakeClock())
+    assert limiter.check("a", cost=30) is None
+    assert limiter.check("a", cost=1) is not None
+    assert limiter.check("b", cost=31) == float("inf")
+
+
+def test_gcra_sweeps_idle_keys():
+    clock = FakeClock()
+    limiter = GCRALimiter(60, sweep_interval=10, clock=clock)
+    for i in range(100):
+        limiter.check(f"ip{i}")
+    assert len(limiter) == 100
+    clock.now += 11
+    limiter.check("fresh")
+    assert len(limiter) == 1
+
+
+def test_mongo_limiter_falls_back_to_local_when_unavailable():
+    class DownCollection:
+        async def find_one_and_update(self, *args, **kwargs):
+            raise ConnectionError("no mongo")
+
+    async def run():
+        limiter = MongoGCRALimiter(DownCollection(), 2, fallback=GCRALimiter(2, clock=FakeClock()))
+        await limiter.acquire("a")
+        await limiter.acquire("a")
+        with pytest.raises(RateLimited):
+            await limiter.acquire("a")
+
+    asyncio.run(run())
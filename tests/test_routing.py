@@ -0,0 +1,97 @@
+import json
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+from backend import server
+from routing import ModelRouter, parse_models, parse_slos
+
+client = TestClient(server.app)
+
+MODELS = {"small": 0, "medium": 1, "large": 2}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_specs():
+    assert parse_models("small=0, large=2,plain", "d") == {"small": 0, "large": 2, "plain": 1}
+    assert parse_models("", "d") == {"d": 1}
+    assert parse_slos("annotate=3000,stream=0") == {"annotate": 3.0}
+
+
+def test_tier_and_budget_follow_the_input():
+    router = ModelRouter(MODELS, long_input_chars=100, min_tokens=200, max_tokens=400)
+    assert router.required_tier("kurz", None) == 1
+    assert router.required_tier("kurz", ["Arbeit", "Privat"]) == 0
+    assert router.required_tier("x" * 101, None) == 2
+    assert router.token_budget("", None) == 200
+    assert router.token_budget("x" * 500, None) == 400
+    assert router.token_budget("", ["Arbeit"]) == 150
+    assert router.route("kurz", ["Arbeit"]).model == "small"
+    assert router.route("x" * 101).model == "large"
+    assert router.route("kurz", requested="large").reason == "requested"
+
+
+def test_fastest_healthy_model_wins_and_errors_decay():
+    clock = FakeClock()
+    router = ModelRouter(MODELS, clock=clock, error_half_life=10)
+    router.observe("large", 0.5, ok=True)
+    router.observe("medium", 3.0, ok=True)
+    assert router.route("kurz").model == "large"
+    for _ in range(5):
+        router.observe("large", 0.1, ok=False)
+    assert router.error_rate("large") > 0.5
+    assert router.route("kurz").model == "medium"
+    # an idle model's error rate halves every half-life, so it gets traffic again
+    clock.now += 30
+    assert router.route("kurz").model == "large"
+
+
+def test_slo_downgrades_to_lower_tier():
+    router = ModelRouter(MODELS, slos={"stream": 1.0})
+    for name, seconds in (("small", 0.4), ("medium", 2.0), ("large", 2.5)):
+        router.observe(name, seconds, ok=True)
+    assert router.route("kurz", route="annotate").model == "medium"
+    downgraded = router.route("kurz", route="stream")
+    assert (downgraded.model, downgraded.reason) == ("small", "slo_downgrade")
+    router.observe("small", 5.0, ok=True)
+    assert router.route("kurz", route="stream").reason == "slo_unmet"
+
+
+def test_annotate_reports_route_and_feeds_latency(mock_upstream):
+    seen = []
+
+    def handler(request: httpx.Request):
+        payload = json.loads(request.content)
+        seen.append((payload["model"], payload["max_tokens"]))
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Arbeit"], "tags": ["x"], "summary": "s", "confidence": 0.5})}}]})
+
+    router = ModelRouter({"mini": 0, "pro": 1}, min_tokens=200, max_tokens=400)
+    mock_upstream(handler)
+    with patch.object(server, 'model_router', router):
+        picked = client.post('/api/ai/annotate', json={
+            "text": "Meeting morgen", "custom_categories": ["Arbeit", "Privat"]}).json()
+        pinned = client.post('/api/ai/annotate', json={"text": "Meeting morgen", "model": "pro"}).json()
+        health = client.get('/api/ai/health').json()
+    assert seen == [("mini", 150), ("pro", 200)]
+    assert picked["metadata"]["model"] == "mini"
+    assert picked["metadata"]["routing"]["reason"] == "fastest_in_tier"
+    assert pinned["metadata"]["routing"]["reason"] == "requested"
+    assert health["models"]["mini"]["calls"] == 1 and health["models"]["pro"]["calls"] == 1
+
+
+def test_failing_top_tier_is_still_used_for_long_input():
+    router = ModelRouter({"a": 1, "b": 2}, long_input_chars=4000)
+    for _ in range(5):
+        router.observe("b", 0.1, ok=False)
+    routed = router.route("x" * 5000)
+    assert (routed.model, routed.reason) == ("b", "tier_unhealthy")
+    assert router.route("kurz").model == "a"
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from backend import server
+from scheduler import BACKGROUND, BATCH, INTERACTIVE, Admission, FairScheduler, Overloaded, parse_weights
+
+
+async def _run_all(sched, admissions, order, hold=0.01):
+    async def call(name, adm):
+        async with sched.slot(adm):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    blocker = Admission("blocker")
+    await sched.acquire(blocker)  # keep the single slot busy while everyone queues
+    tasks = [asyncio.create_task(call(name, adm)) for name, adm in admissions]
+    await asyncio.sleep(0)
+    sched.release(None)
+    await asyncio.gather(*tasks)
+
+
+def test_interactive_goes_before_batch_and_background():
+    sched = FairScheduler(1)
+    order = []
+    asyncio.run(_run_all(sched, [
+        ("job", Admission("jobs", BACKGROUND)),
+        ("batch", Admission("a", BATCH)),
+        ("live", Admission("b", INTERACTIVE)),
+    ], order))
+    assert order == ["live", "batch", "job"]
+
+
+def test_heavy_client_does_not_starve_others():
+    sched = FairScheduler(1)
+    order = []
+    heavy = [(f"heavy{i}", Admission("heavy", BATCH)) for i in range(6)]
+    light = [(f"light{i}", Admission("light", BATCH)) for i in range(2)]
+    asyncio.run(_run_all(sched, heavy + light, order))
+    # the light client's calls interleave instead of waiting behind all six
+    assert order.index("light1") < 4
+
+
+def test_weights_give_proportional_share():
+    sched = FairScheduler(1, weights=parse_weights("key:big=3, ip:1.2.3.4=1"))
+    order = []
+    calls = [(f"big{i}", Admission("key:big", BATCH)) for i in range(6)]
+    calls += [(f"small{i}", Admission("ip:1.2.3.4", BATCH)) for i in range(6)]
+    asyncio.run(_run_all(sched, calls, order))
+    assert sum(name.startswith("big") for name in order[:8]) == 6
+
+
+def test_sheds_when_estimated_wait_exceeds_deadline():
+    async def run():
+        sched = FairScheduler(1, initial_service_time=5.0)
+        await sched.acquire(Admission("a"))
+        with pytest.raises(Overloaded) as e:
+            await sched.acquire(Admission("b", deadline=time.monotonic() + 1))
+        assert e.value.estimated_wait == pytest.approx(5.0)
+        # a deadline that passes while queued is shed too
+        sched.service_time = 0.01
+        with pytest.raises(Overloaded):
+            await sched.acquire(Admission("c", deadline=time.monotonic() + 0.05))
+        assert sched.shed == 2 and sched.queued() == 0
+        sched.release(None)
+        assert sched.inflight == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_frees_its_place():
+    async def run():
+        sched = FairScheduler(1)
+        await sched.acquire(Admission("a"))
+        waiter = asyncio.create_task(sched.acquire(Admission("b")))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        sched.release(0.5)
+        assert sched.inflight == 0 and sched.queued() == 0 and not sched._clients
+
+    asyncio.run(run())
+
+
+def test_overloaded_annotation_returns_fallback_fast(monkeypatch, mock_upstream):
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(1)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Private"], "tags": ["x"], "summary": "s"})}}]})
+
+    async def run():
+        mock_upstream(handler)
+        sched = FairScheduler(1, initial_service_time=10.0)
+        monkeypatch.setattr(server, 'upstream_scheduler', sched)
+        await sched.acquire(Admission("someone-else"))
+        req = server.AnnotationRequest(text="Rechnung an Kunde schicken", use_cache=False)
+        t0 = time.monotonic()
+        resp = await server.annotate_one(req, Admission("me", deadline=time.monotonic() + 2))
+        return resp, time.monotonic() - t0
+
+    before = server.fallbacks_total.value(reason="overloaded")
+    resp, elapsed = asyncio.run(run())
+    assert resp.metadata["note"] == "fallback-no-external-llm"
+    assert calls == [] and elapsed < 1
+    assert server.fallbacks_total.value(reason="overloaded") == before + 1
+
+
+def test_shedding_during_half_open_returns_the_probe(monkeypatch):
+    now = [0.0]
+    breaker = server.CircuitBreaker(failure_threshold=1, recovery_timeout=30, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 31.0
+    assert breaker.state == "half_open"
+    monkeypatch.setattr(server, 'upstream_breaker', breaker)
+
+    async def run():
+        sched = FairScheduler(1, initial_service_time=10.0)
+        monkeypatch.setattr(server, 'upstream_scheduler', sched)
+        await sched.acquire(Admission("someone-else"))
+        with pytest.raises(Overloaded):
+            await server.call_llm_with_retries({"model": "m"}, Admission("me", deadline=time.monotonic() + 1))
+
+    asyncio.run(run())
+    # the probe was never sent, so the next caller may still probe instead of being rejected
+    assert breaker.state == "half_open" and breaker.allow()
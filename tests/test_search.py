@@ -0,0 +1,173 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from accounts import issue_token
+from backend import server
+from embeddings import hash_embeddings, vector_to_base64
+from search import SearchIndex, SearchService
+
+client = TestClient(server.app)
+
+NOTES = [
+    ("n1", "Meeting mit dem Kunden zum Budget", "Business", 100),
+    ("n2", "Einkaufsliste: Schraubenzieher für die Garage", "Privat", 200),
+    ("n3", "Budget Planung Q3, Budget freigeben", "Business", 300),
+    ("n4", "Rechnung an den Kunden schicken", "Business", 400),
+]
+
+
+def build_index(**kwargs):
+    index = SearchIndex(384, **kwargs)
+    for (note_id, text, category, ts), vec in zip(NOTES, hash_embeddings([n[1] for n in NOTES])):
+        index.upsert(note_id, text, category=category, updated_at=ts, vector=vec)
+    return index
+
+
+def test_bm25_ranks_keyword_matches():
+    index = build_index()
+    hits = index.search("budget", hash_embeddings(["budget"])[0])
+    keyword_hits = [h["id"] for h in hits if h["keyword"] > 0]
+    assert keyword_hits[:2] == ["n3", "n1"]
+    top = hits[0]
+    assert top["score"] == pytest.approx(0.6 * top["keyword"] + 0.4 * max(0.0, top["similarity"]), rel=1e-5)
+
+
+def test_filters_and_empty_query():
+    index = build_index()
+    assert [h["id"] for h in index.search("kunden", None, category="Business", date_to=300)] == ["n1"]
+    assert [h["id"] for h in index.search("", None, date_from=200)] == ["n4", "n3", "n2"]
+    assert index.search("budget", None, category="Unbekannt") == []
+
+
+def test_upsert_replaces_postings_and_remove_frees_slot():
+    index = build_index()
+    index.upsert("n1", "Garage aufräumen", category="Privat", updated_at=500)
+    assert "n1" not in [h["id"] for h in index.search("budget", None)]
+    assert "n1" in [h["id"] for h in index.search("garage", None)]
+    assert index.remove("n2") and not index.remove("n2")
+    assert len(index) == 3
+    index.upsert("n5", "Neue Notiz zur Garage", updated_at=600)
+    assert index.slots["n5"] == 1  # reused n2's slot
+    assert [h["id"] for h in index.search("garage", None)][0] in ("n1", "n5")
+
+
+def test_ivf_mode_finds_nearest_vectors():
+    rng = np.random.default_rng(1)
+    vecs = rng.standard_normal((3000, 384)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    index = SearchIndex(384, ivf_min_docs=1000, nprobe=8)
+    for i, v in enumerate(vecs):
+        index.upsert(f"n{i}", f"notiz {i}", vector=v)
+    query = vecs[42]
+    index.build_ivf()
+    hits = index.search("irgendwas", query, limit=5)
+    assert index.ivf is not None
+    assert hits[0]["id"] == "n42"
+    assert hits[0]["similarity"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_service_trains_ivf_in_background_and_reassigns_concurrent_writes():
+    rng = np.random.default_rng(2)
+    vecs = rng.standard_normal((1200, 384)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    service = SearchService(None, 384, ivf_min_docs=1000)
+
+    async def run():
+        notes = [{"note_id": f"n{i}", "text": f"notiz {i}", "vec": v.astype("<f4").tobytes()}
+                 for i, v in enumerate(vecs[:1100])]
+        await service.upsert("u", notes)
+        index = await service.index_for("u")
+        build = service._ivf_builds["u"]
+        # served brute force while the quantizer trains
+        hits, total = await service.search("u", "irgendwas", vecs[7], limit=1)
+        assert hits[0]["id"] == "n7" and total == 1100
+        # written after training started: must be assigned once the quantizer is installed
+        await service.upsert("u", [{"note_id": "late", "text": "spät", "vec": vecs[1150].astype("<f4").tobytes()}])
+        await build
+        assert index.ivf is not None and index._ivf_dirty is None
+        assert index.ivf.assign[index.slots["late"]] >= 0
+        hits, _ = await service.search("u", "irgendwas", vecs[1150], limit=1)
+        assert hits[0]["id"] == "late"
+
+    asyncio.run(run())
+
+
+class FakeNotes:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find(self, query, projection):
+        for doc in self.docs:
+            if doc["user"] == query["user"]:
+                yield {k: v for k, v in doc.items() if k != "_id"}
+
+
+def test_rebuild_from_mongo_runs_off_the_loop(monkeypatch):
+    docs = [{"_id": f"u:{nid}", "user": "u", "note_id": nid, "text": text, "category": cat, "updated_at": ts}
+            for nid, text, cat, ts in NOTES]
+    service = SearchService(FakeNotes(docs), 384)
+    threads = []
+    apply = service._apply
+    monkeypatch.setattr(service, "_apply", lambda index, note: (threads.append(threading.get_ident()),
+                                                                 apply(index, note)))
+
+    async def run():
+        indexes = await asyncio.gather(service.index_for("u"), service.index_for("u"))
+        assert indexes[0] is indexes[1] and len(indexes[0]) == len(NOTES)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == len(NOTES) and loop_thread not in threads
+
+
+@pytest.fixture
+def search_service(monkeypatch):
+    service = SearchService(None, 384)
+    monkeypatch.setattr(server, "search_service", service)
+    return service
+
+
+def bearer(account):
+    return {"Authorization": "Bearer " + issue_token(server.ACCOUNT_TOKEN_SECRET, account)}
+
+
+def test_search_endpoints_roundtrip(search_service):
+    headers = bearer("user-a")
+    notes = [{"id": n[0], "text": n[1], "category": n[2], "updated_at": n[3]} for n in NOTES]
+    notes[0]["vector"] = vector_to_base64(hash_embeddings([NOTES[0][1]])[0])
+    resp = client.put("/api/search/notes", json={"notes": notes}, headers=headers)
+    assert resp.json() == {"upserted": 4, "removed": 0, "embedded": 3}
+
+    body = client.post("/api/search", json={"query": "budget", "category": "Business"}, headers=headers).json()
+    assert body["total"] == 4
+    assert [h["id"] for h in body["results"] if h["keyword"] > 0] == ["n3", "n1"]
+
+    other = client.post("/api/search", json={"query": "budget"}, headers=bearer("user-b")).json()
+    assert other["results"] == [] and other["total"] == 0
+
+    assert client.delete("/api/search/notes/n3", headers=headers).json() == {"removed": 1}
+    body = client.post("/api/search", json={"query": "budget"}, headers=headers).json()
+    assert "n3" not in [h["id"] for h in body["results"]]
+
+
+def test_search_requires_user_and_valid_vectors(search_service):
+    assert client.post("/api/search", json={"query": "x"}).status_code == 401
+    bad = {"notes": [{"id": "n1", "text": "x", "vector": vector_to_base64(np.zeros(3, np.float32))}]}
+    assert client.put("/api/search/notes", json=bad, headers=bearer("u")).status_code == 400
+
+
+def test_account_tokens_bind_the_account(search_service):
+    created = client.post("/api/accounts")
+    assert created.status_code == 201
+    token = created.json()["token"]
+    mine = {"Authorization": f"Bearer {token}"}
+    assert client.post("/api/search", json={"query": "x"}, headers=mine).status_code == 200
+    # claiming another account id with someone else's signature does not work
+    forged = "user-a." + token.rpartition(".")[2]
+    resp = client.post("/api/search", json={"query": "x"}, headers={"Authorization": f"Bearer {forged}"})
+    assert resp.status_code == 401
+    assert client.post("/api/search", json={"query": "x"}, headers={"X-User-Id": "user-a"}).status_code == 401
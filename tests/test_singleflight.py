@@ -0,0 +1,142 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+from backend import server
+from scheduler import BACKGROUND, INTERACTIVE, Admission, FairScheduler, Overloaded
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_task():
+    async def run():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+        assert calls == [1]
+        assert [r for r, _ in results] == ["ok"] * 5
+        assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+        assert len(flights) == 0
+
+        # a finished flight is not reused
+        await flights.do("k", work)
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_exception_reaches_every_waiter():
+    async def run():
+        flights = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        results = await asyncio.gather(*(flights.do("k", boom) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(flights) == 0
+
+    asyncio.run(run())
+
+
+def test_followers_retry_a_leader_specific_failure():
+    async def run():
+        flights = SingleFlight()
+
+        async def shed():
+            await asyncio.sleep(0.01)
+            raise Overloaded(10.0)
+
+        async def ok():
+            return "mine"
+
+        leader, follower, plain = await asyncio.gather(
+            flights.do("k", shed, retry_on=(Overloaded,)),
+            flights.do("k", ok, retry_on=(Overloaded,)),
+            flights.do("k", ok),
+            return_exceptions=True)
+        assert isinstance(leader, Overloaded) and isinstance(plain, Overloaded)
+        assert follower == ("mine", False)
+
+    asyncio.run(run())
+
+
+def test_identical_annotations_coalesce(mock_upstream):
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Private"], "tags": ["doppelt"], "summary": "s", "confidence": 0.4
+        })}}]})
+
+    async def run():
+        mock_upstream(handler)
+        reqs = [server.AnnotationRequest(text=t) for t in ("Doppelt  getippt", "Doppelt getippt ", "Doppelt getippt")]
+        return await asyncio.gather(*(server.annotate_one(r) for r in reqs))
+
+    results = asyncio.run(run())
+    assert calls == [1]
+    assert [bool(r.metadata.get("coalesced")) for r in results].count(True) == 2
+    assert all(r.tags == ["doppelt"] for r in results)
+
+
+def test_cache_bypass_and_chunking_do_not_coalesce(mock_upstream):
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Private"], "tags": ["x"], "summary": "s", "confidence": 0.4
+        })}}]})
+
+    async def run():
+        mock_upstream(handler)
+        reqs = [server.AnnotationRequest(text="Gleicher Text", **options)
+                for options in ({}, {"use_cache": False}, {"chunked": True})]
+        return await asyncio.gather(*(server.annotate_one(r) for r in reqs))
+
+    results = asyncio.run(run())
+    assert len(calls) == 3
+    assert not any(r.metadata.get("coalesced") for r in results)
+
+
+def test_shed_leader_does_not_fail_admitted_followers(monkeypatch, mock_upstream):
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(1)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({
+            "categories": ["Private"], "tags": ["x"], "summary": "s", "confidence": 0.4
+        })}}]})
+
+    async def run():
+        mock_upstream(handler)
+        sched = FairScheduler(1, initial_service_time=10.0)
+        monkeypatch.setattr(server, 'upstream_scheduler', sched)
+        await sched.acquire(Admission("someone-else"))
+        req = server.AnnotationRequest(text="Geteilter Text")
+        # the interactive leader cannot wait 10s and is shed; the background follower can
+        leader = asyncio.ensure_future(
+            server.annotate_one(req, Admission("a", INTERACTIVE, time.monotonic() + 2)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(
+            server.annotate_one(req, Admission("b", BACKGROUND, time.monotonic() + 60)))
+        await asyncio.sleep(0.05)
+        sched.release(None)
+        return await leader, await follower
+
+    leader, follower = asyncio.run(run())
+    assert leader.metadata["note"] == "fallback-no-external-llm"
+    assert follower.tags == ["x"] and not follower.metadata.get("coalesced")
+    assert calls == [1]
@@ -0,0 +1,158 @@
+import asyncio
+import copy
+import hashlib
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from accounts import issue_token
+from backend import server
+from snapshots import FilesystemChunkStore, UploadError, UploadStaging, chunk_key, parse_range, slice_chunks
+
+client = TestClient(server.app)
+HEADERS = {"Authorization": "Bearer " + issue_token(server.ACCOUNT_TOKEN_SECRET, "acc")}
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_parse_range():
+    assert parse_range(None, 10) is None
+    assert parse_range("bytes=0-3", 10) == (0, 3)
+    assert parse_range("bytes=4-", 10) == (4, 9)
+    assert parse_range("bytes=-3", 10) == (7, 9)
+    assert parse_range("bytes=8-100", 10) == (8, 9)
+    for bad in ("bytes=10-", "bytes=5-2", "bytes=-", "items=0-1", "bytes=0-1,3-4"):
+        with pytest.raises(ValueError):
+            parse_range(bad, 10)
+
+
+def test_slice_chunks():
+    sizes = [4, 4, 4]
+    assert list(slice_chunks(sizes, 0, 11)) == [(0, 0, 3), (1, 0, 3), (2, 0, 3)]
+    assert list(slice_chunks(sizes, 3, 8)) == [(0, 3, 3), (1, 0, 3), (2, 0, 0)]
+    assert list(slice_chunks(sizes, 5, 6)) == [(1, 1, 2)]
+
+
+async def _blocks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_staging_resumes_and_verifies(tmp_path):
+    staging = UploadStaging(tmp_path, max_chunk_bytes=1024)
+    data = os.urandom(600)
+    key = chunk_key("acc", digest(data))
+
+    async def run():
+        assert await staging.append(key, 0, 600, _blocks(data[:100], data[100:250])) == (250, None)
+        with pytest.raises(UploadError) as e:
+            await staging.append(key, 100, 600, _blocks(data[100:]))
+        assert e.value.status_code == 409
+        written, path = await staging.append(key, staging.offset(key), 600, _blocks(data[250:]))
+        assert written == 600 and path.read_bytes() == data
+
+        other = chunk_key("acc", digest(b"expected"))
+        with pytest.raises(UploadError) as e:
+            await staging.append(other, 0, 3, _blocks(b"bad"))
+        assert e.value.status_code == 422 and staging.offset(other) == 0
+        with pytest.raises(UploadError) as e:
+            await staging.append(other, 0, 2048, _blocks(b""))
+        assert e.value.status_code == 413
+
+    asyncio.run(run())
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeSnapshots:
+    def __init__(self):
+        self.docs = {}
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = {"_id": query["_id"], **copy.deepcopy(doc)}
+
+    async def find_one(self, query):
+        return copy.deepcopy(self.docs.get(query["_id"]))
+
+    def find(self, query, projection):
+        docs = [d for d in self.docs.values() if d["account"] == query["account"]]
+        return FakeCursor([{k: d[k] for k, v in projection.items() if v and k in d} for d in docs])
+
+
+@pytest.fixture
+def snapshot_env(tmp_path):
+    fake_db = SimpleNamespace(snapshots=FakeSnapshots())
+    with patch.object(server, "snapshot_chunks", FilesystemChunkStore(tmp_path / "chunks")), \
+            patch.object(server, "snapshot_staging", UploadStaging(tmp_path / "partial", 1 << 20)), \
+            patch.object(server, "db", fake_db):
+        yield fake_db
+
+
+def upload(data, offset=0, body=None):
+    headers = {**HEADERS, "Upload-Offset": str(offset), "Upload-Length": str(len(data))}
+    return client.patch(f"/api/snapshots/chunks/{digest(data)}", content=body if body is not None else data[offset:],
+                        headers=headers)
+
+
+def test_chunk_upload_dedupe_and_range(snapshot_env):
+    a, b = os.urandom(3000), os.urandom(1000)
+    missing = client.post("/api/snapshots/chunks/missing", json={"hashes": [digest(a), digest(b)]}, headers=HEADERS)
+    assert missing.json() == {"missing": [digest(a), digest(b)]}
+
+    # interrupted upload, resumed from the offset HEAD reports
+    assert upload(a, body=a[:1200]).headers["upload-offset"] == "1200"
+    head = client.head(f"/api/snapshots/chunks/{digest(a)}", headers=HEADERS)
+    assert head.status_code == 404 and head.headers["upload-offset"] == "1200"
+    assert upload(a, offset=1200).status_code == 201
+    assert upload(b).status_code == 201
+    # already stored: acknowledged without reading the body
+    assert upload(b).status_code == 200
+
+    missing = client.post("/api/snapshots/chunks/missing", json={"hashes": [digest(a), digest(b)]}, headers=HEADERS)
+    assert missing.json() == {"missing": []}
+    other = client.post("/api/snapshots/chunks/missing", json={"hashes": [digest(a)]}, headers={"Authorization": "Bearer " + issue_token(server.ACCOUNT_TOKEN_SECRET, "other")})
+    assert other.json() == {"missing": [digest(a)]}
+
+    part = client.get(f"/api/snapshots/chunks/{digest(a)}", headers={**HEADERS, "Range": "bytes=100-199"})
+    assert part.status_code == 206 and part.content == a[100:200]
+    assert part.headers["content-range"] == "bytes 100-199/3000"
+    bad = client.get(f"/api/snapshots/chunks/{digest(a)}", headers={**HEADERS, "Range": "bytes=5000-"})
+    assert bad.status_code == 416
+
+
+def test_snapshot_manifest_and_parallel_restore(snapshot_env):
+    a, b = os.urandom(3000), os.urandom(1000)
+    manifest = {"chunks": [{"hash": digest(a), "size": 3000}, {"hash": digest(b), "size": 1000}], "label": "daily"}
+    resp = client.put("/api/snapshots/snap-1", json=manifest, headers=HEADERS)
+    assert resp.status_code == 409 and sorted(resp.json()["detail"]["chunks"]) == sorted([digest(a), digest(b)])
+
+    upload(a), upload(b)
+    resp = client.put("/api/snapshots/snap-1", json=manifest, headers=HEADERS)
+    assert resp.status_code == 200 and resp.json()["size"] == 4000
+    listed = client.get("/api/snapshots", headers=HEADERS).json()
+    assert [(s["id"], s["chunk_count"], s["label"]) for s in listed] == [("snap-1", 2, "daily")]
+
+    whole = client.get("/api/snapshots/snap-1/content", headers=HEADERS)
+    assert whole.status_code == 200 and whole.content == a + b
+    pieces = [
+        client.get("/api/snapshots/snap-1/content", headers={**HEADERS, "Range": f"bytes={lo}-{lo + 1499}"}).content
+        for lo in range(0, 4000, 1500)
+    ]
+    assert b"".join(pieces) == a + b
+    assert client.get("/api/snapshots/snap-2", headers=HEADERS).status_code == 404
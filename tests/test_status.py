@@ -0,0 +1,197 @@
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import BulkWriteError
+
+from backend import server
+
+client = TestClient(server.app)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self._limit = 0
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def _result(self):
+        return self.docs[:self._limit] if self._limit else self.docs
+
+    async def to_list(self, length):
+        return self._result()[:length]
+
+    def __aiter__(self):
+        async def gen():
+            for doc in self._result():
+                yield doc
+        return gen()
+
+
+class FakeStatusCollection:
+    """Just enough of a Motor collection for the status_checks queries."""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(d) for d in docs]
+
+    @staticmethod
+    def _match(doc, query):
+        for key, cond in query.items():
+            if key == "$or":
+                if not any(FakeStatusCollection._match(doc, q) for q in cond):
+                    return False
+            elif key == "$and":
+                if not all(FakeStatusCollection._match(doc, q) for q in cond):
+                    return False
+            elif isinstance(cond, dict):
+                value = doc.get(key)
+                if "$gte" in cond and not value >= cond["$gte"]:
+                    return False
+                if "$lt" in cond and not value < cond["$lt"]:
+                    return False
+            elif doc.get(key) != cond:
+                return False
+        return True
+
+    async def insert_many(self, docs, ordered=True):
+        ids = {d.get("_id") for d in self.docs}
+        inserted, errors = [], []
+        for i, doc in enumerate(docs):
+            if doc["_id"] in ids:
+                errors.append({"index": i, "code": 11000, "errmsg": "E11000 duplicate key"})
+                continue
+            ids.add(doc["_id"])
+            self.docs.append(dict(doc))
+            inserted.append(doc["_id"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    def find(self, query=None, projection=None):
+        docs = [d for d in self.docs if self._match(d, query or {})]
+        if projection:
+            keep = [k for k, v in projection.items() if v]
+            docs = [{k: d[k] for k in keep if k in d} for d in docs]
+        return FakeCursor(docs)
+
+
+BASE = datetime(2024, 1, 1)
+
+
+def make_docs(n, client_name="app"):
+    # two documents per timestamp so the id tie-breaker matters
+    return [
+        {"_id": i, "id": f"id-{i:03d}", "client_name": client_name, "timestamp": BASE + timedelta(minutes=i // 2)}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def status_db():
+    fake = FakeStatusCollection(make_docs(25) + make_docs(5, client_name="other"))
+    with patch.object(server, "db", SimpleNamespace(status_checks=fake)):
+        yield fake
+
+
+def test_status_default_returns_plain_list_newest_first(status_db):
+    resp = client.get("/api/status")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert isinstance(body, list) and len(body) == 30
+    stamps = [item["timestamp"] for item in body]
+    assert stamps == sorted(stamps, reverse=True)
+    assert "_id" not in body[0]
+    assert "x-next-cursor" not in resp.headers
+
+
+def test_status_cursor_pagination_visits_every_document_once(status_db):
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 7, "client_name": "app"}
+        if cursor:
+            params["cursor"] = cursor
+        resp = client.get("/api/status", params=params)
+        assert resp.status_code == 200
+        seen.extend(item["id"] for item in resp.json())
+        cursor = resp.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert len(seen) == 25
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_status_time_range_filter(status_db):
+    resp = client.get("/api/status", params={
+        "client_name": "app",
+        "since": (BASE + timedelta(minutes=2)).isoformat(),
+        "until": (BASE + timedelta(minutes=4)).isoformat(),
+    })
+    assert sorted(item["id"] for item in resp.json()) == ["id-004", "id-005", "id-006", "id-007"]
+
+
+def test_status_invalid_cursor_is_rejected(status_db):
+    resp = client.get("/api/status", params={"cursor": "not-a-cursor"})
+    assert resp.status_code == 400
+
+
+def test_status_ndjson_streams_projected_documents(status_db):
+    resp = client.get("/api/status", params={"format": "ndjson", "client_name": "other"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert len(lines) == 5
+    assert set(lines[0]) == {"id", "client_name", "timestamp"}
+    assert all(line["client_name"] == "other" for line in lines)
+
+
+@pytest.fixture
+def ingest_db():
+    status, audit = FakeStatusCollection(), FakeStatusCollection()
+    with patch.object(server.status_writer, "collection", status), \
+            patch.object(server.audit_writer, "collection", audit):
+        yield status, audit
+
+
+def test_status_bulk_ingest_is_idempotent(ingest_db):
+    status, _ = ingest_db
+    events = [{"id": f"ev-{i}", "client_name": "phone", "timestamp": BASE.isoformat()} for i in range(3)]
+    first = client.post("/api/status/bulk", json={"events": events}).json()
+    assert first == {"received": 3, "inserted": 3, "duplicates": 0, "errors": []}
+    replay = client.post("/api/status/bulk", json={"events": events + [{"id": "ev-3", "client_name": "phone"}]}).json()
+    assert replay["inserted"] == 1 and replay["duplicates"] == 3
+    assert sorted(d["_id"] for d in status.docs) == ["ev-0", "ev-1", "ev-2", "ev-3"]
+
+
+def test_status_bulk_validates_events(ingest_db):
+    assert client.post("/api/status/bulk", json={"events": []}).status_code == 422
+    assert client.post("/api/status/bulk", json={"events": [{"id": "x"}]}).status_code == 422
+
+
+def test_audit_bulk_ingest(ingest_db):
+    _, audit = ingest_db
+    events = [{"id": "a1", "at": 1700000000000, "action": "note.create", "meta": {"id": "n1"}}]
+    resp = client.post("/api/audit/bulk", json={"events": events})
+    assert resp.json()["inserted"] == 1
+    assert audit.docs[0]["action"] == "note.create" and "received_at" in audit.docs[0]
+
+
+def test_single_status_write_goes_through_batcher(ingest_db):
+    status, _ = ingest_db
+    resp = client.post("/api/status", json={"client_name": "tablet"})
+    assert resp.status_code == 200
+    assert status.docs[0]["_id"] == resp.json()["id"]
@@ -0,0 +1,86 @@
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import server
+from streaming import IncrementalAnnotationParser
+
+ANNOTATION = json.dumps({
+    "categories": ["Business"],
+    "tags": ["Budget", "q3"],
+    "summary": "Budget \"Q3\" steht.\\nNächster Schritt: Review",
+    "confidence": 0.8,
+})
+
+
+def pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(ANNOTATION)])
+def test_parser_emits_fields_as_they_complete(size):
+    parser = IncrementalAnnotationParser()
+    events = []
+    for piece in pieces(ANNOTATION, size):
+        events.extend(parser.feed(piece))
+    assert [v for k, v in events if k == "categories"] == [["Business"]]
+    assert [v for k, v in events if k == "tags"] == [["Budget", "q3"]]
+    assert "".join(v for k, v in events if k == "summary") == json.loads(ANNOTATION)["summary"]
+    # lists arrive before the summary starts
+    assert [k for k, _ in events].index("tags") < [k for k, _ in events].index("summary")
+
+
+def sse_stream(deltas, tail=True):
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': d}}]})}\n\n" for d in deltas]
+    if tail:
+        lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode()
+
+
+def read_events(resp):
+    events = []
+    for block in resp.text.strip().split("\n\n"):
+        head, data = block.split("\n", 1)
+        events.append((head[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+@pytest.fixture
+def client():
+    return TestClient(server.app)
+
+
+def test_stream_endpoint_sends_fields_then_result(client, mock_upstream):
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, content=sse_stream(pieces(ANNOTATION, 5)),
+                              headers={"content-type": "text/event-stream"})
+
+    mock_upstream(handler)
+    resp = client.post('/api/ai/annotate/stream', json={"text": "Budget Q3"})
+    assert resp.headers['content-type'].startswith('text/event-stream')
+    events = read_events(resp)
+    names = [name for name, _ in events]
+    assert names[:2] == ["categories", "tags"]
+    assert names[-1] == "result"
+    result = events[-1][1]
+    assert result["tags"] == ["budget", "q3"]
+    assert result["metadata"]["stream"] == "live"
+    assert "".join(d["delta"] for n, d in events if n == "summary") == result["summary"]
+
+    # second call is served from the cache
+    cached = read_events(client.post('/api/ai/annotate/stream', json={"text": "Budget Q3"}))
+    assert cached[-1][1]["metadata"]["cache"] == "hit"
+
+
+def test_stream_degrades_to_fallback_mid_stream(client, mock_upstream):
+    mock_upstream(lambda request: httpx.Response(
+        200, content=sse_stream(pieces(ANNOTATION[:40], 5), tail=False)))
+    events = read_events(client.post('/api/ai/annotate/stream', json={"text": "Budget Planung Q3"}))
+    assert events[0] == ("categories", ["Business"])
+    result = events[-1][1]
+    assert result["metadata"]["note"] == "fallback-no-external-llm"
+    assert result["metadata"]["stream"] == "fallback"
+    assert len(server.annotation_cache.memory) == 0
@@ -0,0 +1,283 @@
+import asyncio
+import copy
+import gzip
+import json
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import BulkWriteError
+
+from accounts import issue_token
+from backend import server
+from sync import SyncStore
+
+client = TestClient(server.app)
+AUTH = {"Authorization": "Bearer " + issue_token(server.ACCOUNT_TOKEN_SECRET, "acc")}
+
+
+def _eval(expr, doc):
+    # the handful of aggregation operators SyncStore's pipeline update uses
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:])
+    if isinstance(expr, dict) and len(expr) == 1:
+        (op, args), = expr.items()
+        if op == "$ifNull":
+            value = _eval(args[0], doc)
+            return _eval(args[1], doc) if value is None else value
+        if op == "$add":
+            return sum(_eval(a, doc) for a in args)
+        if op == "$concatArrays":
+            return [x for a in args for x in _eval(a, doc)]
+    if isinstance(expr, dict):
+        return {k: _eval(v, doc) for k, v in expr.items()}
+    if isinstance(expr, list):
+        return [_eval(v, doc) for v in expr]
+    return expr
+
+
+def _match(doc, query):
+    for key, cond in query.items():
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            if "$lt" in cond and not (value is not None and value < cond["$lt"]):
+                return False
+            if "$gt" in cond and not (value is not None and value > cond["$gt"]):
+                return False
+            if "$lte" in cond and not (value is not None and value <= cond["$lte"]):
+                return False
+            if "$ne" in cond and value == cond["$ne"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def create_index(self, *args, **kwargs):
+        return None
+
+    async def find_one(self, query):
+        return copy.deepcopy(self.docs.get(query["_id"]))
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        doc = self.docs.get(query["_id"]) or {"_id": query["_id"]}
+        for stage in update:
+            doc = {**doc, **_eval(stage["$set"], doc)}
+        self.docs[query["_id"]] = doc
+        return copy.deepcopy(doc)
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            doc = self.docs[query["_id"]] = {"_id": query["_id"]}
+        for field, cond in update.get("$pull", {}).items():
+            doc[field] = [e for e in doc.get(field, []) if not _match(e, cond)]
+        doc.update(update.get("$set", {}))
+        for field, value in update.get("$max", {}).items():
+            doc[field] = max(doc.get(field, value), value)
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+
+    async def bulk_write(self, ops, ordered=True):
+        errors = []
+        for i, op in enumerate(ops):
+            query, update = op._filter, op._doc
+            existing = self.docs.get(query["_id"])
+            if existing is None:
+                self.docs[query["_id"]] = {"_id": query["_id"], **update["$set"]}
+            elif _match(existing, query):
+                existing.update(update["$set"])
+            else:
+                errors.append({"index": i, "code": 11000, "errmsg": "E11000 duplicate key"})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def find(self, query, projection=None):
+        docs = [copy.deepcopy(d) for d in self.docs.values() if _match(d, query)]
+        if projection:
+            hidden = {k for k, v in projection.items() if not v}
+            shown = [k for k, v in projection.items() if v]
+            docs = [{k: d[k] for k in shown if k in d} if shown else {k: v for k, v in d.items() if k not in hidden}
+                    for d in docs]
+        return FakeCursor(docs)
+
+
+def make_store():
+    return SyncStore(FakeCollection(), FakeCollection(), FakeCollection())
+
+
+def note(id, updated_at, payload="Y2lwaGVy", deleted_at=None):
+    return {"id": id, "kind": "note", "updated_at": updated_at, "deleted_at": deleted_at, "payload": payload}
+
+
+def test_pull_returns_only_changes_since_cursor():
+    store = make_store()
+
+    async def run():
+        await store.push("acc", "phone", [note("a", 1), note("b", 1)])
+        changes, cursor, more = await store.pull("acc", "tablet", 0, 10)
+        assert [c["record_id"] for c in changes] == ["a", "b"] and not more
+        await store.push("acc", "phone", [note("a", 2, deleted_at=3, payload=None)])
+        changes, cursor2, _ = await store.pull("acc", "tablet", cursor, 10)
+        assert [(c["record_id"], c["deleted_at"]) for c in changes] == [("a", 3)]
+        assert cursor2 > cursor
+        assert (await store.pull("acc", "tablet", cursor2, 10))[0] == []
+
+    asyncio.run(run())
+
+
+def test_own_changes_are_skipped_but_cursor_advances():
+    store = make_store()
+
+    async def run():
+        await store.push("acc", "phone", [note("a", 1)])
+        changes, cursor, _ = await store.pull("acc", "phone", 0, 10)
+        assert changes == [] and cursor == 1
+
+    asyncio.run(run())
+
+
+def test_last_writer_wins_and_stale_is_reported():
+    store = make_store()
+
+    async def run():
+        await store.push("acc", "phone", [note("a", 5, payload="bmV3")])
+        accepted, stale, _ = await store.push("acc", "tablet", [note("a", 4, payload="b2xk"), note("b", 1)])
+        assert accepted == 1 and stale == ["a"]
+        changes, _, _ = await store.pull("acc", "laptop", 0, 10)
+        assert {c["record_id"]: c["payload"] for c in changes} == {"a": "bmV3", "b": "Y2lwaGVy"}
+
+    asyncio.run(run())
+
+
+def test_pagination_and_inflight_watermark():
+    store = make_store()
+
+    async def run():
+        await store.push("acc", "phone", [note(str(i), 1) for i in range(5)])
+        first, cursor, more = await store.pull("acc", "tablet", 0, 2)
+        assert len(first) == 2 and more and cursor == 2
+        # a push that reserved seqs 6.. but has not written yet holds pulls back at 5
+        await store._reserve("acc", 3, "slow-push")
+        assert await store.watermark("acc") == 5
+        rest, cursor, more = await store.pull("acc", "tablet", cursor, 10)
+        assert [c["record_id"] for c in rest] == ["2", "3", "4"] and cursor == 5 and not more
+        await store._release("acc", "slow-push")
+        assert await store.watermark("acc") == 8
+
+    asyncio.run(run())
+
+
+def test_pull_pages_by_payload_bytes():
+    store = make_store()
+
+    async def run():
+        await store.push("acc", "phone", [note(str(i), 1, payload="A" * 100) for i in range(5)])
+        page, cursor, more = await store.pull("acc", "tablet", 0, 10, max_bytes=250)
+        assert len(page) == 2 and more and cursor == 2
+        # a single record larger than the budget still makes progress
+        page, cursor, more = await store.pull("acc", "tablet", cursor, 10, max_bytes=50)
+        assert len(page) == 1 and more and cursor == 3
+
+    asyncio.run(run())
+
+
+def test_accounts_are_isolated():
+    store = make_store()
+
+    async def run():
+        await store.push("acc-1", "phone", [note("a", 1)])
+        assert (await store.pull("acc-2", "tablet", 0, 10))[0] == []
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def sync_store():
+    store = make_store()
+    with patch.object(server, "sync_store", store):
+        yield store
+
+
+def test_sync_endpoints_gzip_roundtrip(sync_store):
+    headers = AUTH
+    push = {"device_id": "phone", "changes": [note(f"n{i}", 1000 + i, payload="A" * 200) for i in range(20)]}
+    resp = client.post(
+        "/api/sync/push",
+        content=gzip.compress(json.dumps(push).encode()),
+        headers={**headers, "Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {"accepted": 20, "stale": [], "watermark": 20}
+
+    resp = client.get("/api/sync/pull", params={"device_id": "tablet", "limit": 15},
+                      headers={**headers, "Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    body = resp.json()
+    assert len(body["changes"]) == 15 and body["has_more"] and body["cursor"] == 15
+    assert body["changes"][0]["id"] == "n0" and body["changes"][0]["payload"] == "A" * 200
+
+    devices = client.get("/api/sync/devices", headers=headers).json()["devices"]
+    assert {d["device"]: d.get("cursor") for d in devices} == {"phone": None, "tablet": 15}
+
+
+def test_push_between_pull_and_push_is_not_skipped(sync_store):
+    pull = client.get("/api/sync/pull", params={"device_id": "a"}, headers=AUTH).json()
+    assert client.post("/api/sync/push", json={"device_id": "b", "changes": [note("from-b", 1)]},
+                       headers=AUTH).status_code == 200
+    pushed = client.post("/api/sync/push", json={"device_id": "a", "changes": [note("from-a", 2)]},
+                         headers=AUTH).json()
+    assert "cursor" not in pushed and pushed["watermark"] == 2
+    # A keeps pulling from its own cursor, not from the push watermark
+    body = client.get("/api/sync/pull", params={"device_id": "a", "cursor": pull["cursor"]}, headers=AUTH).json()
+    assert [c["id"] for c in body["changes"]] == ["from-b"] and body["cursor"] == 2
+
+
+def test_sync_validation(sync_store):
+    headers = AUTH
+    assert client.post("/api/sync/push", json={"device_id": "p", "changes": []}, headers=headers).status_code == 422
+    assert client.post("/api/sync/push", content=b"\x1f\x8bnot gzip",
+                       headers={**headers, "Content-Encoding": "gzip"}).status_code == 400
+    assert client.post("/api/sync/push", content=gzip.compress(b"{}")[:-6],
+                       headers={**headers, "Content-Encoding": "gzip"}).status_code == 400
+
+
+def test_sync_push_bounds_body_and_inflated_size(sync_store, monkeypatch):
+    headers = {**AUTH, "Content-Encoding": "gzip", "Content-Type": "application/json"}
+    monkeypatch.setattr(server, "SYNC_MAX_DECOMPRESSED_BYTES", 1024 * 1024)
+    bomb = gzip.compress(b" " * (16 * 1024 * 1024))
+    assert len(bomb) < 64 * 1024
+    resp = client.post("/api/sync/push", content=bomb, headers=headers)
+    assert resp.status_code == 413
+    assert sync_store.records.docs == {}
+    monkeypatch.setattr(server, "SYNC_MAX_BODY_BYTES", 1000)
+    assert client.post("/api/sync/push", content=b" " * 2000, headers=headers).status_code == 413
+    assert client.get("/api/sync/pull", params={"device_id": "p"}).status_code == 401
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from backend import server
+from warmup import Warmup
+
+client = TestClient(server.app)
+
+
+def test_steps_run_concurrently_and_failures_are_reported():
+    observed = {}
+
+    async def slow():
+        await asyncio.sleep(0.1)
+
+    async def broken():
+        raise RuntimeError("no route to host")
+
+    async def hanging():
+        await asyncio.sleep(10)
+
+    warmup = Warmup(0.3, observe=lambda name, seconds: observed.setdefault(name, seconds))
+
+    async def main():
+        t0 = time.monotonic()
+        await warmup.start({"a": slow, "b": slow, "broken": broken, "hanging": hanging})
+        return time.monotonic() - t0
+
+    assert not warmup.done
+    elapsed = asyncio.run(main())
+    assert elapsed < 0.5 and warmup.done
+    steps = warmup.snapshot()["steps"]
+    assert steps["a"]["status"] == steps["b"]["status"] == "ok"
+    assert steps["broken"] == {"status": "failed", "error": "no route to host", "seconds": 0.0}
+    assert steps["hanging"]["status"] == "timeout"
+    assert set(observed) == {"a", "b", "broken", "hanging", "warmup"}
+
+
+def test_optional_steps_do_not_hold_back_readiness():
+    async def quick():
+        pass
+
+    async def hanging():
+        await asyncio.sleep(10)
+
+    warmup = Warmup(5.0)
+
+    async def main():
+        warmup.start({"mongo": quick, "upstream": hanging}, optional={"upstream"})
+        await asyncio.sleep(0.05)
+        assert warmup.ready and not warmup.done
+        assert warmup.snapshot()["steps"]["upstream"] == {"status": "pending"}
+        await warmup.aclose()
+
+    assert not warmup.ready
+    asyncio.run(main())
+
+
+def test_healthz_and_readyz_before_warmup():
+    async def unreachable():
+        raise RuntimeError("MONGO_URL and DB_NAME must be set")
+
+    assert client.get('/healthz').json() == {"status": "ok"}
+    with patch.object(server, 'warmup', Warmup()), patch.object(server, 'ping_mongo', unreachable):
+        r = client.get('/readyz')
+    assert r.status_code == 503
+    assert r.json()["ready"] is False and r.json()["mongo"] == "MONGO_URL and DB_NAME must be set"
+
+
+def test_lifespan_warms_in_background_then_reports_ready():
+    pings = []
+
+    async def ping():
+        pings.append(1)
+
+    async def light_shutdown():
+        await server.warmup.aclose()
+        server.app.state.index_task.cancel()
+
+    with patch.object(server, 'warmup', Warmup(observe=server.warmup.observe)), \
+            patch.object(server, 'ping_mongo', ping), \
+            patch.object(server, 'shutdown', light_shutdown), \
+            patch.object(server, 'AI_JOBS_ENABLED', False):
+        with TestClient(server.app) as c:
+            for _ in range(100):
+                r = c.get('/readyz')
+                if r.status_code == 200:
+                    break
+                time.sleep(0.01)
+            assert r.status_code == 200 and r.json()["mongo"] == "ok"
+            assert set(r.json()["warmup"]["steps"]) == {"mongo", "models", "embedder"}
+    assert len(pings) >= server.MONGO_MIN_POOL_SIZE
+    assert server.startup_seconds.value(phase="lifespan") < 0.5
+    assert 'app_startup_seconds{phase="warmup"}' in server.metrics_registry.render()
+
+
+def test_readyz_does_not_wait_for_the_upstream():
+    async def ping():
+        pass
+
+    async def upstream_down():
+        await asyncio.sleep(10)
+
+    async def light_shutdown():
+        await server.warmup.aclose()
+        server.app.state.index_task.cancel()
+
+    with patch.object(server, 'warmup', Warmup(observe=server.warmup.observe)), \
+            patch.object(server, 'ping_mongo', ping), \
+            patch.object(server, 'shutdown', light_shutdown), \
+            patch.object(server, 'AI_JOBS_ENABLED', False), \
+            patch.object(server, 'EMERGENT_LLM_KEY', "key"), \
+            patch.object(server.upstream, 'warm', upstream_down):
+        with TestClient(server.app) as c:
+            for _ in range(100):
+                r = c.get('/readyz')
+                if r.status_code == 200:
+                    break
+                time.sleep(0.01)
+            assert r.status_code == 200
+            assert r.json()["warmup"]["steps"]["upstream"] == {"status": "pending"}
@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError
+
+from writebatch import WriteBatcher
+
+
+class FakeCollection:
+    def __init__(self, fail_ids=()):
+        self.calls = []
+        self.ids = set()
+        self.fail_ids = set(fail_ids)
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls.append([d["_id"] for d in docs])
+        errors = []
+        for i, doc in enumerate(docs):
+            if doc["_id"] in self.ids:
+                errors.append({"index": i, "code": 11000, "errmsg": "E11000 duplicate key"})
+            elif doc["_id"] in self.fail_ids:
+                errors.append({"index": i, "code": 121, "errmsg": "Document failed validation"})
+            else:
+                self.ids.add(doc["_id"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in docs])
+
+
+def test_concurrent_inserts_share_one_round_trip():
+    coll = FakeCollection()
+    batcher = WriteBatcher(coll, max_batch=100, flush_interval=0.01)
+
+    async def run():
+        return await asyncio.gather(*(batcher.insert({"_id": i}) for i in range(50)))
+
+    assert asyncio.run(run()) == [True] * 50
+    assert len(coll.calls) == 1 and len(coll.calls[0]) == 50
+
+
+def test_full_batch_flushes_without_waiting():
+    coll = FakeCollection()
+    batcher = WriteBatcher(coll, max_batch=10, flush_interval=60)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(*(batcher.insert({"_id": i}) for i in range(20))), 1)
+
+    asyncio.run(run())
+    assert [len(c) for c in coll.calls] == [10, 10]
+
+
+def test_duplicates_succeed_and_other_errors_propagate():
+    coll = FakeCollection(fail_ids={"bad"})
+    coll.ids.add("seen")
+    batcher = WriteBatcher(coll, flush_interval=0.001)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.insert({"_id": "new"}),
+            batcher.insert({"_id": "seen"}),
+            batcher.insert({"_id": "bad"}),
+            return_exceptions=True,
+        )
+
+    new, seen, bad = asyncio.run(run())
+    assert new is True and seen is False
+    assert isinstance(bad, RuntimeError)
+
+
+def test_insert_many_reports_counts():
+    coll = FakeCollection()
+    coll.ids.add(1)
+    result = asyncio.run(WriteBatcher(coll).insert_many([{"_id": 1}, {"_id": 2}, {"_id": 3}]))
+    assert (result.inserted, result.duplicates, result.errors) == (2, [0], {})